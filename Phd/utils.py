@@ -1,3 +1,15 @@
+import hashlib
+import importlib.machinery
+import json
+import multiprocessing as mp
+import os
+import struct
+import sys
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from pathlib import Path
+
 import numpy as np
 import pandas as pd
 import librosa
@@ -10,52 +22,255 @@ SR = 44100
 FRAME_LENGTH = 1024
 HOP_LENGTH = 512
 EPS = 1e-10
+CHROMA_THRESH = 0.5   # active pitch classes: chroma >= CHROMA_THRESH * frame max
+
+# MIDI → note table
+
+NOTE_DTYPE = np.dtype([
+    ("instrument", np.int16),   # index in PrettyMIDI(midi_path).instruments
+    ("is_drum", np.bool_),
+    ("pitch", np.int16),
+    ("start", np.float64),
+    ("end", np.float64),
+    ("velocity", np.int16),
+])
 
-# MIDI → full-pitch chord sequence (paper method)
+_NOTE_ON, _NOTE_OFF, _PROGRAM, _TEMPO = 0, 1, 2, 3
+# data bytes of the system common messages (0xF1..0xFE)
+_SYSTEM_DATA_BYTES = {0xF1: 1, 0xF2: 2, 0xF3: 1}
 
-def midi_chord_sequence_fullpitch(midi_path):
+
+def _read_track_events(data, i, end):
     """
-    From MIDI -> sequence of chords in *full MIDI pitch* space (0..127).
-    - Each chord = all pitches starting at the same time (exact start times).
-    - Chords are ordered by time.
-    - Consecutive duplicate chords are merged.
-    This matches the construction in Di Marco et al.
+    Events of one MTrk chunk needed for the notes, as (tick, kind, channel, a, b):
+    note on/off (a = pitch, b = velocity), program change (a = program), tempo (a = us/beat).
     """
+    events = []
+    tick = 0
+    last_status = None
+    while i < end:
+        delta = 0
+        while True:
+            byte = data[i]
+            i += 1
+            delta = (delta << 7) | (byte & 0x7F)
+            if byte < 0x80:
+                break
+        tick += delta
+
+        status = data[i]
+        if status < 0x80:           # running status: this byte is already data
+            if last_status is None:
+                raise ValueError("running status without last status")
+            status = last_status
+        else:
+            i += 1
+            if status != 0xFF:      # meta messages don't set running status
+                last_status = status
+
+        if status == 0xFF or status in (0xF0, 0xF7):
+            if status == 0xFF:
+                meta_type = data[i]
+                i += 1
+            length = 0
+            while True:
+                byte = data[i]
+                i += 1
+                length = (length << 7) | (byte & 0x7F)
+                if byte < 0x80:
+                    break
+            if status == 0xFF and meta_type == 0x51 and length == 3:
+                events.append((tick, _TEMPO, 0, int.from_bytes(data[i:i + 3], "big"), 0))
+            i += length
+            continue
+
+        kind = status & 0xF0
+        channel = status & 0x0F
+        if kind in (0xC0, 0xD0):
+            if kind == 0xC0:
+                events.append((tick, _PROGRAM, channel, data[i], 0))
+            i += 1
+        elif kind < 0xF0:
+            a, b = data[i], data[i + 1]
+            i += 2
+            if kind == 0x90:
+                events.append((tick, _NOTE_ON if b > 0 else _NOTE_OFF, channel, a, b))
+            elif kind == 0x80:
+                events.append((tick, _NOTE_OFF, channel, a, b))
+        else:
+            i += _SYSTEM_DATA_BYTES.get(status, 0)
+    return events
+
+
+def _tick_to_time(ticks, tempo_events, resolution):
+    """Seconds for each tick, with the tempo map of pretty_midi (track 0 only)."""
+    tick_scales = [(0, 60.0 / (120.0 * resolution))]
+    for tick, _, _, tempo, _ in tempo_events:
+        scale = 60.0 / ((6e7 / tempo) * resolution)
+        if tick == 0:
+            tick_scales = [(0, scale)]
+        elif scale != tick_scales[-1][1]:
+            tick_scales.append((tick, scale))
+
+    starts = np.array([t for t, _ in tick_scales])
+    scales = np.array([sc for _, sc in tick_scales])
+    t0 = np.zeros(len(tick_scales))
+    for k in range(1, len(tick_scales)):
+        t0[k] = t0[k - 1] + scales[k - 1] * (starts[k] - starts[k - 1])
+    seg = np.searchsorted(starts, ticks, side="right") - 1
+    return t0[seg] + scales[seg] * (ticks - starts[seg])
+
+
+def _parse_midi_notes(data):
+    """Notes of a Standard MIDI File (bytes) with the same rules as pretty_midi."""
+    if data[:4] != b"MThd":
+        raise ValueError("MThd not found")
+    header_size, = struct.unpack(">L", data[4:8])
+    _, n_tracks, resolution = struct.unpack(">hhh", data[8:14])
+    if resolution <= 0:
+        raise ValueError("SMPTE time division")
+
+    tracks = []
+    pos = 8 + header_size
+    while pos + 8 <= len(data) and len(tracks) < n_tracks:
+        name, size = struct.unpack(">4sL", data[pos:pos + 8])
+        pos += 8
+        if name == b"MTrk":
+            tracks.append(_read_track_events(data, pos, min(pos + size, len(data))))
+        pos += size
+
+    # note-off closes every open note-on of the same (channel, pitch) from an
+    # earlier tick; instruments are (program, channel, track) in order of creation
+    instruments = {}
+    rows = []
+    for track_idx, events in enumerate(tracks):
+        last_note_on = {}
+        program = [0] * 16
+        for tick, kind, channel, a, b in events:
+            if kind == _PROGRAM:
+                program[channel] = a
+            elif kind == _NOTE_ON:
+                last_note_on.setdefault((channel, a), []).append((tick, b))
+            elif kind == _NOTE_OFF:
+                open_notes = last_note_on.get((channel, a))
+                if open_notes is None:
+                    continue
+                if len(open_notes) == 1:    # usual case, same rules as below
+                    del last_note_on[(channel, a)]
+                    t, v = open_notes[0]
+                    if t != tick:
+                        inst = instruments.setdefault((program[channel], channel, track_idx),
+                                                      len(instruments))
+                        rows.append((inst, channel == 9, a, t, tick, v))
+                    continue
+                to_close = [(t, v) for t, v in open_notes if t != tick]
+                to_keep = [(t, v) for t, v in open_notes if t == tick]
+                if to_close:
+                    inst = instruments.setdefault((program[channel], channel, track_idx),
+                                                  len(instruments))
+                    for t, v in to_close:
+                        rows.append((inst, channel == 9, a, t, tick, v))
+                if to_close and to_keep:
+                    last_note_on[(channel, a)] = to_keep
+                else:
+                    del last_note_on[(channel, a)]
+
+    notes = np.zeros(len(rows), dtype=NOTE_DTYPE)
+    if rows:
+        inst, drum, pitch, on, off, vel = np.array(rows, dtype=np.int64).T
+        tempo_events = [e for e in tracks[0] if e[1] == _TEMPO]
+        notes["instrument"] = inst
+        notes["is_drum"] = drum
+        notes["pitch"] = pitch
+        notes["start"] = _tick_to_time(on, tempo_events, resolution)
+        notes["end"] = _tick_to_time(off, tempo_events, resolution)
+        notes["velocity"] = vel
+        # instrument by instrument, notes in order of note-off (as pretty_midi)
+        notes = notes[np.argsort(notes["instrument"], kind="stable")]
+    return notes
+
+
+def _notes_from_pretty_midi(midi_path):
     pm = pretty_midi.PrettyMIDI(midi_path)
+    rows = [(k, inst.is_drum, n.pitch, n.start, n.end, n.velocity)
+            for k, inst in enumerate(pm.instruments) for n in inst.notes]
+    return np.array(rows, dtype=NOTE_DTYPE)
+
+
+def load_midi_notes(midi_path):
+    """
+    All notes of a MIDI file as a structured array (NOTE_DTYPE):
+    instrument, is_drum, pitch, start, end, velocity.
+
+    Same notes, instruments and times as pretty_midi.PrettyMIDI, read with a
+    lean SMF parser instead of building mido messages and Note objects.
+    Files the parser doesn't handle (e.g. SMPTE timing) go through pretty_midi.
+    """
+    with open(midi_path, "rb") as f:
+        data = f.read()
+    try:
+        return _parse_midi_notes(data)
+    except (ValueError, IndexError, struct.error):
+        return _notes_from_pretty_midi(midi_path)
+
 
-    # Map start_time -> list of pitches across all non-drum instruments
-    time_to_pitches = {}
+# MIDI → full-pitch chord sequence (per instrument, paper method)
 
-    for inst in pm.instruments:
-        if inst.is_drum:
+def chord_slices(notes, time_tol=1e-3):
+    """
+    Chord slices of a note table (load_midi_notes), in full MIDI pitch space.
+    - Drums are skipped; each instrument is sliced on its own, in order.
+    - A slice = notes whose onset is within time_tol of the slice's first onset.
+    - Chord = sorted set of the slice's pitches; consecutive duplicate chords
+      of the same instrument are merged.
+    Returns (offsets, pitches): chord k is pitches[offsets[k]:offsets[k + 1]].
+    """
+    notes = notes[~notes["is_drum"]]
+    if len(notes) == 0:
+        return np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    order = np.lexsort((notes["start"], notes["instrument"]))  # stable
+    inst = notes["instrument"][order]
+    t = notes["start"][order]
+    p = notes["pitch"][order].astype(np.int64)
+    n = len(t)
+
+    # onset buckets: a gap > time_tol always starts a new slice...
+    new = np.ones(n, dtype=bool)
+    new[1:] = (inst[1:] != inst[:-1]) | (t[1:] - t[:-1] > time_tol)
+    # ...and runs of close onsets spanning more than time_tol are split again
+    # from each slice's first onset
+    run_start = np.flatnonzero(new)
+    run_end = np.append(run_start[1:], n)
+    for a, e in zip(run_start, run_end):
+        if t[e - 1] - t[a] <= time_tol:
             continue
-        for note in inst.notes:
-            t = note.start
-            if t not in time_to_pitches:
-                time_to_pitches[t] = []
-            time_to_pitches[t].append(note.pitch)
-
-    if not time_to_pitches:
-        return []
-
-    # Build ordered chord list
-    chords = []
-    for t in sorted(time_to_pitches.keys()):
-        chord = tuple(sorted(set(time_to_pitches[t])))
-        if len(chord) > 0:
-            chords.append(chord)
-
-    # Compress consecutive duplicates
-    final = []
-    prev = None
-    for c in chords:
-        if c != prev:
-            final.append(c)
-            prev = c
-
-    return final
-
-# MIDI → pitch-class chord sequence
+        while a < e:
+            new[a] = True
+            a += int(np.searchsorted(t[a:e] - t[a], time_tol, side="right"))
+    slice_id = np.cumsum(new) - 1
+
+    # sorted set of pitches per slice
+    order = np.lexsort((p, slice_id))
+    slice_id, p = slice_id[order], p[order]
+    first = np.ones(n, dtype=bool)
+    first[1:] = (slice_id[1:] != slice_id[:-1]) | (p[1:] != p[:-1])
+    slice_id, p = slice_id[first], p[first]
+
+    starts = np.flatnonzero(np.r_[True, slice_id[1:] != slice_id[:-1]])
+    slice_inst = inst[new]
+    # chord identity as a 128-bit mask (two uint64 words)
+    bits = np.left_shift(np.uint64(1), (p % 64).astype(np.uint64))
+    lo = np.bitwise_or.reduceat(np.where(p < 64, bits, np.uint64(0)), starts)
+    hi = np.bitwise_or.reduceat(np.where(p >= 64, bits, np.uint64(0)), starts)
+    keep = np.ones(len(starts), dtype=bool)
+    keep[1:] = (slice_inst[1:] != slice_inst[:-1]) | (lo[1:] != lo[:-1]) | (hi[1:] != hi[:-1])
+
+    lengths = np.diff(np.append(starts, len(p)))
+    pitches = p[np.repeat(keep, lengths)]
+    offsets = np.concatenate(([0], np.cumsum(lengths[keep])))
+    return offsets, pitches
+
 
 def midi_chord_sequence_fullpitch(midi_path, time_tol=1e-3):
     """
@@ -63,54 +278,80 @@ def midi_chord_sequence_fullpitch(midi_path, time_tol=1e-3):
     Each chord is a tuple of pitches; consecutive duplicates merged.
     Follows the construction in Di Marco et al. (per instrument/channel).
     """
-    pm = pretty_midi.PrettyMIDI(midi_path)
+    offsets, pitches = chord_slices(load_midi_notes(midi_path), time_tol)
+    pitches = pitches.tolist()
+    return [tuple(pitches[a:b]) for a, b in zip(offsets[:-1], offsets[1:])]
 
-    chords_all = []
+# Audio → chroma chord sequence
 
-    for inst in pm.instruments:
-        if inst.is_drum:
-            continue
+# Pitch-class chords as 12-bit masks (bit p = pitch class p is active), with
+# lookup tables over all 4096 masks
+PC_BITS = (np.arange(4096)[:, None] >> np.arange(12)) & 1          # (4096, 12)
+PC_COUNT = PC_BITS.sum(axis=1)                                      # popcount
+PC_CHORDS = [tuple(np.flatnonzero(b).tolist()) for b in PC_BITS]   # mask -> tuple
 
-        # Collect notes for this instrument and sort by onset
-        notes = sorted(inst.notes, key=lambda n: n.start)
-        if not notes:
-            continue
 
-        time_slices = []
-        current_time = None
-        current_chord = []
-
-        for n in notes:
-            t = n.start
-            p = n.pitch
-            if current_time is None:
-                current_time = t
-                current_chord = [p]
-            elif abs(t - current_time) <= time_tol:
-                current_chord.append(p)
-            else:
-                # close previous slice (full pitches, no mod 12)
-                chord = tuple(sorted(set(current_chord)))
-                if len(chord) > 0:
-                    time_slices.append(chord)
-                current_time = t
-                current_chord = [p]
-
-        if current_chord:
-            chord = tuple(sorted(set(current_chord)))
-            if len(chord) > 0:
-                time_slices.append(chord)
-
-        # compress consecutive duplicates in this instrument
-        prev = None
-        for c in time_slices:
-            if c != prev:
-                chords_all.append(c)
-                prev = c
-
-    return chords_all
+@lru_cache(maxsize=32)
+def _chroma_cqt_cached(audio_path, mtime_ns, size, sr, hop_length):
+    y, sr = librosa.load(audio_path, sr=sr)
+    chroma = librosa.feature.chroma_cqt(y=y, sr=sr, hop_length=hop_length)
+    chroma.flags.writeable = False
+    return chroma
+
+
+def audio_chroma(audio_path, sr=SR, hop_length=HOP_LENGTH):
+    """
+    chroma_cqt of an audio file, cached in memory (the file's mtime and size
+    are part of the key, so an overwritten file is recomputed). Read-only.
+    """
+    audio_path = os.path.abspath(audio_path)
+    st = os.stat(audio_path)
+    return _chroma_cqt_cached(audio_path, st.st_mtime_ns, st.st_size, sr, hop_length)
+
+
+def fold_chroma(chroma):
+    """
+    Chromagram (n_bins, T) -> (12, T) pitch classes. n_bins must be a multiple
+    of 12 starting at C (chroma_cqt with bins_per_octave = n_chroma, like the
+    24-bin microtonal chroma of the trajectories): each pitch class takes the
+    max over its bins, the one on the semitone and the neighbours up to half
+    a semitone below it.
+    """
+    chroma = np.asarray(chroma)
+    n_bins = chroma.shape[0]
+    if n_bins == N_PITCH_CLASSES:
+        return chroma
+    if n_bins == 0 or n_bins % N_PITCH_CLASSES:
+        raise ValueError(f"chroma with {n_bins} bins: expected 12 or a multiple of 12 (shape (n_bins, T))")
+    r = n_bins // N_PITCH_CLASSES
+    # rotate so each pitch class's bins are contiguous, then max per group
+    return np.roll(chroma, r // 2, axis=0).reshape(N_PITCH_CLASSES, r, -1).max(axis=1)
+
+
+def chroma_chord_masks(chroma, thresh=CHROMA_THRESH):
+    """
+    12-bit chord mask of every chroma frame (n_bins, T) at once, after
+    fold_chroma: pitch classes with chroma >= thresh * frame max; 0 for
+    silent frames (max < 1e-6).
+    """
+    chroma = fold_chroma(chroma)
+    fmax = chroma.max(axis=0)
+    active = (chroma >= thresh * fmax) & (fmax >= 1e-6)
+    return (active.T.astype(np.int64) << np.arange(chroma.shape[0])).sum(axis=1)
+
+
+def compress_chord_masks(masks):
+    """Drop empty chords, then merge consecutive duplicates (run-length on the codes)."""
+    masks = masks[masks != 0]
+    if len(masks) == 0:
+        return masks
+    return masks[np.r_[True, masks[1:] != masks[:-1]]]
+
+
+def chroma_chord_codes(chroma, thresh=CHROMA_THRESH):
+    """Compressed chord sequence of a chromagram, as 12-bit masks."""
+    return compress_chord_masks(chroma_chord_masks(chroma, thresh))
 
-# Audio → chroma chord sequence
 
 def chroma_chord_sequence(y, sr=SR, hop_length=HOP_LENGTH, thresh=CHROMA_THRESH):
     """
@@ -118,162 +359,356 @@ def chroma_chord_sequence(y, sr=SR, hop_length=HOP_LENGTH, thresh=CHROMA_THRESH)
     Each chord is a tuple of pitch classes; consecutive duplicates merged.
     """
     chroma = librosa.feature.chroma_cqt(y=y, sr=sr, hop_length=hop_length)
-    T = chroma.shape[1]
+    return [PC_CHORDS[m] for m in chroma_chord_codes(chroma, thresh)]
 
-    chords = []
-    prev_chord = None
+# Build graph from chord sequence (shared for MIDI & audio)
 
-    for t in range(T):
-        frame = chroma[:, t]
-        if frame.max() < 1e-6:
-            active = ()
-        else:
-            act = np.where(frame >= thresh * frame.max())[0]
-            active = tuple(sorted(set(act.tolist())))
+N_PITCHES = 128      # full MIDI pitch space
+N_PITCH_CLASSES = 12
 
-        if active != prev_chord and len(active) > 0:
-            chords.append(active)
-            prev_chord = active
+class ChordGraph:
+    """
+    Directed chord-transition graph on a fixed node space 0..n_nodes-1
+    (128 MIDI pitches or 12 pitch classes), stored as a dense weight matrix:
+    W[i, j] = weight of the edge i -> j (0 = no edge), no self-loops.
 
-    return chords
+    Nodes are the pitches with at least one incoming or outgoing edge,
+    as in the networkx graph built by add_edge. Metrics work directly on W;
+    to_networkx() is only needed for plotting.
+    """
 
-# Build graph from chord sequence (shared for MIDI & audio)
+    def __init__(self, W):
+        W = np.asarray(W)
+        if W.ndim != 2 or W.shape[0] != W.shape[1]:
+            raise ValueError(f"Weight matrix must be square, got shape {W.shape}")
+        self.W = W.copy()
+        np.fill_diagonal(self.W, 0)
+
+    @property
+    def n_nodes_total(self):
+        return self.W.shape[0]
+
+    @property
+    def nodes(self):
+        """Active nodes (pitches with at least one edge), sorted."""
+        W = self.W
+        return np.flatnonzero((W != 0).any(axis=0) | (W != 0).any(axis=1))
+
+    def number_of_nodes(self):
+        return len(self.nodes)
+
+    def number_of_edges(self):
+        return int(np.count_nonzero(self.W))
+
+    def edges(self):
+        """(sources, targets, weights) of all edges, in row-major order."""
+        u, v = np.nonzero(self.W)
+        return u, v, self.W[u, v]
 
-def build_chord_transition_graph(chords):
+    def out_strength(self):
+        return self.W.sum(axis=1)
+
+    def to_networkx(self):
+        G = nx.DiGraph()
+        G.add_nodes_from(self.nodes.tolist())
+        u, v, w = self.edges()
+        G.add_weighted_edges_from(zip(u.tolist(), v.tolist(), w.tolist()))
+        return G
+
+    @classmethod
+    def from_networkx(cls, G, n_nodes=N_PITCHES):
+        W = np.zeros((n_nodes, n_nodes))
+        for u, v, data in G.edges(data=True):
+            W[u, v] = data["weight"]
+        return cls(W)
+
+
+def as_chord_graph(G):
+    """ChordGraph as is; a networkx DiGraph (integer nodes) is converted."""
+    if isinstance(G, ChordGraph):
+        return G
+    return ChordGraph.from_networkx(G)
+
+
+def chord_matrix(chords, n_nodes=N_PITCHES):
+    """
+    Sparse indicator matrix X (n_chords x n_nodes): X[t, p] = number of times
+    pitch p appears in chord t (1 for the chord sequences built above).
+    """
+    lengths = np.fromiter((len(c) for c in chords), dtype=np.int64, count=len(chords))
+    pitches = np.fromiter((p for c in chords for p in c), dtype=np.int64, count=int(lengths.sum()))
+    return _slice_matrix(np.concatenate(([0], np.cumsum(lengths))), pitches, n_nodes)
+
+
+def _slice_matrix(offsets, pitches, n_nodes):
+    from scipy import sparse
+
+    if pitches.size and (pitches.min() < 0 or pitches.max() >= n_nodes):
+        raise ValueError(f"Pitches must be in 0..{n_nodes - 1}")
+    n_chords = len(offsets) - 1
+    rows = np.repeat(np.arange(n_chords), np.diff(offsets))
+    return sparse.csr_matrix(
+        (np.ones(len(pitches), dtype=np.int64), (rows, pitches)),
+        shape=(n_chords, n_nodes),
+    )
+
+
+def build_chord_transition_graph(chords, n_nodes=N_PITCHES):
     """
     chords: list of tuples of integer pitches (e.g., MIDI notes or pitch classes)
-    Returns DiGraph with edges weighted by transition counts.
+    Returns a ChordGraph with edges weighted by transition counts.
     No self-loops.
+
+    All transitions at once: sum over t of the outer product chord_t x chord_{t+1}
+    = X[:-1].T @ X[1:] with the sparse chord indicator matrix X.
     """
-    G = nx.DiGraph()
-    for chord_a, chord_b in zip(chords[:-1], chords[1:]):
-        for i in chord_a:
-            for j in chord_b:
-                if i == j:
-                    continue  # no self-loops
-                if G.has_edge(i, j):
-                    G[i][j]["weight"] += 1
-                else:
-                    G.add_edge(i, j, weight=1)
-    return G
+    if len(chords) < 2:
+        return ChordGraph(np.zeros((n_nodes, n_nodes), dtype=np.int64))
+    return _transition_graph(chord_matrix(chords, n_nodes))
+
+
+def transition_graph_from_slices(offsets, pitches, n_nodes=N_PITCHES):
+    """build_chord_transition_graph for the (offsets, pitches) of chord_slices."""
+    if len(offsets) < 3:
+        return ChordGraph(np.zeros((n_nodes, n_nodes), dtype=np.int64))
+    return _transition_graph(_slice_matrix(offsets, pitches, n_nodes))
 
 
+def _transition_graph(X):
+    return ChordGraph((X[:-1].T @ X[1:]).toarray())
+
+
+def transition_graph_from_masks(masks):
+    """
+    Pitch-class ChordGraph (12 nodes) from a chord sequence of 12-bit masks:
+    transitions are counted once per distinct (mask_a, mask_b) pair, then
+    expanded to pitch-class pairs with the PC_BITS table.
+    """
+    masks = np.asarray(masks, dtype=np.int64)
+    if len(masks) < 2:
+        return ChordGraph(np.zeros((N_PITCH_CLASSES, N_PITCH_CLASSES), dtype=np.int64))
+    pairs, counts = np.unique(masks[:-1] * 4096 + masks[1:], return_counts=True)
+    A = PC_BITS[pairs // 4096]
+    B = PC_BITS[pairs % 4096]
+    return ChordGraph(A.T @ (counts[:, None] * B))
+
 
 def weighted_reciprocity(G):
-    W = 0.0
-    W_bidir = 0.0
-    for u, v, data in G.edges(data=True):
-        w_uv = data["weight"]
-        W += w_uv
-        if G.has_edge(v, u):
-            w_vu = G[v][u]["weight"]
-            W_bidir += min(w_uv, w_vu)
-    if W == 0:
+    G = as_chord_graph(G)
+    W = G.W
+    W_total = float(W.sum())
+    if W_total == 0:
         return 0.0
-    return W_bidir / W
+    # min(w_uv, w_vu) is 0 when the reverse edge is missing
+    W_bidir = float(np.minimum(W, W.T).sum())
+    return W_bidir / W_total
+
+
+def _outgoing_groups(G):
+    """Edges in row-major order and, per edge, the index of its source group."""
+    u, v, w = G.edges()
+    group = np.concatenate(([0], np.cumsum(u[1:] != u[:-1]))) if len(u) else u
+    return u, v, w, group
+
+
+def _permute_outgoing(w, group, rng, n):
+    """
+    n independent null samples at once: (n, m) weights where, in every row,
+    the weights of each node's outgoing edges are randomly permuted among
+    those edges (out-strength preserved). Edges are grouped by source, so
+    sorting random keys offset by the group index permutes within groups.
+    """
+    keys = rng.random((n, len(w))) + group
+    return w[np.argsort(keys, axis=1)]
 
 
 def shuffle_outgoing_weights_preserve_strength(G, rng=None):
     if rng is None:
         rng = np.random.default_rng()
-    H = G.copy()
-    for u in H.nodes():
-        out_edges = list(H.out_edges(u, data=True))
-        if len(out_edges) <= 1:
-            continue
-        weights = [d["weight"] for _, _, d in out_edges]
-        rng.shuffle(weights)
-        for (idx, (src, dst, data)) in enumerate(out_edges):
-            data["weight"] = float(weights[idx])
-    return H
+    G = as_chord_graph(G)
+    u, v, w, group = _outgoing_groups(G)
+    W = np.zeros(G.W.shape)
+    W[u, v] = _permute_outgoing(w.astype(float), group, rng, 1)[0]
+    return ChordGraph(W)
 
 
-def normalized_weighted_reciprocity(G, n_null=20):
+def null_reciprocity_samples(G, n_null=10_000, seed=0, batch_size=None, max_bytes=256 * 2**20):
+    """
+    Weighted reciprocity of n_null strength-preserving null graphs
+    (outgoing weights shuffled per node), computed batch_size samples
+    at a time on the edge arrays. seed: int or np.random.Generator.
+
+    A batch holds about 48 bytes per sample and edge (random keys, argsort
+    index, permuted weights, the two reciprocal-edge copies and their
+    minimum), so by default batch_size is sized from the edge count to stay
+    within max_bytes: a dense 128-node graph (~16k edges) runs ~340 samples
+    at a time instead of allocating over 1 GB.
+    """
+    G = as_chord_graph(G)
+    rng = np.random.default_rng(seed)
+    u, v, w, group = _outgoing_groups(G)
+    W_total = float(w.sum())
+    out = np.zeros(n_null)
+    if W_total == 0:
+        return out
+
+    # index of the reverse edge v -> u for every edge that has one
+    pos = np.full(G.W.shape, -1)
+    pos[u, v] = np.arange(len(w))
+    rev = pos[v, u]
+    e = np.flatnonzero(rev >= 0)
+    r = rev[e]
+    w = w.astype(float)
+    if batch_size is None:
+        batch_size = max(1, int(max_bytes) // (48 * len(w)))
+
+    for s0 in range(0, n_null, batch_size):
+        n = min(batch_size, n_null - s0)
+        Wp = _permute_outgoing(w, group, rng, n)
+        out[s0:s0 + n] = np.minimum(Wp[:, e], Wp[:, r]).sum(axis=1) / W_total
+    return out
+
+
+def reciprocity_null_model(G, n_null=10_000, seed=0, ci=0.95):
+    """
+    Normalized weighted reciprocity against the strength-preserving null model:
+    rho = (r_real - r_null) / (1 - r_null), r_null = mean over n_null samples.
+
+    Returns a dict with:
+    - r_real, r_null, r_null_std (spread of the null distribution), rho_norm
+    - r_null_ci: central `ci` band (percentiles) of the null distribution, i.e.
+      where the reciprocity of a random graph with the same strengths falls;
+      r_real outside it is significant at level 1 - ci
+    - z_score: (r_real - r_null) / r_null_std
+    - p_value: one-sided empirical p-value, P(r_null >= r_real), computed as
+      (1 + #samples >= r_real) / (n_null + 1)
+    """
+    G = as_chord_graph(G)
     r_real = weighted_reciprocity(G)
-    if G.number_of_edges() == 0:
-        return r_real, 0.0, 0.0
-
-    r_null_vals = []
-    for _ in range(n_null):
-        H = shuffle_outgoing_weights_preserve_strength(G)
-        r_null_vals.append(weighted_reciprocity(H))
+    if G.number_of_edges() == 0 or n_null == 0:
+        return {"r_real": r_real, "r_null": 0.0, "r_null_std": 0.0, "rho_norm": 0.0,
+                "r_null_ci": (0.0, 0.0), "z_score": 0.0, "p_value": 1.0}
 
+    r_null_vals = null_reciprocity_samples(G, n_null=n_null, seed=seed)
     r_null = float(np.mean(r_null_vals))
-    if r_null >= 1.0:
-        rho = 0.0
-    else:
-        rho = (r_real - r_null) / (1 - r_null)
-    return r_real, r_null, rho
+    r_null_std = float(np.std(r_null_vals, ddof=1)) if n_null > 1 else 0.0
+    lo, hi = np.percentile(r_null_vals, [50 * (1 - ci), 50 * (1 + ci)])
 
+    rho_norm = 0.0 if r_null >= 1.0 else (r_real - r_null) / (1 - r_null)
+    return {
+        "r_real": r_real,
+        "r_null": r_null,
+        "r_null_std": r_null_std,
+        "rho_norm": rho_norm,
+        "r_null_ci": (float(lo), float(hi)),
+        "z_score": (r_real - r_null) / r_null_std if r_null_std > 0 else 0.0,
+        "p_value": float((1 + np.count_nonzero(r_null_vals >= r_real)) / (n_null + 1)),
+    }
 
-def node_entropy(G, u):
-    out_edges = list(G.out_edges(u, data=True))
-    k = len(out_edges)
-    if k <= 1:
-        return 0.0
-    weights = np.array([d["weight"] for _, _, d in out_edges], dtype=float)
-    p = weights / (weights.sum() + EPS)
-    H = -np.sum(p * np.log(p + EPS))
+
+def normalized_weighted_reciprocity(G, n_null=10_000, seed=0):
+    res = reciprocity_null_model(G, n_null=n_null, seed=seed)
+    return res["r_real"], res["r_null"], res["rho_norm"]
+
+
+def node_entropies(G):
+    """
+    Normalized entropy of the outgoing weights of every node (0..n_nodes-1):
+    H(p) / log(k), with k = out-degree; 0 for nodes with k <= 1.
+    """
+    G = as_chord_graph(G)
+    W = G.W.astype(float)
+    k = np.count_nonzero(W, axis=1)
+    p = W / (W.sum(axis=1, keepdims=True) + EPS)
+    H = -np.sum(np.where(W > 0, p * np.log(p + EPS), 0.0), axis=1)
     H_max = np.log(k + EPS)
-    return H / (H_max + EPS)
+    return np.where(k > 1, H / (H_max + EPS), 0.0)
+
+
+def node_entropy(G, u):
+    return float(node_entropies(G)[u])
 
 
 def mean_node_entropy(G):
-    if G.number_of_nodes() == 0:
+    G = as_chord_graph(G)
+    nodes = G.nodes
+    if len(nodes) == 0:
         return 0.0
-    entropies = [node_entropy(G, u) for u in G.nodes()]
-    return float(np.mean(entropies))
+    return float(np.mean(node_entropies(G)[nodes]))
 
 
-def global_efficiency_unweighted(G):
-    if G.number_of_nodes() <= 1:
+def density(G):
+    """Directed density m / (n (n - 1)) over the active nodes (as nx.density)."""
+    G = as_chord_graph(G)
+    n = G.number_of_nodes()
+    if n <= 1:
         return 0.0
-    sp = dict(nx.all_pairs_shortest_path_length(G))
-    nodes = list(G.nodes())
-    s = 0.0
-    count = 0
-    for i in nodes:
-        for j in nodes:
-            if i == j:
-                continue
-            d = sp.get(i, {}).get(j, np.inf)
-            if np.isfinite(d) and d > 0:
-                s += 1.0 / d
-                count += 1
-    return float(s / count) if count > 0 else 0.0
+    return G.number_of_edges() / (n * (n - 1))
 
 
-def global_efficiency_weighted(G):
-    if G.number_of_nodes() <= 1:
+def _active_adjacency(G):
+    """Weight submatrix restricted to the active nodes (float copy)."""
+    G = as_chord_graph(G)
+    nodes = G.nodes
+    return G.W[np.ix_(nodes, nodes)].astype(float)
+
+
+def _efficiency_from_adjacency(A, weighted):
+    """
+    Mean of 1/d(i, j) over the ordered pairs i != j with a finite path
+    (d = hops, or sum of costs 1/w if weighted), with all-pairs shortest
+    paths from scipy.sparse.csgraph.
+    """
+    from scipy import sparse
+    from scipy.sparse import csgraph
+
+    if A.shape[0] <= 1:
         return 0.0
-    H = G.copy()
-    for u, v, data in H.edges(data=True):
-        data["cost"] = 1.0 / float(data["weight"])
-
-    sp = dict(nx.all_pairs_dijkstra_path_length(H, weight="cost"))
-    nodes = list(H.nodes())
-    s = 0.0
-    count = 0
-    for i in nodes:
-        for j in nodes:
-            if i == j:
-                continue
-            d = sp.get(i, {}).get(j, np.inf)
-            if np.isfinite(d) and d > 0:
-                s += 1.0 / d
-                count += 1
-    return float(s / count) if count > 0 else 0.0
+    if weighted:
+        C = np.zeros_like(A)
+        np.divide(1.0, A, out=C, where=A != 0)   # cost = 1 / weight
+    else:
+        C = A
+    D = csgraph.shortest_path(sparse.csr_matrix(C), method="D", directed=True,
+                              unweighted=not weighted)
+    np.fill_diagonal(D, np.inf)
+    reachable = np.isfinite(D) & (D > 0)
+    count = np.count_nonzero(reachable)
+    return float(np.sum(1.0 / D[reachable]) / count) if count > 0 else 0.0
+
+
+def global_efficiency_unweighted(G):
+    return _efficiency_from_adjacency(_active_adjacency(G), weighted=False)
+
+
+def global_efficiency_weighted(G):
+    return _efficiency_from_adjacency(_active_adjacency(G), weighted=True)
+
+
+def global_efficiencies(graphs):
+    """
+    Unweighted and weighted global efficiency for a list of graphs
+    (ChordGraph or networkx DiGraph), e.g. a whole corpus.
+    Returns {"eff_unweighted": array, "eff_weighted": array}, one value per graph.
+    """
+    eff_u = np.empty(len(graphs))
+    eff_w = np.empty(len(graphs))
+    for i, G in enumerate(graphs):
+        A = _active_adjacency(G)
+        eff_u[i] = _efficiency_from_adjacency(A, weighted=False)
+        eff_w[i] = _efficiency_from_adjacency(A, weighted=True)
+    return {"eff_unweighted": eff_u, "eff_weighted": eff_w}
 
 
 def interval_embedding_12d(G):
     """
     12D interval profile over pitch classes; L2-normalized.
     """
-    counts = np.zeros(12, dtype=float)
-    for u, v, data in G.edges(data=True):
-        w = float(data["weight"])
-        interval = (v - u) % 12
-        counts[interval] += w
+    G = as_chord_graph(G)
+    n = G.n_nodes_total
+    nodes = np.arange(n)
+    interval = (nodes[None, :] - nodes[:, None]) % 12   # (v - u) mod 12 for edge u -> v
+    counts = np.bincount(interval.ravel(), weights=G.W.ravel().astype(float), minlength=12)
     norm = np.linalg.norm(counts)
     if norm > 0:
         return counts / norm
@@ -281,31 +716,382 @@ def interval_embedding_12d(G):
 
 # Convenience wrappers for “MIDI network” and “audio network”
 
-def compute_midi_network_metrics(midi_path):
-    # Use full MIDI pitches for the graph, as in the paper
-    chords = midi_chord_sequence_fullpitch(midi_path)
-    G = build_chord_transition_graph(chords)
-
+def graph_network_metrics(G, n_null=10_000, seed=0):
+    """Network metrics of a chord-transition graph (shared for MIDI & audio)."""
     metrics = {}
     metrics["n_nodes"] = G.number_of_nodes()
     metrics["n_edges"] = G.number_of_edges()
-    metrics["density"] = nx.density(G)
+    metrics["density"] = density(G)
 
-    r_real, r_null, rho = normalized_weighted_reciprocity(G)
-    metrics["r_real"] = r_real
-    metrics["r_null"] = r_null
-    metrics["rho_norm"] = rho
+    null = reciprocity_null_model(G, n_null=n_null, seed=seed)
+    metrics["r_real"] = null["r_real"]
+    metrics["r_null"] = null["r_null"]
+    metrics["rho_norm"] = null["rho_norm"]
+    metrics["r_null_ci"] = null["r_null_ci"]
+    metrics["z_score"] = null["z_score"]
+    metrics["p_value"] = null["p_value"]
 
     metrics["mean_entropy"] = mean_node_entropy(G)
     metrics["eff_unweighted"] = global_efficiency_unweighted(G)
     metrics["eff_weighted"] = global_efficiency_weighted(G)
 
-    # Intervals now come from full pitches, then mod 12
+    # Intervals from full pitches (MIDI) or pitch classes (audio), mod 12
     metrics["interval_vec"] = interval_embedding_12d(G)
 
     metrics["graph"] = G
     return metrics
 
+
+def compute_midi_network_metrics(midi_path, time_tol=1e-3, n_null=10_000, seed=0):
+    # Use full MIDI pitches for the graph, as in the paper
+    offsets, pitches = chord_slices(load_midi_notes(midi_path), time_tol)
+    G = transition_graph_from_slices(offsets, pitches)
+    return graph_network_metrics(G, n_null=n_null, seed=seed)
+
+
+def compute_audio_network_metrics(audio_path=None, chroma=None, sr=SR,
+                                  hop_length=HOP_LENGTH, thresh=CHROMA_THRESH,
+                                  n_null=10_000, seed=0):
+    """
+    Pitch-class network of an audio file: chroma -> 12-bit chord masks ->
+    transition graph -> same metrics as the MIDI network.
+    chroma: a precomputed chromagram (12, T), or (12k, T) folded with
+    fold_chroma (e.g. the 24-bin chroma of a trajectory); otherwise audio_chroma(audio_path),
+    which is cached, so changing thresh doesn't recompute chroma_cqt.
+    """
+    if chroma is None:
+        if audio_path is None:
+            raise ValueError("Either audio_path or chroma must be given")
+        chroma = audio_chroma(audio_path, sr=sr, hop_length=hop_length)
+    G = transition_graph_from_masks(chroma_chord_codes(chroma, thresh))
+    return graph_network_metrics(G, n_null=n_null, seed=seed)
+
+
+# Sliding-window network metrics (pitch-class graph over time)
+
+# pair index i * 12 + j -> (v - u) mod 12 interval, and transposed pair index
+_PAIR_INTERVAL = ((np.arange(12)[None, :] - np.arange(12)[:, None]) % 12).ravel()
+_PAIR_T = np.arange(144).reshape(12, 12).T.ravel()
+
+
+def chord_transition_events(masks):
+    """
+    Transitions of a per-frame chord mask sequence (0 = no chord), as in
+    compress_chord_masks: (src_mask, dst_mask, src_frame, dst_frame) arrays,
+    src_frame = last frame of the previous chord, dst_frame = first frame of the new one.
+    """
+    masks = np.asarray(masks, dtype=np.int64)
+    nz = np.flatnonzero(masks)
+    change = np.flatnonzero(masks[nz[1:]] != masks[nz[:-1]]) + 1
+    src, dst = nz[change - 1], nz[change]
+    return masks[src], masks[dst], src, dst
+
+
+def windowed_network_metrics(chroma=None, window_frames=256, masks=None, thresh=CHROMA_THRESH,
+                             center=True, block_frames=4096):
+    """
+    Pitch-class network metrics of a sliding window, one value per chroma frame
+    (e.g. the chroma columns of a trajectory, transposed to (24, T) and folded
+    to 12 pitch classes by fold_chroma).
+
+    The window of frame t covers window_frames frames (centred on t, or ending
+    at t if center=False, clipped at the edges); its graph holds the chord
+    transitions with both chords inside the window, exactly like
+    transition_graph_from_masks on the window's compressed chord sequence.
+    Rather than rebuilding it per frame, every transition is added to the
+    12 x 12 counts when it enters the window and removed when it leaves:
+    the counts of all frames are a running sum of these deltas, computed
+    block_frames at a time, and the metrics are evaluated on the counts.
+
+    Returns a dict of arrays over frames: r_real (weighted reciprocity),
+    mean_entropy, node_entropy (T, 12; 0 for inactive nodes), density,
+    n_nodes, n_edges, interval_vec (T, 12, L2-normalized).
+    masks: per-frame 12-bit chord masks instead of chroma.
+    """
+    if masks is None:
+        masks = chroma_chord_masks(chroma, thresh)
+    masks = np.asarray(masks, dtype=np.int64)
+    T = len(masks)
+    W = int(window_frames)
+
+    # frames where each transition enters and leaves the window
+    src_mask, dst_mask, src, dst = chord_transition_events(masks)
+    offset = W // 2 if center else W - 1
+    enter = np.maximum(dst + offset - W + 1, 0)
+    leave = np.minimum(src + offset + 1, T)
+    live = enter < leave
+    enter, leave = enter[live], leave[live]
+    # 144-vector of pitch-class pairs of each transition, no self-loops
+    pattern = (PC_BITS[src_mask[live]][:, :, None] * PC_BITS[dst_mask[live]][:, None, :])
+    pattern[:, np.arange(12), np.arange(12)] = 0
+    pattern = pattern.reshape(-1, 144).astype(float)
+
+    out = {
+        "r_real": np.zeros(T),
+        "mean_entropy": np.zeros(T),
+        "node_entropy": np.zeros((T, 12)),
+        "density": np.zeros(T),
+        "n_nodes": np.zeros(T, dtype=np.int64),
+        "n_edges": np.zeros(T, dtype=np.int64),
+        "interval_vec": np.zeros((T, 12)),
+    }
+    counts = np.zeros(144)
+    for t0 in range(0, T, block_frames):
+        t1 = min(T, t0 + block_frames)
+        delta = np.zeros((t1 - t0, 144))
+        sel = (enter >= t0) & (enter < t1)
+        np.add.at(delta, enter[sel] - t0, pattern[sel])
+        sel = (leave >= t0) & (leave < t1)
+        np.subtract.at(delta, leave[sel] - t0, pattern[sel])
+        C = counts + np.cumsum(delta, axis=0)           # (b, 144) counts per frame
+        counts = C[-1]
+        _window_metrics(C, {k: v[t0:t1] for k, v in out.items()})
+    return out
+
+
+def _window_metrics(C, out):
+    """Metrics of a block of 12 x 12 count matrices C (b, 144), written into out."""
+    C = np.rint(C)                                      # exact integer counts
+    total = C.sum(axis=1)
+    bidir = np.minimum(C, C[:, _PAIR_T]).sum(axis=1)
+    np.divide(bidir, total, out=out["r_real"], where=total > 0)
+
+    M = C.reshape(-1, 12, 12)
+    edges = M != 0
+    k = edges.sum(axis=2)
+    active = edges.any(axis=2) | edges.any(axis=1)
+    n = active.sum(axis=1)
+    out["n_nodes"][:] = n
+    out["n_edges"][:] = edges.sum(axis=(1, 2))
+    np.divide(out["n_edges"], n * (n - 1), out=out["density"], where=n > 1)
+
+    # same formula as node_entropies
+    P = M / (M.sum(axis=2, keepdims=True) + EPS)
+    H = -np.sum(np.where(edges, P * np.log(P + EPS), 0.0), axis=2)
+    out["node_entropy"][:] = np.where(k > 1, H / (np.log(k + EPS) + EPS), 0.0)
+    np.divide((out["node_entropy"] * active).sum(axis=1), n, out=out["mean_entropy"], where=n > 0)
+
+    iv = np.zeros((len(C), 12))
+    for interval in range(12):
+        iv[:, interval] = C[:, _PAIR_INTERVAL == interval].sum(axis=1)
+    norm = np.linalg.norm(iv, axis=1, keepdims=True)
+    np.divide(iv, norm, out=out["interval_vec"], where=norm > 0)
+
+
+# Corpus runner (headless): metrics table for many files, with a result cache
+
+MIDI_SUFFIXES = (".mid", ".midi")
+AUDIO_SUFFIXES = (".wav", ".flac", ".mp3", ".ogg", ".aiff", ".aif")
+METRIC_COLUMNS = [
+    "n_nodes", "n_edges", "density", "r_real", "r_null", "rho_norm",
+    "r_null_ci_lo", "r_null_ci_hi", "z_score", "p_value",
+    "mean_entropy", "eff_unweighted", "eff_weighted",
+] + [f"iv_{k}" for k in range(12)]
+
+
+def metrics_row(metrics):
+    """Flat row of plain numbers (no graph) from the metrics dict, METRIC_COLUMNS order."""
+    # the two vector-valued metrics are expanded; every other column is copied by name
+    expanded = dict(zip(("r_null_ci_lo", "r_null_ci_hi"), metrics["r_null_ci"]))
+    expanded.update({f"iv_{k}": v for k, v in enumerate(np.asarray(metrics["interval_vec"]).tolist())})
+    row = {}
+    for k in METRIC_COLUMNS:
+        v = expanded[k] if k in expanded else metrics[k]
+        row[k] = int(v) if k in ("n_nodes", "n_edges") else float(v)
+    return row
+
+
+def _file_domain(path):
+    suffix = Path(path).suffix.lower()
+    if suffix in MIDI_SUFFIXES:
+        return "midi"
+    if suffix in AUDIO_SUFFIXES:
+        return "audio"
+    return None
+
+
+def _file_hash(path, chunk_size=1 << 20):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _params_hash(params):
+    blob = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha1(blob.encode()).hexdigest()[:16]
+
+
+def _network_metrics_job(path, domain, params):
+    if domain == "midi":
+        metrics = compute_midi_network_metrics(path, **params)
+    else:
+        metrics = compute_audio_network_metrics(path, **params)
+    return metrics_row(metrics)
+
+
+def _worker_context():
+    """
+    Default multiprocessing context if its workers can import this module (and
+    so find _network_metrics_job by name), else None.
+
+    With "fork" the module just has to be registered in sys.modules (as
+    benchmarks/pipeline.py does when it loads this file by path); with "spawn"
+    / "forkserver" its name must also resolve to this file on sys.path, as
+    when the notebooks import it from the Phd folder.
+    """
+    ctx = mp.get_context()
+    if sys.modules.get(__name__) is None:
+        return None
+    if ctx.get_start_method() == "fork":
+        return ctx
+    if "." in __name__:
+        parent = sys.modules.get(__name__.rpartition(".")[0])
+        return ctx if getattr(parent, "__path__", None) is not None else None
+    spec = importlib.machinery.PathFinder.find_spec(__name__)
+    if spec is not None and spec.origin and os.path.samefile(spec.origin, __file__):
+        return ctx
+    return None
+
+
+def corpus_network_metrics(
+    paths,
+    out_path=None,
+    cache_dir="network_cache",
+    n_jobs=None,
+    time_tol=1e-3,
+    sr=SR,
+    hop_length=HOP_LENGTH,
+    thresh=CHROMA_THRESH,
+    n_null=10_000,
+    seed=0,
+):
+    """
+    Network metrics of a whole corpus of MIDI and audio files, headless
+    (no graphs kept, no plots), as one table: path, domain, file_hash,
+    cached, error + METRIC_COLUMNS (the 12-D interval vector as iv_0..iv_11).
+
+    - paths:     list of files, or a folder (all MIDI/audio files inside)
+    - cache_dir: one JSON per (file content hash, parameters); a file is only
+                 recomputed if its content or the parameters of its domain
+                 change, so re-running after adding files computes just those
+    - n_jobs:    processes (default: all cores; 1 = in this process). The
+                 workers import this module by name: if they can't (see
+                 _worker_context) a RuntimeWarning is raised and the files
+                 are computed in this process
+    - out_path:  also write the table (.csv, otherwise parquet)
+
+    Files that fail get an "error" message and NaN metrics (and are not cached).
+    """
+    if isinstance(paths, (str, Path)) and Path(paths).is_dir():
+        paths = sorted(str(p) for p in Path(paths).rglob("*") if _file_domain(p))
+    paths = [str(p) for p in paths]
+
+    params = {
+        "midi": {"time_tol": time_tol, "n_null": n_null, "seed": seed},
+        "audio": {"sr": sr, "hop_length": hop_length, "thresh": thresh,
+                  "n_null": n_null, "seed": seed},
+    }
+    # the columns are part of the key: cached rows always match METRIC_COLUMNS
+    params_hash = {domain: _params_hash({**p, "columns": METRIC_COLUMNS})
+                   for domain, p in params.items()}
+
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    # content hashes of unchanged files (same mtime and size) are not recomputed
+    hash_index_path = cache_dir / "file_hashes.json"
+    try:
+        with open(hash_index_path, encoding="utf-8") as f:
+            hash_index = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        hash_index = {}
+
+    rows = []
+    todo = []
+    for i, path in enumerate(paths):
+        domain = _file_domain(path)
+        row = {"path": path, "domain": domain, "file_hash": None, "cached": False, "error": None}
+        rows.append(row)
+        if domain is None:
+            row["error"] = "unsupported file type"
+            continue
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            row["error"] = f"{type(e).__name__}: {e}"
+            continue
+        key = os.path.abspath(path)
+        known = hash_index.get(key)
+        if known and known[0] == st.st_mtime_ns and known[1] == st.st_size:
+            file_hash = known[2]
+        else:
+            file_hash = _file_hash(path)
+            hash_index[key] = [st.st_mtime_ns, st.st_size, file_hash]
+        row["file_hash"] = file_hash
+
+        cache_path = cache_dir / f"{file_hash}-{params_hash[domain]}.json"
+        if cache_path.exists():
+            with open(cache_path, encoding="utf-8") as f:
+                row.update(json.load(f))
+            row["cached"] = True
+        else:
+            todo.append((i, cache_path))
+
+    def store(i, cache_path, result):
+        rows[i].update(result)
+        tmp = cache_path.with_name(f"{cache_path.name}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        os.replace(tmp, cache_path)
+
+    n_jobs = n_jobs or os.cpu_count() or 1
+    ctx = _worker_context() if todo and n_jobs > 1 else None
+    if todo and n_jobs > 1 and ctx is None:
+        warnings.warn(
+            f"corpus_network_metrics: the worker processes can't import module {__name__!r} "
+            "(loaded by path without registering it in sys.modules, or not on sys.path "
+            f"with the {mp.get_start_method()!r} start method); computing in this process",
+            RuntimeWarning,
+        )
+        n_jobs = 1
+    if todo and n_jobs == 1:
+        for i, cache_path in todo:
+            try:
+                result = _network_metrics_job(paths[i], rows[i]["domain"], params[rows[i]["domain"]])
+            except Exception as e:  # a broken file must not stop the corpus
+                rows[i]["error"] = f"{type(e).__name__}: {e}"
+                continue
+            store(i, cache_path, result)
+    elif todo:
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(todo)), mp_context=ctx) as pool:
+            futures = {
+                pool.submit(_network_metrics_job, paths[i], rows[i]["domain"],
+                            params[rows[i]["domain"]]): (i, cache_path)
+                for i, cache_path in todo
+            }
+            for fut in as_completed(futures):
+                i, cache_path = futures[fut]
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    rows[i]["error"] = f"{type(e).__name__}: {e}"
+                    continue
+                store(i, cache_path, result)
+
+    tmp = hash_index_path.with_name(f"{hash_index_path.name}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(hash_index, f)
+    os.replace(tmp, hash_index_path)
+
+    df = pd.DataFrame(rows, columns=["path", "domain", "file_hash", "cached", "error"] + METRIC_COLUMNS)
+    if out_path is not None:
+        if str(out_path).endswith(".csv"):
+            df.to_csv(out_path, index=False)
+        else:
+            df.to_parquet(out_path, index=False)
+    return df
+
 # Visualize interval profiles (MIDI vs Audio)
 
 def plot_interval_profiles(iv_midi, iv_audio, title="Interval profile"):
@@ -341,6 +1127,8 @@ def plot_interval_profiles(iv_midi, iv_audio, title="Interval profile"):
 # visualize the graphs
 
 def plot_midi_graph(G, title=""):
+    if isinstance(G, ChordGraph):
+        G = G.to_networkx()
     if G.number_of_nodes() == 0:
         print("Empty graph")
         return
@@ -364,6 +1152,8 @@ def plot_midi_graph(G, title=""):
     plt.show()
 
 def plot_pitchclass_graph(G, title=""):
+    if isinstance(G, ChordGraph):
+        G = G.to_networkx()
     if G.number_of_nodes() == 0:
         print("Empty graph")
         return
@@ -386,8 +1176,10 @@ def plot_pitchclass_graph(G, title=""):
 
 # General helper to compare one pair
 
-def compare_midi_audio_pair(midi_path, audio_path, label="piece"):
-    print(f"=== {label} ===")
+def compare_midi_audio_pair(midi_path, audio_path, label="piece", show=True):
+    """show=False: no printing, table display or plots (just the returned dict)."""
+    if show:
+        print(f"=== {label} ===")
     midi_metrics = compute_midi_network_metrics(midi_path)
     audio_metrics = compute_audio_network_metrics(audio_path)
 
@@ -420,13 +1212,14 @@ def compare_midi_audio_pair(midi_path, audio_path, label="piece"):
         (np.linalg.norm(iv_midi) * np.linalg.norm(iv_audio) + EPS)
     )
 
-    print("Cosine similarity of interval profiles:", cosine_sim)
-    display(df)
+    if show:
+        print("Cosine similarity of interval profiles:", cosine_sim)
+        display(df)
 
-    # plots
-    plot_interval_profiles(iv_midi, iv_audio, title=f"Interval profile – {label}")
-    plot_midi_graph(midi_metrics["graph"],  title=f"MIDI note network – {label}")
-    plot_pitchclass_graph(audio_metrics["graph"], title=f"Audio chroma network – {label}")
+        # plots
+        plot_interval_profiles(iv_midi, iv_audio, title=f"Interval profile – {label}")
+        plot_midi_graph(midi_metrics["graph"],  title=f"MIDI note network – {label}")
+        plot_pitchclass_graph(audio_metrics["graph"], title=f"Audio chroma network – {label}")
 
     return {
         "midi": midi_metrics,
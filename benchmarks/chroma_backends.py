@@ -0,0 +1,106 @@
+"""
+Confronto tra i backend chroma di extract_features: chroma_cqt vs chroma dalla STFT.
+
+Per ogni brano riporta:
+  - tempo di chroma_cqt sul segnale
+  - tempo del backend "stft" (solo filterbank, e filterbank + STFT)
+  - correlazione di Pearson per frame tra i due chroma (media, mediana, 5° percentile)
+
+Uso:
+    python benchmarks/chroma_backends.py clean_wav/*.wav --json chroma_bench.json
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import librosa
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from utils.AudioLoading import load_audio  # noqa: E402
+from utils.FeatureExtraction import chroma_from_power, stft_chroma_filterbank  # noqa: E402
+
+
+def frame_correlation(A, B):
+    """Correlazione di Pearson tra le colonne corrispondenti di A e B (stessa T)."""
+    T = min(A.shape[1], B.shape[1])
+    A = A[:, :T] - A[:, :T].mean(axis=0)
+    B = B[:, :T] - B[:, :T].mean(axis=0)
+    num = np.sum(A * B, axis=0)
+    den = np.linalg.norm(A, axis=0) * np.linalg.norm(B, axis=0)
+    return num / np.maximum(den, 1e-12)
+
+
+def bench_track(path, sr=44100, hop_seconds=0.25, win_seconds=1.0, n_chroma=24):
+    y, sr = load_audio(path, sr=sr, mono=True)
+    hop_length = int(hop_seconds * sr)
+    win_length = int(win_seconds * sr)
+    n_fft = 2 ** int(np.ceil(np.log2(win_length)))
+
+    t0 = time.perf_counter()
+    C_cqt = librosa.feature.chroma_cqt(
+        y=y, sr=sr, hop_length=hop_length,
+        n_chroma=n_chroma, bins_per_octave=n_chroma,
+    )
+    t_cqt = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    S = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length,
+                            win_length=win_length)) ** 2
+    t_stft = time.perf_counter() - t0
+
+    stft_chroma_filterbank(sr, n_fft, n_chroma)  # costruzione fuori dal cronometro
+    t0 = time.perf_counter()
+    C_fast = chroma_from_power(S, sr, n_fft, n_chroma)
+    t_fast = time.perf_counter() - t0
+
+    corr = frame_correlation(C_cqt, C_fast)
+    return {
+        "track": Path(path).name,
+        "duration_s": len(y) / sr,
+        "frames": int(min(C_cqt.shape[1], C_fast.shape[1])),
+        "cqt_s": t_cqt,
+        "stft_chroma_s": t_fast,
+        "stft_chroma_with_stft_s": t_fast + t_stft,
+        "speedup": t_cqt / max(t_fast, 1e-9),
+        "corr_mean": float(np.mean(corr)),
+        "corr_median": float(np.median(corr)),
+        "corr_p05": float(np.percentile(corr, 5)),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("paths", nargs="*", help="file audio (default: clean_wav/*.wav)")
+    parser.add_argument("--sr", type=int, default=44100)
+    parser.add_argument("--hop-seconds", type=float, default=0.25)
+    parser.add_argument("--win-seconds", type=float, default=1.0)
+    parser.add_argument("--n-chroma", type=int, default=24)
+    parser.add_argument("--json", help="salva i risultati in questo file")
+    args = parser.parse_args(argv)
+
+    paths = args.paths or sorted(str(p) for p in Path("clean_wav").glob("*.wav"))
+    if not paths:
+        parser.error("nessun file audio (passa i percorsi o crea clean_wav/)")
+
+    rows = []
+    print(f"{'track':30s} {'dur[s]':>7s} {'cqt[s]':>7s} {'stft[s]':>8s} "
+          f"{'x':>6s} {'r_mean':>7s} {'r_p05':>7s}")
+    for path in paths:
+        r = bench_track(path, sr=args.sr, hop_seconds=args.hop_seconds,
+                        win_seconds=args.win_seconds, n_chroma=args.n_chroma)
+        rows.append(r)
+        print(f"{r['track'][:30]:30s} {r['duration_s']:7.1f} {r['cqt_s']:7.2f} "
+              f"{r['stft_chroma_s']:8.3f} {r['speedup']:6.0f} "
+              f"{r['corr_mean']:7.3f} {r['corr_p05']:7.3f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
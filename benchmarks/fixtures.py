@@ -0,0 +1,191 @@
+"""
+Fixture sintetiche e deterministiche per i benchmark (nessun file esterno).
+
+- "loop": kick in 4/4 + hi-hat in levare
+- "pad":  accordi sostenuti (Am - F - C - G), leggermente stonati tra L e R
+- "mix":  sezioni da 16 battute che alternano loop, pad, basso e break
+
+Ogni battuta è generata da (seed, indice della battuta), quindi lo stesso file
+si ottiene sempre, e anche i mix da 60 minuti si scrivono a blocchi senza
+tenerli in memoria. Per le metriche di rete c'è un MIDI con la stessa
+progressione (accordi + melodia casuale ma con seed).
+
+Uso:
+    python benchmarks/fixtures.py benchmarks/.fixtures --minutes 1 10 60
+"""
+import argparse
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+SR = 44100
+BPM = 128
+SEED = 0
+FIXTURE_VERSION = 1
+
+# progressione di accordi (frequenze in Hz), una per battuta
+PROGRESSION = [
+    (220.00, 261.63, 329.63),  # Am
+    (174.61, 220.00, 261.63),  # F
+    (261.63, 329.63, 392.00),  # C
+    (196.00, 246.94, 293.66),  # G
+]
+PROGRESSION_MIDI = [(57, 60, 64), (53, 57, 60), (60, 64, 67), (55, 59, 62)]
+
+
+def bar_seconds(bpm=BPM):
+    return 4 * 60.0 / bpm
+
+
+def _bar_bounds(k, sr, bpm):
+    bar = bar_seconds(bpm)
+    return int(round(k * bar * sr)), int(round((k + 1) * bar * sr))
+
+
+def _kick(t):
+    # sweep esponenziale 150 → 50 Hz con decadimento
+    phase = 2 * np.pi * (50.0 * t + 100.0 * 0.03 * (1.0 - np.exp(-t / 0.03)))
+    return np.sin(phase) * np.exp(-t / 0.15)
+
+
+def _events(n, sr, bpm, offsets_beats, sound):
+    """Somma di `sound(t)` a partire da ogni offset (in beat) della battuta."""
+    out = np.zeros(n)
+    beat = 60.0 / bpm
+    for b in offsets_beats:
+        s = int(round(b * beat * sr))
+        if s >= n:
+            continue
+        t = np.arange(n - s) / sr
+        out[s:] += sound(t)
+    return out
+
+
+def render_bar(k, kind, sr=SR, bpm=BPM, seed=SEED):
+    """Battuta k del fixture `kind`, float32 stereo (n, 2)."""
+    s0, s1 = _bar_bounds(k, sr, bpm)
+    n = s1 - s0
+    t_glob = (s0 + np.arange(n)) / sr  # tempo assoluto: fase continua tra battute
+    rng = np.random.default_rng([seed, k])
+
+    if kind == "mix":
+        # sezioni da 16 battute: 0 intro, 1 groove + pad, 2 full, 3 break
+        section = (k // 16) % 4
+        parts = {0: ("loop",), 1: ("loop", "pad"), 2: ("loop", "pad", "bass"), 3: ("pad",)}[section]
+    else:
+        parts = (kind,)
+
+    L = np.zeros(n)
+    R = np.zeros(n)
+    if "loop" in parts:
+        kick = 0.8 * _events(n, sr, bpm, [0, 1, 2, 3], _kick)
+        noise = rng.standard_normal(n)
+        noise = np.diff(noise, prepend=0.0)  # passa-alto grezzo
+        hat_env = _events(n, sr, bpm, [0.5, 1.5, 2.5, 3.5], lambda t: np.exp(-t / 0.02))
+        hat = 0.15 * noise * hat_env
+        L += kick + hat
+        R += kick + hat
+    if "pad" in parts:
+        chord = PROGRESSION[k % len(PROGRESSION)]
+        lfo = 0.75 + 0.25 * np.sin(2 * np.pi * 0.25 * t_glob)
+        for f in chord:
+            L += 0.08 * lfo * np.sin(2 * np.pi * f * 0.998 * t_glob)
+            R += 0.08 * lfo * np.sin(2 * np.pi * f * 1.002 * t_glob)
+    if "bass" in parts:
+        root = PROGRESSION[k % len(PROGRESSION)][0] / 4
+        bass = 0.3 * _events(n, sr, bpm, [0.5, 1.5, 2.5, 3.5],
+                             lambda t: np.sin(2 * np.pi * root * t) * np.exp(-t / 0.12))
+        L += bass
+        R += bass
+
+    return np.stack([L, R], axis=1).astype(np.float32)
+
+
+def render(path, seconds, kind="mix", sr=SR, bpm=BPM, seed=SEED):
+    """Scrive il fixture (WAV 16 bit stereo, come i file grezzi) battuta per battuta."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    n_total = int(round(seconds * sr))
+    tmp = path.with_name(path.stem + ".tmp.wav")
+    with sf.SoundFile(tmp, "w", samplerate=sr, channels=2, subtype="PCM_16") as f:
+        k = 0
+        written = 0
+        while written < n_total:
+            block = render_bar(k, kind, sr=sr, bpm=bpm, seed=seed)[:n_total - written]
+            f.write(np.clip(block, -1.0, 1.0))
+            written += len(block)
+            k += 1
+    tmp.replace(path)
+    return path
+
+
+def render_midi(path, seconds, bpm=BPM, seed=SEED):
+    """MIDI con la progressione del fixture (pad) + una melodia con seed."""
+    import pretty_midi
+
+    rng = np.random.default_rng(seed)
+    bar = bar_seconds(bpm)
+    step = bar / 8
+    pm = pretty_midi.PrettyMIDI(initial_tempo=bpm)
+    pad = pretty_midi.Instrument(program=89)
+    lead = pretty_midi.Instrument(program=81)
+    drums = pretty_midi.Instrument(program=0, is_drum=True)
+    n_bars = max(1, int(np.ceil(seconds / bar)))
+    for k in range(n_bars):
+        t0 = k * bar
+        for p in PROGRESSION_MIDI[k % len(PROGRESSION_MIDI)]:
+            pad.notes.append(pretty_midi.Note(velocity=70, pitch=p, start=t0, end=t0 + bar))
+        scale = np.array(PROGRESSION_MIDI[k % len(PROGRESSION_MIDI)]) + 12
+        for i in range(8):
+            if rng.random() < 0.7:
+                p = int(rng.choice(scale) + rng.choice([0, 2, 12]))
+                lead.notes.append(pretty_midi.Note(velocity=90, pitch=p,
+                                                   start=t0 + i * step, end=t0 + (i + 1) * step))
+        for i in range(4):
+            drums.notes.append(pretty_midi.Note(velocity=100, pitch=36,
+                                                start=t0 + i * bar / 4, end=t0 + i * bar / 4 + 0.1))
+    pm.instruments.extend([pad, lead, drums])
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pm.write(str(path))
+    return path
+
+
+def fixture_set(minutes=(1, 10, 60), loop_seconds=30):
+    """Elenco (nome, kind, secondi): loop e pad brevi + i mix lunghi richiesti."""
+    items = [(f"loop_{loop_seconds}s", "loop", loop_seconds),
+             (f"pad_{loop_seconds}s", "pad", loop_seconds)]
+    items += [(f"mix_{m:g}min", "mix", 60 * m) for m in minutes]
+    return items
+
+
+def ensure_fixtures(out_dir, minutes=(1, 10, 60), loop_seconds=30):
+    """
+    Crea (se mancano) i fixture audio e MIDI in out_dir.
+    Ritorna {nome: {"wav", "mid", "seconds"}}.
+    """
+    out_dir = Path(out_dir) / f"v{FIXTURE_VERSION}"
+    fixtures = {}
+    for name, kind, seconds in fixture_set(minutes, loop_seconds):
+        wav = out_dir / f"{name}.wav"
+        mid = out_dir / f"{name}.mid"
+        if not wav.exists():
+            render(wav, seconds, kind)
+        if not mid.exists():
+            render_midi(mid, seconds)
+        fixtures[name] = {"wav": str(wav), "mid": str(mid), "seconds": float(seconds)}
+    return fixtures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera i fixture sintetici dei benchmark")
+    parser.add_argument("out_dir", nargs="?", default=str(Path(__file__).parent / ".fixtures"))
+    parser.add_argument("--minutes", type=float, nargs="+", default=[1, 10, 60])
+    args = parser.parse_args(argv)
+    for name, info in ensure_fixtures(args.out_dir, args.minutes).items():
+        print(f"{name:16s} {info['seconds']:8.0f}s  {info['wav']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Benchmark delle fasi della pipeline sui fixture sintetici (benchmarks/fixtures.py).
+
+Fasi: clean_techno, summarize_audio, extract_features, wav_to_midi e le
+metriche di rete di Phd/utils.py (grafo degli accordi dal MIDI del fixture).
+Per ogni (fase, fixture) riporta tempo (mediana su --repeat), throughput in
+secondi di audio al secondo e picco di RSS. Ogni misura gira in un processo
+nuovo (spawn), così il picco di RSS è quello della sola fase.
+
+Uso:
+    python benchmarks/pipeline.py run --minutes 1 10 --json bench_new.json
+    python benchmarks/pipeline.py compare bench_old.json bench_new.json
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO))
+
+from benchmarks.fixtures import ensure_fixtures  # noqa: E402
+
+STAGES = ["clean_techno", "summarize_audio", "extract_features", "wav_to_midi", "phd_graph"]
+
+
+# --------------------
+# 1) Misura di una fase (nel processo figlio)
+# --------------------
+def _peak_rss_mb():
+    """Picco di RSS del processo corrente in MB (None se non misurabile)."""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 1024**2
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux: KB, macOS: byte
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def _load_phd_utils():
+    """Phd/utils.py caricato per percorso (il nome "utils" è già il package audio)."""
+    import importlib.util
+
+    spec = importlib.util.spec_from_file_location("phd_utils", REPO / "Phd" / "utils.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["phd_utils"] = module  # i worker dei pool lo cercano per nome
+    spec.loader.exec_module(module)
+    return module
+
+
+def _stage_callable(stage, fixture, tmp_dir):
+    """Import della fase (fuori dal cronometro) e funzione da misurare."""
+    wav = fixture["wav"]
+    if stage == "clean_techno":
+        from utils.AudioCleaning import clean_techno
+        out = os.path.join(tmp_dir, "clean.wav")
+        return lambda: clean_techno(wav, out)
+    if stage == "summarize_audio":
+        from utils.AudioCleaning import summarize_audio
+        return lambda: summarize_audio(wav)
+    if stage == "extract_features":
+        from utils.FeatureExtraction import extract_features
+        return lambda: extract_features(wav)
+    if stage == "wav_to_midi":
+        from utils.wav_to_midi import wav_to_midi
+        out = os.path.join(tmp_dir, "out.mid")
+        return lambda: wav_to_midi(wav, out)
+    if stage == "phd_graph":
+        phd = _load_phd_utils()
+        mid = fixture["mid"]
+        return lambda: phd.compute_midi_network_metrics(mid)
+    raise ValueError(f"Fase sconosciuta: {stage}")
+
+
+def run_stage(stage, fixture):
+    """Eseguita in un processo nuovo: una misura di una fase su un fixture."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        try:
+            fn = _stage_callable(stage, fixture, tmp_dir)
+        except Exception as e:  # ad es. modulo non importabile
+            return {"error": f"{type(e).__name__}: {e}"}
+        rss_before = _peak_rss_mb()
+        t0 = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:
+            return {"error": f"{type(e).__name__}: {e}"}
+        wall = time.perf_counter() - t0
+        rss_after = _peak_rss_mb()
+    return {
+        "wall_s": wall,
+        "peak_rss_mb": rss_after,
+        "rss_delta_mb": None if rss_before is None else rss_after - rss_before,
+    }
+
+
+def measure(stage, name, fixture, repeat=1):
+    ctx = mp.get_context("spawn")
+    runs = []
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            runs.append(pool.submit(run_stage, stage, fixture).result())
+        if "error" in runs[-1]:
+            return {"stage": stage, "fixture": name, "audio_s": fixture["seconds"],
+                    "error": runs[-1]["error"]}
+
+    walls = [r["wall_s"] for r in runs]
+    wall = statistics.median(walls)
+    rss = [r["peak_rss_mb"] for r in runs if r["peak_rss_mb"] is not None]
+    delta = [r["rss_delta_mb"] for r in runs if r["rss_delta_mb"] is not None]
+    return {
+        "stage": stage,
+        "fixture": name,
+        "audio_s": fixture["seconds"],
+        "wall_s": wall,
+        "wall_all_s": walls,
+        "throughput_x": fixture["seconds"] / wall if wall > 0 else None,
+        "peak_rss_mb": max(rss) if rss else None,
+        "rss_delta_mb": max(delta) if delta else None,
+    }
+
+
+# --------------------
+# 2) Metadati e confronto tra run
+# --------------------
+def _meta():
+    import librosa
+    import numpy as np
+    import scipy
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "librosa": librosa.__version__,
+    }
+
+
+def compare(old, new, threshold=0.10):
+    """
+    Righe di confronto per (fase, fixture) presenti in entrambi i run:
+    rapporto nuovo / vecchio di tempo e picco di RSS. regression=True se
+    uno dei due peggiora più di `threshold`.
+    """
+    key = lambda r: (r["stage"], r["fixture"])  # noqa: E731
+    old_rows = {key(r): r for r in old["results"] if "error" not in r}
+    rows = []
+    for r in new["results"]:
+        o = old_rows.get(key(r))
+        if o is None or "error" in r:
+            continue
+        wall_ratio = r["wall_s"] / o["wall_s"] if o["wall_s"] else None
+        rss_ratio = (r["peak_rss_mb"] / o["peak_rss_mb"]
+                     if r.get("peak_rss_mb") and o.get("peak_rss_mb") else None)
+        rows.append({
+            "stage": r["stage"],
+            "fixture": r["fixture"],
+            "wall_old_s": o["wall_s"],
+            "wall_new_s": r["wall_s"],
+            "wall_ratio": wall_ratio,
+            "rss_ratio": rss_ratio,
+            "regression": any(x is not None and x > 1 + threshold
+                              for x in (wall_ratio, rss_ratio)),
+        })
+    return rows
+
+
+# --------------------
+# 3) CLI
+# --------------------
+def _fmt(x, spec):
+    return format(x, spec) if x is not None else "-"
+
+
+def cmd_run(args):
+    fixtures_dir = args.fixtures_dir or str(Path(__file__).parent / ".fixtures")
+    fixtures = ensure_fixtures(fixtures_dir, minutes=args.minutes)
+    names = args.fixtures or list(fixtures)
+
+    results = []
+    print(f"{'stage':18s} {'fixture':14s} {'wall[s]':>9s} {'x rt':>8s} {'rss[MB]':>9s}")
+    for stage in args.stages:
+        for name in names:
+            r = measure(stage, name, fixtures[name], repeat=args.repeat)
+            results.append(r)
+            if "error" in r:
+                print(f"{stage:18s} {name:14s} ERRORE: {r['error']}")
+            else:
+                print(f"{stage:18s} {name:14s} {r['wall_s']:9.2f} "
+                      f"{_fmt(r['throughput_x'], '8.1f')} {_fmt(r['peak_rss_mb'], '9.0f')}")
+
+    params = {k: v for k, v in vars(args).items() if k != "func"}
+    report = {"meta": _meta(), "params": params, "results": results}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+
+
+def cmd_compare(args):
+    with open(args.old, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    rows = compare(old, new, threshold=args.threshold)
+    print(f"{'stage':18s} {'fixture':14s} {'old[s]':>8s} {'new[s]':>8s} "
+          f"{'t new/old':>10s} {'rss new/old':>12s}")
+    for r in rows:
+        flag = "  REGRESSIONE" if r["regression"] else ""
+        print(f"{r['stage']:18s} {r['fixture']:14s} {r['wall_old_s']:8.2f} {r['wall_new_s']:8.2f} "
+              f"{_fmt(r['wall_ratio'], '10.2f')} {_fmt(r['rss_ratio'], '12.2f')}{flag}")
+    if any(r["regression"] for r in rows):
+        sys.exit(1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("run", help="esegue i benchmark")
+    p.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    p.add_argument("--minutes", type=float, nargs="+", default=[1, 10, 60],
+                   help="durate dei mix sintetici")
+    p.add_argument("--fixtures", nargs="+", help="solo questi fixture (es. mix_1min)")
+    p.add_argument("--fixtures-dir", help="default: benchmarks/.fixtures")
+    p.add_argument("--repeat", type=int, default=1)
+    p.add_argument("--json", help="salva i risultati in questo file")
+    p.set_defaults(func=cmd_run)
+
+    p = sub.add_parser("compare", help="confronta due run salvati con --json")
+    p.add_argument("old")
+    p.add_argument("new")
+    p.add_argument("--threshold", type=float, default=0.10,
+                   help="peggioramento relativo oltre cui segnalare (default 10%%)")
+    p.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
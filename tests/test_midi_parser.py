@@ -0,0 +1,181 @@
+"""
+Parity of the byte-level SMF parser in Phd/utils.py (_parse_midi_notes) with
+pretty_midi.PrettyMIDI, on hand-built files covering the cases where the two
+could drift apart, on randomized files and on the MIDI files in Phd/.
+
+Run with:  python -m pytest -q tests
+"""
+import importlib.util
+import struct
+import sys
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pretty_midi = pytest.importorskip("pretty_midi")
+
+REPO = Path(__file__).resolve().parents[1]
+
+
+def _load_phd_utils():
+    # loaded by path: the name "utils" is already the audio package
+    if "phd_utils" not in sys.modules:
+        spec = importlib.util.spec_from_file_location("phd_utils", REPO / "Phd" / "utils.py")
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["phd_utils"] = module
+        spec.loader.exec_module(module)
+    return sys.modules["phd_utils"]
+
+
+phd = _load_phd_utils()
+
+
+# Minimal SMF writer: events are (delta_ticks, bytes), written as given, so a
+# test can omit status bytes (running status) or use any message it likes.
+def _vlq(n):
+    out = [n & 0x7F]
+    n >>= 7
+    while n:
+        out.append(0x80 | (n & 0x7F))
+        n >>= 7
+    return bytes(reversed(out))
+
+
+def _track(events):
+    body = b"".join(_vlq(delta) + msg for delta, msg in events) + b"\x00\xff\x2f\x00"
+    return b"MTrk" + struct.pack(">L", len(body)) + body
+
+
+def _smf(tracks, resolution=480, fmt=1):
+    header = b"MThd" + struct.pack(">LHHH", 6, fmt, len(tracks), resolution)
+    return header + b"".join(_track(t) for t in tracks)
+
+
+def _tempo(bpm):
+    return b"\xff\x51\x03" + int(round(6e7 / bpm)).to_bytes(3, "big")
+
+
+def _on(ch, pitch, vel):
+    return bytes([0x90 | ch, pitch, vel])
+
+
+def _off(ch, pitch, vel=64):
+    return bytes([0x80 | ch, pitch, vel])
+
+
+def _program(ch, program):
+    return bytes([0xC0 | ch, program])
+
+
+def _assert_parity(data, tmp_path):
+    path = tmp_path / "case.mid"
+    path.write_bytes(data)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")   # pretty_midi warns on tempo events outside track 0
+        expected = phd._notes_from_pretty_midi(str(path))
+    got = phd._parse_midi_notes(data)
+
+    assert len(got) == len(expected)
+    for field in ("instrument", "is_drum", "pitch", "velocity"):
+        np.testing.assert_array_equal(got[field], expected[field], err_msg=field)
+    for field in ("start", "end"):
+        np.testing.assert_allclose(got[field], expected[field], rtol=0, atol=1e-9, err_msg=field)
+    return got
+
+
+def test_running_status(tmp_path):
+    # after the first note-on the status byte is omitted; 0x80 switches to
+    # note-off and is reused too; a meta event does not reset running status
+    events = [
+        (0, _on(0, 60, 100)), (0, bytes([64, 90])), (0, bytes([67, 80])),
+        (240, _off(0, 60)), (0, bytes([64, 0])), (0, b"\xff\x01\x01x"), (0, bytes([67, 0])),
+        (0, _on(0, 62, 70)), (480, bytes([62, 0])),
+    ]
+    notes = _assert_parity(_smf([events], fmt=0), tmp_path)
+    assert len(notes) == 4
+
+
+def test_note_on_velocity_zero_is_note_off(tmp_path):
+    events = [
+        (0, _on(1, 48, 100)), (120, _on(1, 48, 0)),
+        (0, _on(1, 50, 90)), (120, _off(1, 50)),
+        (0, _on(1, 52, 80)), (60, _on(1, 52, 0)),
+    ]
+    notes = _assert_parity(_smf([events], fmt=0), tmp_path)
+    assert len(notes) == 3
+
+
+def test_overlapping_same_pitch(tmp_path):
+    # two note-ons before a single note-off close together; a note-on at the
+    # same tick as the note-off stays open until the next note-off
+    events = [
+        (0, _on(0, 60, 100)), (100, _on(0, 60, 90)), (100, _off(0, 60)),
+        (0, _on(0, 60, 80)), (0, _off(0, 60)), (0, _on(0, 60, 70)),
+        (200, _off(0, 60)),
+        (50, _off(0, 61)),                      # note-off without a note-on: ignored
+        (0, _on(0, 62, 60)), (0, _off(0, 62)),  # zero-length note: dropped
+    ]
+    _assert_parity(_smf([events], fmt=0), tmp_path)
+
+
+def test_tempo_changes(tmp_path):
+    # tempo map in track 0 (with a change at tick 0 and a repeated value);
+    # a tempo event in another track is ignored, as in pretty_midi
+    conductor = [(0, _tempo(120)), (0, _tempo(100)), (960, _tempo(140)),
+                 (480, _tempo(140)), (480, _tempo(90))]
+    notes = [(0, _tempo(60))] + [
+        ev for k in range(16)
+        for ev in ((0 if k else 10, _on(0, 60 + k % 12, 100)), (230, _off(0, 60 + k % 12)))
+    ]
+    _assert_parity(_smf([conductor, notes]), tmp_path)
+
+
+def test_program_changes_per_channel(tmp_path):
+    # each (program, channel, track) is its own instrument, drums on channel 9
+    track1 = [
+        (0, _program(0, 5)), (0, _program(1, 33)),
+        (0, _on(0, 60, 100)), (0, _on(1, 40, 100)), (0, _on(9, 36, 100)),
+        (240, _off(0, 60)), (0, _off(1, 40)), (0, _off(9, 36)),
+        (0, _program(0, 81)),
+        (0, _on(0, 64, 100)), (240, _off(0, 64)),
+    ]
+    track2 = [(0, _program(0, 5)), (120, _on(0, 67, 100)), (120, _off(0, 67))]
+    notes = _assert_parity(_smf([[(0, _tempo(128))], track1, track2]), tmp_path)
+    assert len(np.unique(notes["instrument"])) == 5
+    assert notes["is_drum"][notes["pitch"] == 36].all()
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_files(tmp_path, seed):
+    rng = np.random.default_rng(seed)
+    tracks = [[(0, _tempo(rng.uniform(60, 180)))]
+              + [(int(rng.integers(0, 2000)), _tempo(rng.uniform(60, 180))) for _ in range(3)]]
+    for _ in range(int(rng.integers(1, 4))):
+        events, status = [], None
+        for _ in range(200):
+            ch = int(rng.choice([0, 1, 9]))
+            pitch = int(rng.integers(58, 64))   # few pitches: many overlaps
+            r = rng.random()
+            if r < 0.05:
+                msg = _program(ch, int(rng.integers(0, 128)))
+            elif r < 0.55:
+                msg = _on(ch, pitch, int(rng.integers(1, 128)))
+            elif r < 0.75:
+                msg = _on(ch, pitch, 0)
+            else:
+                msg = _off(ch, pitch)
+            delta = int(rng.integers(0, 60)) if rng.random() < 0.7 else 0
+            if msg[0] == status and rng.random() < 0.5:
+                events.append((delta, msg[1:]))   # running status
+            else:
+                events.append((delta, msg))
+            status = msg[0]
+        tracks.append(events)
+    _assert_parity(_smf(tracks, resolution=int(rng.choice([96, 220, 480]))), tmp_path)
+
+
+@pytest.mark.parametrize("path", sorted((REPO / "Phd").glob("*.mid")), ids=lambda p: p.name)
+def test_repo_midi_files(tmp_path, path):
+    _assert_parity(path.read_bytes(), tmp_path)
@@ -1,11 +1,21 @@
+import multiprocessing as mp
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import librosa
 import soundfile as sf
 import numpy as np
-from scipy.signal import butter, filtfilt
+from scipy.signal import butter, filtfilt, sosfilt, sosfilt_zi
 import noisereduce as nr
 from pathlib import Path
 from tqdm import tqdm
 
+from utils.AudioLoading import iter_audio_blocks, load_audio, set_cache_limit
+from utils.Instrumentation import stage
+from utils.Manifest import is_up_to_date, load_manifest, params_hash, save_manifest
+from utils.Spectrogram import power_spectrogram
+
 # --------------------
 # 1) Band-pass filter
 # --------------------
@@ -85,6 +95,9 @@ def clean_techno(
     highcut=18000.0,
     trim_edges=False,
     trim_db=40.0,
+    streaming=False,
+    block_size=2**18,
+    res_quality="high",
 ):
     """
     Pipeline di pulizia pensata per tracce techno intere.
@@ -93,11 +106,63 @@ def clean_techno(
     - use_mono: True = mix in mono (consigliato per l'analisi)
     - band-pass: 30–18000 Hz di default, abbastanza morbido
     - niente denoise: evitiamo ovattamento nei momenti forti
+    - streaming: True = elaborazione a blocchi di `block_size` campioni,
+      memoria costante anche per mix di ore (vedi clean_techno_streaming)
+    - res_quality: qualità del ricampionamento (RESAMPLE_TIERS in AudioLoading)
     """
+    if streaming:
+        if trim_edges:
+            raise ValueError("trim_edges non è supportato in modalità streaming")
+        # lettura, filtro e scrittura sono intercalati: un'unica fase
+        with stage("filter", "clean_techno", streaming=True):
+            return clean_techno_streaming(
+                in_path,
+                out_path,
+                sr=sr,
+                use_mono=use_mono,
+                apply_bandpass=apply_bandpass,
+                lowcut=lowcut,
+                highcut=highcut,
+                block_size=block_size,
+                res_quality=res_quality,
+            )
 
     # 1. Carica audio (mono o stereo)
-    y, sr = librosa.load(in_path, sr=sr, mono=use_mono)
+    with stage("load", "clean_techno"):
+        y, sr = load_audio(in_path, sr=sr, mono=use_mono, res_quality=res_quality)
+
+    # 2–5. Trim, normalizzazione, band-pass, normalizzazione finale
+    with stage("filter", "clean_techno"):
+        y = clean_signal(
+            y,
+            sr,
+            apply_bandpass=apply_bandpass,
+            lowcut=lowcut,
+            highcut=highcut,
+            trim_edges=trim_edges,
+            trim_db=trim_db,
+        )
 
+    # 6. Salvataggio
+    with stage("write", "clean_techno"):
+        write_audio(out_path, y, sr)
+
+    return out_path
+
+
+def clean_signal(
+    y,
+    sr,
+    apply_bandpass=True,
+    lowcut=30.0,
+    highcut=18000.0,
+    trim_edges=False,
+    trim_db=40.0,
+):
+    """
+    La parte in memoria di clean_techno: stesso risultato, ma su un segnale
+    già decodificato (mono 1D o stereo (canali, campioni)).
+    """
     # 2. (Opzionale) trim ai bordi, ma di default lo lascio spento per techno
     if trim_edges:
         if y.ndim == 1:
@@ -122,32 +187,286 @@ def clean_techno(
     # 5. Normalizzazione finale (dopo il filtro i picchi cambiano)
     y = normalize_peak(y, peak_target=0.99)
 
-    # 6. Salvataggio
-    # se use_mono=True → y è 1D; se False → 2D (canali, campioni)
+    return y
+
+
+def write_audio(out_path, y, sr):
+    """Salva come in clean_techno: y 1D (mono) o 2D (canali, campioni)."""
     if y.ndim == 1:
         sf.write(out_path, y.astype(np.float32), sr)
     else:
         # soundfile accetta (n_samples, n_channels), quindi trasponiamo
         sf.write(out_path, y.T.astype(np.float32), sr)
 
+
+# --------------------
+# 3b) Versione streaming (mix lunghi, memoria limitata)
+# --------------------
+def _bandpass_sos(sr, lowcut, highcut, order=4):
+    nyq = 0.5 * sr
+    return butter(order, [lowcut / nyq, highcut / nyq], btype="band", output="sos")
+
+
+def _odd_padlen(sos):
+    # stessa lunghezza di padding di scipy.signal.sosfiltfilt
+    ntaps = 2 * len(sos) + 1
+    ntaps -= min((sos[:, 2] == 0).sum(), (sos[:, 5] == 0).sum())
+    return 3 * ntaps
+
+
+def _read_frames(f, start, n, n_channels):
+    f.seek(start * n_channels * 4)
+    return np.fromfile(f, dtype=np.float32, count=n * n_channels).reshape(n, n_channels)
+
+
+def _write_frames(f, start, x):
+    f.seek(start * x.shape[1] * 4)
+    f.write(np.ascontiguousarray(x, dtype=np.float32).tobytes())
+
+
+def clean_techno_streaming(
+    in_path,
+    out_path,
+    sr=44100,
+    use_mono=True,
+    apply_bandpass=True,
+    lowcut=30.0,
+    highcut=18000.0,
+    block_size=2**18,
+    peak_target=0.99,
+    res_quality="high",
+):
+    """
+    Come clean_techno, ma a blocchi: la memoria dipende da block_size,
+    non dalla durata del brano.
+
+    1. lettura a blocchi con soundfile (+ ricampionamento soxr con stato)
+    2. band-pass a fase zero in due passate con stato (come sosfiltfilt):
+       avanti mentre si legge, indietro sul file temporaneo
+    3. normalizzazione di picco in due passate: il picco si misura durante
+       la passata all'indietro, la scala si applica scrivendo l'output
+
+    La normalizzazione iniziale di clean_techno non serve: il filtro è
+    lineare, quindi conta solo quella finale. Il filtro usa la forma
+    in sezioni del secondo ordine (sos), numericamente più stabile della
+    (b, a) di bandpass_filter: la differenza è sotto la risoluzione a 16 bit.
+    Il file temporaneo (float32) viene creato accanto a out_path.
+    """
+    out_path = Path(out_path)
+    sos = _bandpass_sos(sr, lowcut, highcut) if apply_bandpass else None
+    padlen = _odd_padlen(sos) if apply_bandpass else 0
+
+    fd, tmp_name = tempfile.mkstemp(suffix=".f32", dir=out_path.parent)
+    os.close(fd)
+    try:
+        with open(tmp_name, "w+b") as tmp:
+            # ---- passata 1: lettura + filtro in avanti -> file temporaneo
+            n = 0             # campioni del segnale (senza padding)
+            n_channels = None
+            zi = None
+            pos = 0           # campioni scritti nel temporaneo
+            tail = None       # ultimi padlen+1 campioni letti (per il padding finale)
+            head = []         # primi campioni, finché non bastano per il padding iniziale
+
+            def forward(x):
+                nonlocal zi, pos
+                if sos is not None:
+                    x, zi = sosfilt(sos, x, axis=0, zi=zi)
+                _write_frames(tmp, pos, x)
+                pos += len(x)
+
+            for block in iter_audio_blocks(in_path, sr=sr, mono=use_mono,
+                                           block_size=block_size, res_quality=res_quality):
+                x = block.reshape(len(block), -1).astype(np.float64)
+                n_channels = x.shape[1]
+                n += len(x)
+                tail = x[-(padlen + 1):] if tail is None else \
+                    np.concatenate([tail, x])[-(padlen + 1):]
+
+                if zi is None and sos is not None:
+                    # aspetta di avere abbastanza campioni per l'estensione dispari
+                    head.append(x)
+                    if sum(len(h) for h in head) <= padlen:
+                        continue
+                    x = np.concatenate(head)
+                    head = []
+                    pre = 2 * x[0] - x[padlen:0:-1]
+                    zi = sosfilt_zi(sos)[:, :, None] * pre[0]
+                    forward(pre)
+                forward(x)
+
+            if n_channels is None:
+                raise ValueError(f"file audio vuoto: {in_path}")
+            if head:
+                raise ValueError(f"brano troppo corto per il band-pass: {in_path}")
+
+            if sos is not None:
+                post = 2 * tail[-1] - tail[-2::-1][:padlen]
+                forward(post)
+
+            # ---- passata 2: filtro all'indietro (in place) + misura del picco
+            peak = 0.0
+            if sos is not None:
+                zi = None
+                end = pos
+                while end > 0:
+                    start = max(0, end - block_size)
+                    x = _read_frames(tmp, start, end - start, n_channels)
+                    x = x[::-1].astype(np.float64)
+                    if zi is None:
+                        zi = sosfilt_zi(sos)[:, :, None] * x[0]
+                    x, zi = sosfilt(sos, x, axis=0, zi=zi)
+                    x = x[::-1]
+                    _write_frames(tmp, start, x)
+                    # il picco va misurato solo sul segnale, non sul padding
+                    lo, hi = max(start, padlen), min(end, padlen + n)
+                    if hi > lo:
+                        peak = max(peak, float(np.max(np.abs(x[lo - start:hi - start]))))
+                    end = start
+            else:
+                for start in range(0, n, block_size):
+                    x = _read_frames(tmp, start, min(block_size, n - start), n_channels)
+                    peak = max(peak, float(np.max(np.abs(x))))
+
+            # ---- passata 3: scala e scrittura a blocchi
+            scale = peak_target / peak if peak > 0 else 1.0
+            with sf.SoundFile(out_path, "w", samplerate=sr, channels=n_channels) as out:
+                for start in range(0, n, block_size):
+                    k = min(block_size, n - start)
+                    x = _read_frames(tmp, padlen + start, k, n_channels) * np.float32(scale)
+                    out.write(x[:, 0] if n_channels == 1 else x)
+    finally:
+        os.remove(tmp_name)
+
     return out_path
 
-def summarize_audio(path, sr=44100):
-    y, sr = librosa.load(path, sr=sr, mono=True)
 
+# --------------------
+# 4) Batch: pulizia di un'intera cartella su un pool di processi
+# --------------------
+_DECODE_SLOTS = None
+
+
+def _init_clean_worker(decode_slots):
+    global _DECODE_SLOTS
+    _DECODE_SLOTS = decode_slots
+    # ogni worker decodifica file diversi: la cache dei segnali non servirebbe
+    set_cache_limit(0)
+
+
+def _clean_one(in_path, out_path, params):
+    # al massimo `max_decodes` brani decodificati in memoria nello stesso momento
+    if _DECODE_SLOTS is None:
+        return clean_techno(in_path, out_path, **params)
+    with _DECODE_SLOTS:
+        return clean_techno(in_path, out_path, **params)
+
+
+def clean_crate(
+    raw_dir,
+    clean_dir,
+    pattern="*.wav",
+    n_jobs=None,
+    max_decodes=None,
+    manifest_path=None,
+    force=False,
+    **params,
+):
+    """
+    Applica clean_techno a tutti i file di raw_dir, in parallelo e in modo ripristinabile.
+
+    - n_jobs:       numero di processi (default: tutti i core)
+    - max_decodes:  massimo numero di brani decodificati contemporaneamente,
+                    per tenere limitato il picco di RSS (default: n_jobs)
+    - manifest:     JSON in clean_dir (o manifest_path) con, per ogni file,
+                    hash dei parametri, stato ("ok" / "failed") ed eventuale errore
+    - un file viene saltato se l'output esiste, è più recente dell'input e
+      il manifest riporta lo stesso hash dei parametri (force=True rifà tutto)
+    - params: gli stessi argomenti di clean_techno (sr, use_mono, lowcut, ...)
+
+    Ritorna un dict {"done": [...], "skipped": [...], "failed": {nome: errore}}.
+    """
+    raw_dir = Path(raw_dir)
+    clean_dir = Path(clean_dir)
+    clean_dir.mkdir(parents=True, exist_ok=True)
+    if manifest_path is None:
+        manifest_path = clean_dir / "clean_manifest.json"
+
+    n_jobs = n_jobs or os.cpu_count() or 1
+    max_decodes = max_decodes or n_jobs
+    params_key = params_hash(params)
+    manifest = load_manifest(manifest_path)
+
+    todo, skipped = [], []
+    for in_path in sorted(raw_dir.glob(pattern)):
+        out_path = clean_dir / in_path.name
+        entry = manifest.get(in_path.name)
+        if not force and is_up_to_date(in_path, out_path, entry, params_key):
+            skipped.append(in_path.name)
+        else:
+            todo.append((in_path, out_path))
+
+    done, failed = [], {}
+    if todo:
+        ctx = mp.get_context()
+        decode_slots = ctx.BoundedSemaphore(max_decodes)
+        with ProcessPoolExecutor(
+            max_workers=min(n_jobs, len(todo)),
+            mp_context=ctx,
+            initializer=_init_clean_worker,
+            initargs=(decode_slots,),
+        ) as pool:
+            futures = {
+                pool.submit(_clean_one, str(in_path), str(out_path), params): in_path
+                for in_path, out_path in todo
+            }
+            for fut in tqdm(as_completed(futures), total=len(futures)):
+                in_path = futures[fut]
+                try:
+                    fut.result()
+                    manifest[in_path.name] = {"status": "ok", "params": params_key}
+                    done.append(in_path.name)
+                except Exception as e:  # un file rotto non deve fermare il batch
+                    manifest[in_path.name] = {
+                        "status": "failed",
+                        "params": params_key,
+                        "error": f"{type(e).__name__}: {e}",
+                    }
+                    failed[in_path.name] = manifest[in_path.name]["error"]
+                save_manifest(manifest, manifest_path)
+
+    return {"done": done, "skipped": skipped, "failed": failed}
+
+def summarize_audio(path, sr=44100, cache=None, n_threads=1):
+    """
+    Riassunto globale (livello, descrittori spettrali, primi 5 MFCC) di un file.
+    cache: SpectrogramCache opzionale, per non ricalcolare la STFT a ogni run.
+    n_threads: STFT a blocchi su più thread (risultato identico).
+    """
+    with stage("load", "summarize_audio"):
+        y, sr = load_audio(path, sr=sr, mono=True)
+    return summarize_signal(y, sr, cache=cache, n_threads=n_threads)
+
+
+def summarize_signal(y, sr=44100, cache=None, n_threads=1):
+    """Come summarize_audio, ma su un segnale mono già decodificato."""
     # livello globale
     rms_global = np.sqrt(np.mean(y**2))
 
     # STFT per feature spettrali
-    S = np.abs(librosa.stft(y, n_fft=2048, hop_length=512)) ** 2
+    with stage("stft", "summarize_audio"):
+        S = power_spectrogram(y, sr, n_fft=2048, hop_length=512, cache=cache,
+                              n_threads=n_threads)
 
-    centroid = librosa.feature.spectral_centroid(S=S, sr=sr)[0]
-    bandwidth = librosa.feature.spectral_bandwidth(S=S, sr=sr)[0]
-    rolloff = librosa.feature.spectral_rolloff(S=S, sr=sr, roll_percent=0.85)[0]
-    flatness = librosa.feature.spectral_flatness(S=S)[0]
+    with stage("spectral", "summarize_audio"):
+        centroid = librosa.feature.spectral_centroid(S=S, sr=sr)[0]
+        bandwidth = librosa.feature.spectral_bandwidth(S=S, sr=sr)[0]
+        rolloff = librosa.feature.spectral_rolloff(S=S, sr=sr, roll_percent=0.85)[0]
+        flatness = librosa.feature.spectral_flatness(S=S)[0]
 
     # MFCC (primi 5 come riassunto timbrico grossolano)
-    mfcc = librosa.feature.mfcc(S=librosa.power_to_db(S + 1e-10), sr=sr, n_mfcc=5)
+    with stage("mfcc", "summarize_audio"):
+        mfcc = librosa.feature.mfcc(S=librosa.power_to_db(S + 1e-10), sr=sr, n_mfcc=5)
 
     summary = {
         "rms": rms_global,
@@ -162,4 +481,24 @@ def summarize_audio(path, sr=44100):
     for i in range(mfcc.shape[0]):
         summary[f"mfcc{i+1}_mean"] = np.mean(mfcc[i])
 
-    return summary
\ No newline at end of file
+    return summary
+
+
+# --------------------
+# Confronto RAW vs CLEAN (spettro medio, MFCC medi)
+# --------------------
+def mean_spectrum(y, sr, n_fft=4096, hop_length=1024, cache=None):
+    """Spettro medio in dB per frequenza (per i plot RAW vs CLEAN)."""
+    S = power_spectrogram(y, sr, n_fft=n_fft, hop_length=hop_length, cache=cache)
+    S_db = librosa.power_to_db(S + 1e-10)
+    mean_db = np.mean(S_db, axis=1)
+    freqs = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
+    return freqs, mean_db
+
+
+def mean_mfcc(y, sr, n_mfcc=13, n_fft=2048, hop_length=512, cache=None):
+    """MFCC medi sul brano (per i plot RAW vs CLEAN)."""
+    S = power_spectrogram(y, sr, n_fft=n_fft, hop_length=hop_length, cache=cache)
+    MF = librosa.feature.mfcc(S=librosa.power_to_db(S + 1e-10),
+                              sr=sr, n_mfcc=n_mfcc)
+    return np.mean(MF, axis=1)
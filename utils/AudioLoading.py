@@ -0,0 +1,268 @@
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+import librosa
+import numpy as np
+import soundfile as sf
+import soxr
+
+
+# Livelli di qualità del ricampionamento -> res_type di librosa.
+# "high" è il default di librosa.load ('soxr_hq').
+RESAMPLE_TIERS = {
+    "best": "soxr_vhq",
+    "high": "soxr_hq",
+    "medium": "soxr_mq",
+    "low": "soxr_lq",
+    "draft": "soxr_qq",
+}
+
+
+# --------------------
+# 1) Lettura a blocchi (streaming)
+# --------------------
+def iter_audio_blocks(path, sr=44100, mono=True, block_size=2**18, res_quality="high"):
+    """
+    Legge un file audio a blocchi con soundfile, senza mai caricarlo tutto.
+
+    - sr:        frequenza di uscita (None = quella nativa del file)
+    - mono:      media dei canali, come librosa.to_mono
+    - res_quality: livello di RESAMPLE_TIERS ("high" = default di librosa.load,
+      'soxr_hq') oppure una qualità di soxr ("VHQ", "HQ", ...)
+
+    Il ricampionamento usa un resampler soxr con stato, quindi i blocchi
+    concatenati equivalgono al ricampionamento del file intero; come
+    librosa.resample, l'uscita è portata a ceil(n * sr / sr_nativa) campioni
+    (zeri in coda se soxr ne produce uno in meno), così la lunghezza coincide
+    con quella di librosa.load.
+    Ogni blocco è float32: shape (n,) se mono, (n, canali) altrimenti.
+    """
+    with sf.SoundFile(path) as f:
+        n_channels = 1 if mono else f.channels
+        resampler = None
+        if sr is not None and sr != f.samplerate:
+            quality = RESAMPLE_TIERS.get(res_quality, res_quality)
+            quality = quality[5:].upper() if quality.startswith("soxr_") else quality
+            resampler = soxr.ResampleStream(
+                f.samplerate, sr, n_channels, dtype="float32", quality=quality
+            )
+
+        n_in = n_out = 0
+        for block in f.blocks(blocksize=block_size, dtype="float32", always_2d=True):
+            if mono:
+                block = block.mean(axis=1)
+            if resampler is not None:
+                n_in += len(block)
+                block = resampler.resample_chunk(block, last=False)
+                n_out += len(block)
+            if len(block) > 0:
+                yield block
+
+        if resampler is not None:
+            shape = (0,) if mono else (0, n_channels)
+            tail = resampler.resample_chunk(np.zeros(shape, dtype=np.float32), last=True)
+            # stessa lunghezza di librosa.resample (fix_length a ceil(n * ratio))
+            expected = int(np.ceil(n_in * (float(sr) / f.samplerate)))
+            missing = max(0, expected - n_out)
+            tail = tail[:missing]
+            if len(tail) < missing:
+                pad = ((0, missing - len(tail)),) + ((0, 0),) * (tail.ndim - 1)
+                tail = np.pad(tail, pad)
+            if len(tail) > 0:
+                yield tail
+
+
+# --------------------
+# 2) Caricamento intero con cache LRU
+# --------------------
+class _DecodedCache:
+    """
+    Cache LRU in memoria dei segnali decodificati, limitata in byte.
+    Gli array sono in sola lettura: chi li riceve non può modificarli per errore
+    (e.copy() quando serve un buffer scrivibile).
+    """
+
+    def __init__(self, max_bytes=512 * 1024**2):
+        self.max_bytes = int(max_bytes)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item
+
+    def put(self, key, y, sr):
+        if y.nbytes > self.max_bytes:
+            return
+        y.setflags(write=False)
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = (y, sr)
+            self._bytes += y.nbytes
+            while self._bytes > self.max_bytes:
+                _, (old, _) = self._entries.popitem(last=False)
+                self._bytes -= old.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def info(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes,
+                    "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses}
+
+
+_CACHE = _DecodedCache()
+
+
+def set_cache_limit(max_bytes):
+    """Limite della cache dei segnali decodificati (0 = disattivata)."""
+    _CACHE.max_bytes = int(max_bytes)
+    if max_bytes <= 0:
+        _CACHE.clear()
+
+
+def clear_cache():
+    _CACHE.clear()
+
+
+def cache_info():
+    return _CACHE.info()
+
+
+def load_audio(path, sr=44100, mono=True, res_quality="high", cache=True, mmap=False):
+    """
+    Come librosa.load(path, sr=sr, mono=mono), con lo stesso risultato, ma:
+
+    - se il file è già alla sr richiesta (o sr=None) nessun ricampionamento:
+      lettura diretta con soundfile
+    - res_quality: livello di RESAMPLE_TIERS ("best", "high", "medium", "low",
+      "draft") oppure un res_type di librosa; "high" = default di librosa.load
+    - cache: i segnali decodificati restano in una cache LRU in memoria
+      (chiave: path, mtime, dimensione e parametri), quindi ricaricare lo
+      stesso file è quasi gratuito; l'array ritornato è in sola lettura
+    - mmap: per WAV float32 non compressi che non richiedono conversioni
+      (sr nativa, mono già mono) ritorna una memory-map del file, senza copia
+      (vedi wav_memmap); negli altri casi si comporta come mmap=False
+
+    Output come librosa.load: (y, sr), y float32 (n,) se mono, (canali, n) altrimenti.
+    """
+    path = os.fspath(path)
+    res_type = RESAMPLE_TIERS.get(res_quality, res_quality)
+
+    if mmap:
+        y = _wav_memmap_if_direct(path, sr, mono)
+        if y is not None:
+            return y
+
+    key = None
+    if cache and _CACHE.max_bytes > 0:
+        st = os.stat(path)
+        key = (os.path.abspath(path), st.st_mtime_ns, st.st_size, sr, mono, res_type)
+        item = _CACHE.get(key)
+        if item is not None:
+            return item
+
+    try:
+        data, sr_native = sf.read(path, dtype="float32", always_2d=True)
+    except sf.LibsndfileError:
+        # formati non supportati da libsndfile: decodifica di librosa (audioread)
+        y, sr_out = librosa.load(path, sr=sr, mono=mono, res_type=res_type)
+    else:
+        y = data.mean(axis=1) if mono else data.T
+        sr_out = sr_native
+        if sr is not None and sr != sr_native:
+            y = librosa.resample(y, orig_sr=sr_native, target_sr=sr, res_type=res_type)
+            sr_out = sr
+        if not mono and y.shape[0] == 1:
+            y = y[0]  # come librosa: un file mono con mono=False resta 1D
+
+    if key is not None:
+        _CACHE.put(key, y, sr_out)
+    return y, sr_out
+
+
+# --------------------
+# 3) Memory-map di WAV non compressi
+# --------------------
+_WAV_DTYPES = {
+    (1, 8): np.uint8,
+    (1, 16): np.dtype("<i2"),
+    (1, 32): np.dtype("<i4"),
+    (3, 32): np.dtype("<f4"),
+    (3, 64): np.dtype("<f8"),
+}
+
+
+def wav_memmap(path):
+    """
+    Campioni di un WAV non compresso (PCM o float) come memory-map di sola
+    lettura, senza decodifica né copia: ritorna (frames, sr), frames di shape
+    (n, canali) nel tipo nativo del file (es. int16 per PCM_16).
+    ValueError se il file non è un WAV mappabile (compresso, 24 bit, RF64...).
+    """
+    path = os.fspath(path)
+    with open(path, "rb") as f:
+        riff, _, wave = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave != b"WAVE":
+            raise ValueError(f"{path}: non è un file WAV RIFF")
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path}: chunk 'data' non trovato")
+            chunk_id, size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                body = f.read(size)
+                tag, channels, sr, _, _, bits = struct.unpack("<HHIIHH", body[:16])
+                if tag == 0xFFFE and size >= 40:  # WAVE_FORMAT_EXTENSIBLE
+                    tag = struct.unpack("<H", body[24:26])[0]
+                fmt = (tag, channels, sr, bits)
+                if size % 2:
+                    f.seek(1, os.SEEK_CUR)
+            elif chunk_id == b"data":
+                offset = f.tell()
+                break
+            else:
+                f.seek(size + size % 2, os.SEEK_CUR)
+
+    if fmt is None:
+        raise ValueError(f"{path}: chunk 'fmt ' mancante")
+    tag, channels, sr, bits = fmt
+    dtype = _WAV_DTYPES.get((tag, bits))
+    if dtype is None:
+        raise ValueError(f"{path}: formato WAV {tag}/{bits} bit non mappabile")
+    itemsize = np.dtype(dtype).itemsize
+    # dimensione reale (alcuni writer lasciano size del chunk errata)
+    n = min(size, os.path.getsize(path) - offset) // (itemsize * channels)
+    frames = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(n, channels))
+    return frames, sr
+
+
+def _wav_memmap_if_direct(path, sr, mono):
+    """(y, sr) in memory-map se il file si può usare così com'è, altrimenti None."""
+    try:
+        frames, sr_native = wav_memmap(path)
+    except (ValueError, OSError, struct.error):
+        return None
+    if frames.dtype != np.float32 or (sr is not None and sr != sr_native):
+        return None
+    if frames.shape[1] == 1:
+        return frames[:, 0], sr_native
+    if mono:
+        return None
+    return frames.T, sr_native
@@ -0,0 +1,227 @@
+import hashlib
+import json
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import joblib
+import numpy as np
+
+from utils.Projection import fit_projection
+from utils.TrajectoryStore import TrajectoryStore
+
+
+# --------------------
+# 1) Landmark stratificati
+# --------------------
+def stratified_landmarks(n_frames, n_landmarks, min_per_track=50, seed=0):
+    """
+    Righe (indici globali, ordinati) di un sottoinsieme di frame stratificato:
+    - per brano: quota proporzionale al numero di frame (almeno min_per_track,
+      o tutti i frame se il brano è più corto)
+    - nel brano: un frame a caso in ognuno di `quota` intervalli di tempo
+      uguali, così ogni sezione (intro, drop, break, ...) è rappresentata.
+
+    n_frames: numero di frame di ogni brano (ordine delle righe dello store).
+    """
+    n_frames = np.asarray(n_frames, dtype=np.int64)
+    total = int(n_frames.sum())
+    if n_landmarks >= total:
+        return np.arange(total)
+    rng = np.random.default_rng(seed)
+    quota = np.maximum(np.round(n_frames * (n_landmarks / total)).astype(np.int64), min_per_track)
+    quota = np.minimum(quota, n_frames)
+
+    offsets = np.concatenate(([0], np.cumsum(n_frames)[:-1]))
+    rows = []
+    for start, n, q in zip(offsets, n_frames, quota):
+        if q == 0:
+            continue
+        edges = np.linspace(0, n, q + 1)
+        lo = np.floor(edges[:-1]).astype(np.int64)
+        hi = np.maximum(np.floor(edges[1:]).astype(np.int64), lo + 1)
+        rows.append(start + lo + (rng.random(q) * (hi - lo)).astype(np.int64))
+    return np.unique(np.concatenate(rows))
+
+
+# --------------------
+# 2) UMAP sui landmark + transform a blocchi in parallelo
+# --------------------
+_WORKER_MODEL = None
+
+
+def _init_embed_worker(model):
+    global _WORKER_MODEL
+    _WORKER_MODEL = model
+
+
+def _embed_batch(X):
+    return _WORKER_MODEL.umap_.transform(X).astype(np.float32)
+
+
+class LandmarkUMAP:
+    """
+    Mappa UMAP (di default 3-D) per tutto il corpus:
+
+    - fit(store): UMAP stimato solo su un sottoinsieme stratificato di frame
+      (stratified_landmarks), nello spazio del ProjectionModel del corpus
+      (space="scaled": feature standardizzate, come nel notebook;
+      space="pca": componenti principali)
+    - transform(X): tutti gli altri frame (o brani nuovi) proiettati con
+      umap.transform, a blocchi di batch_rows su un pool di processi
+    - save / load: joblib; fit_landmark_umap lo mette in cache per hash del
+      ProjectionModel (fingerprint) + parametri: i landmark non entrano nella
+      chiave, quindi finché la proiezione resta quella il modello si riusa
+      anche dopo aver aggiunto brani
+    """
+
+    def __init__(self, projection, space="scaled", n_landmarks=20_000, min_per_track=50,
+                 seed=0, n_neighbors=30, min_dist=0.1, n_components=3, metric="euclidean"):
+        if space not in ("scaled", "pca"):
+            raise ValueError(f"space deve essere 'scaled' o 'pca', non {space!r}")
+        self.projection = projection
+        self.space = space
+        self.n_landmarks = n_landmarks
+        self.min_per_track = min_per_track
+        self.seed = seed
+        self.umap_params = dict(n_neighbors=n_neighbors, min_dist=min_dist,
+                                n_components=n_components, metric=metric)
+        self.landmarks_ = None
+        self.store_root_ = None
+
+    def params(self):
+        """Parametri che identificano il modello (per l'hash della cache)."""
+        p = self.projection
+        return {
+            "feature_names": p.feature_names,
+            "columns": p.columns_,
+            "projection": p.fingerprint(),
+            "space": self.space,
+            "n_landmarks": self.n_landmarks,
+            "min_per_track": self.min_per_track,
+            "seed": self.seed,
+            "umap": self.umap_params,
+        }
+
+    def params_hash(self):
+        blob = json.dumps(self.params(), sort_keys=True, default=str)
+        return hashlib.sha1(blob.encode()).hexdigest()[:16]
+
+    def features(self, X, feature_names=None):
+        """Spazio di input di UMAP: standardizzato o PCA del corpus."""
+        if self.space == "scaled":
+            return self.projection.standardize(X, feature_names)
+        return self.projection.transform(X, feature_names)
+
+    def fit(self, store):
+        import umap
+
+        idx = stratified_landmarks(store.track_lengths(), self.n_landmarks,
+                                   self.min_per_track, self.seed)
+        X = self.features(store.data[idx], store.feature_names)
+        self.umap_ = umap.UMAP(random_state=self.seed, **self.umap_params).fit(X)
+        self.landmarks_ = idx
+        self.store_root_ = str(Path(store.root).resolve())
+        return self
+
+    def _embed(self, batches, n_jobs=None):
+        """
+        Generatore degli embedding di una sequenza di blocchi già nello spazio
+        di input, nell'ordine. Un solo pool per tutta la sequenza; prima del
+        fork il parent proietta un blocco minimo, così i worker ereditano le
+        funzioni numba di umap già compilate invece di ricompilarle ognuno.
+        """
+        n_jobs = n_jobs or os.cpu_count() or 1
+        if n_jobs == 1:
+            for b in batches:
+                yield self.umap_.transform(b).astype(np.float32)
+            return
+        batches = iter(batches)
+        first = next(batches, None)
+        if first is None:
+            return
+        self.umap_.transform(first[:2])
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=mp.get_context(),
+                                 initializer=_init_embed_worker, initargs=(self,)) as pool:
+            pending = [pool.submit(_embed_batch, first)]
+            for b in batches:
+                pending.append(pool.submit(_embed_batch, b))
+                # al più 2 blocchi per worker in coda: memoria limitata
+                if len(pending) >= 2 * n_jobs:
+                    yield pending.pop(0).result()
+            for fut in pending:
+                yield fut.result()
+
+    def transform(self, X, feature_names=None, batch_rows=20_000, n_jobs=None):
+        """Embedding (n, n_components) float32 di frame arbitrari (schema dello store)."""
+        X = self.features(np.asarray(X), feature_names)
+        batches = [X[i:i + batch_rows] for i in range(0, len(X), batch_rows)]
+        if not batches:
+            return np.zeros((0, self.umap_params["n_components"]), dtype=np.float32)
+        return np.concatenate(list(self._embed(batches, min(n_jobs or os.cpu_count() or 1,
+                                                           len(batches)))))
+
+    def transform_store(self, store, name=None, batch_rows=20_000, n_jobs=None, out=None):
+        """
+        Embedding di un brano o di tutto lo store. Se lo store è quello del fit
+        (le righe sono solo in append, quindi gli indici restano validi) i
+        landmark riusano il loro embedding invece di essere riproiettati.
+        out: array (o np.lib.format.open_memmap) (N, n_components) da riempire.
+        """
+        start, stop = store.offsets(name) if name is not None else (0, store.n_rows)
+        n_comp = self.umap_params["n_components"]
+        if out is None:
+            out = np.empty((stop - start, n_comp), dtype=np.float32)
+
+        same_store = (self.store_root_ == str(Path(store.root).resolve())
+                      and len(self.landmarks_) and self.landmarks_[-1] < store.n_rows)
+        todo = np.ones(stop - start, dtype=bool)
+        if same_store:
+            sel = (self.landmarks_ >= start) & (self.landmarks_ < stop)
+            out[self.landmarks_[sel] - start] = self.umap_.embedding_[sel]
+            todo[self.landmarks_[sel] - start] = False
+
+        # blocchi letti dalla memory-map solo quando servono
+        rows = np.flatnonzero(todo)
+        chunks = [rows[i:i + batch_rows] for i in range(0, len(rows), batch_rows)]
+        batches = (self.features(store.data[start + r], store.feature_names) for r in chunks)
+        n_jobs = min(n_jobs or os.cpu_count() or 1, max(len(chunks), 1))
+        for r, Z in zip(chunks, self._embed(batches, n_jobs)):
+            out[r] = Z
+        return out
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        joblib.dump(self, tmp)
+        os.replace(tmp, path)
+        return path
+
+    @staticmethod
+    def load(path):
+        return joblib.load(path)
+
+
+def fit_landmark_umap(store, projection=None, cache_dir="embedding_models", **params):
+    """
+    LandmarkUMAP dello store, dalla cache se già stimato con la stessa
+    proiezione e gli stessi parametri (file umap_<hash>.joblib in cache_dir).
+
+    projection: ProjectionModel del corpus; se None viene caricato da
+    cache_dir/projection.npz (stimato e salvato lì la prima volta) senza
+    ristimarlo quando lo store cresce (fit_projection(allow_stale=True)),
+    così la chiave della cache non cambia aggiungendo brani.
+    """
+    if isinstance(store, (str, Path)):
+        store = TrajectoryStore(store)
+    if projection is None:
+        projection = fit_projection(store, Path(cache_dir) / "projection.npz", allow_stale=True)
+    model = LandmarkUMAP(projection, **params)
+    path = Path(cache_dir) / f"umap_{model.params_hash()}.joblib"
+    if path.exists():
+        return LandmarkUMAP.load(path)
+    model.fit(store)
+    model.save(path)
+    return model
@@ -1,5 +1,98 @@
+import contextvars
+import os
+import tempfile
+import threading
+import tracemalloc
+import warnings
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+
 import librosa
 import numpy as np
+import scipy.sparse
+
+from utils.AudioLoading import iter_audio_blocks, load_audio
+from utils.Instrumentation import stage
+from utils.Spectrogram import (
+    center_pad,
+    n_stft_frames,
+    power_spectrogram,
+    stft_power_block,
+)
+
+
+# -----------------------------
+# Gruppi di feature e nomi delle colonne
+# -----------------------------
+SPECTRAL_FEATURES = [
+    "spec_centroid",
+    "spec_bandwidth",
+    "spec_rolloff_85",
+    "spec_rolloff_95",
+    "spec_flux",
+    "spec_entropy",
+    "spec_crest",
+    "spec_spread",
+    "spec_flatness",
+]
+ENERGY_FEATURES = ["rms", "transient_strength"]
+
+FEATURE_GROUPS = ("mfcc", "spectral", "energy", "chroma")
+
+
+def feature_names_for(n_mfcc=40, n_chroma_micro=24):
+    """Tutte le colonne di extract_features, nell'ordine della traiettoria."""
+    feature_names = [f"mfcc_{i+1}" for i in range(n_mfcc)]
+    feature_names += SPECTRAL_FEATURES
+    feature_names += ENERGY_FEATURES
+    feature_names += [f"chroma24_{i+1}" for i in range(n_chroma_micro)]
+    feature_names.append("chroma_concentration")
+    return feature_names
+
+
+def feature_group(name):
+    """Gruppo ("mfcc", "spectral", "energy", "chroma") di una colonna."""
+    if name.startswith("mfcc_"):
+        return "mfcc"
+    if name in SPECTRAL_FEATURES:
+        return "spectral"
+    if name in ENERGY_FEATURES:
+        return "energy"
+    if name.startswith("chroma"):
+        return "chroma"
+    raise ValueError(f"feature sconosciuta: {name}")
+
+
+def select_feature_names(n_mfcc=40, n_chroma_micro=24, groups=None, columns=None):
+    """
+    Colonne richieste, sempre nell'ordine canonico di feature_names_for.
+
+    - groups:  sottoinsieme di FEATURE_GROUPS (None = tutti)
+    - columns: nomi esatti delle colonne (None = tutte quelle dei gruppi)
+    """
+    all_names = feature_names_for(n_mfcc, n_chroma_micro)
+    if groups is not None:
+        unknown = set(groups) - set(FEATURE_GROUPS)
+        if unknown:
+            raise ValueError(f"gruppi sconosciuti: {sorted(unknown)}")
+    if columns is not None:
+        unknown = set(columns) - set(all_names)
+        if unknown:
+            raise ValueError(f"colonne sconosciute: {sorted(unknown)}")
+
+    selected = []
+    for name in all_names:
+        if groups is not None and feature_group(name) not in groups:
+            continue
+        if columns is not None and name not in columns:
+            continue
+        selected.append(name)
+    if not selected:
+        raise ValueError("nessuna feature selezionata")
+    return selected
+
 
 def _safe_normalize(vec, axis=0, eps=1e-10):
     denom = np.sum(vec, axis=axis, keepdims=True)
@@ -7,6 +100,62 @@ def _safe_normalize(vec, axis=0, eps=1e-10):
     return vec / denom
 
 
+# -----------------------------
+# Chroma veloce dalla STFT
+# -----------------------------
+CHROMA_BACKENDS = ("cqt", "stft")
+
+
+@lru_cache(maxsize=8)
+def stft_chroma_filterbank(sr, n_fft, n_chroma=24, n_octaves=7, width=0.75):
+    """
+    Banco di filtri che approssima chroma_cqt a partire dallo spettro STFT.
+
+    Come chroma_cqt (fmin = C1, bins_per_octave = n_chroma, 7 ottave):
+    - pool: (n_bins, F) sparsa, pesi gaussiani attorno a ogni frequenza
+      centrale della CQT, con banda proporzionale (width · f_k / Q)
+    - fold: (n_chroma, n_bins), somma delle ottave per ogni classe di altezza
+
+    chroma ≈ fold @ sqrt(pool @ S): energia per banda → ampiezza → chroma.
+    Niente stima del tuning (accordatura A440 assunta).
+    """
+    fmin = librosa.note_to_hz("C1")
+    n_bins = n_octaves * n_chroma
+    fk = fmin * 2.0 ** (np.arange(n_bins) / n_chroma)
+    Q = 1.0 / (2.0 ** (1.0 / n_chroma) - 1)
+    sigma = width * fk / Q
+
+    freqs = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
+    rows, cols, vals = [], [], []
+    for k in range(n_bins):
+        # gaussiana troncata a ±4 sigma: pochi bin STFT per banda
+        lo, hi = np.searchsorted(freqs, [fk[k] - 4 * sigma[k], fk[k] + 4 * sigma[k]])
+        f = freqs[lo:hi]
+        rows.append(np.full(len(f), k))
+        cols.append(np.arange(lo, hi))
+        vals.append(np.exp(-0.5 * ((f - fk[k]) / sigma[k]) ** 2))
+    pool = scipy.sparse.csr_matrix(
+        (np.concatenate(vals).astype(np.float32),
+         (np.concatenate(rows), np.concatenate(cols))),
+        shape=(n_bins, len(freqs)),
+    )
+
+    fold = librosa.filters.cq_to_chroma(
+        n_bins, bins_per_octave=n_chroma, n_chroma=n_chroma, fmin=fmin
+    ).astype(np.float32)
+    return pool, fold
+
+
+def chroma_from_power(S, sr, n_fft, n_chroma=24, filterbank=None):
+    """Chroma (n_chroma, T) dallo spettrogramma di potenza S, normalizzato come chroma_cqt."""
+    if filterbank is None:
+        filterbank = stft_chroma_filterbank(sr, n_fft, n_chroma)
+    pool, fold = filterbank
+    band_amp = np.sqrt(pool @ S)
+    chroma = fold @ band_amp
+    return librosa.util.normalize(chroma, norm=np.inf, axis=0)
+
+
 def extract_features(
     wav_path,
     sr=44100,
@@ -14,189 +163,930 @@ def extract_features(
     win_seconds=1.0,
     n_mfcc=40,
     n_chroma_micro=24,
+    cache=None,
+    groups=None,
+    columns=None,
+    chroma_backend="cqt",
+    low_memory=False,
+    n_threads=1,
 ):
     """
     Estrae un vettore di stato ricco per ogni frame del brano.
 
+    cache: SpectrogramCache opzionale (utils/Spectrogram.py); se data, la STFT
+    del brano viene riletta dal disco invece di essere ricalcolata.
+
+    groups / columns: calcola solo una parte delle feature (vedi
+    select_feature_names). Si calcolano solo le dipendenze necessarie:
+    STFT per le spettrali, S_db per gli MFCC, CQT per il chroma; ad es.
+    groups=["mfcc", "spectral"] non paga la CQT.
+
+    chroma_backend: "cqt" (default, chroma_cqt sul segnale) oppure "stft"
+    (molto più veloce: riusa la STFT già calcolata, vedi
+    stft_chroma_filterbank; per il confronto: benchmarks/chroma_backends.py).
+
+    low_memory: float32 e calcolo a blocchi di frame (vedi FeatureExtractor).
+
+    n_threads: STFT a blocchi su più thread (stesso risultato, bit per bit):
+    per un singolo brano molto lungo usa tutti i core.
+
     Output:
       - trajectory: np.ndarray di shape (T, d)
       - feature_names: lista di stringhe, una per ogni colonna di trajectory
     """
 
     # 1. Caricamento audio (mono, già pulito a monte)
-    y, sr = librosa.load(wav_path, sr=sr, mono=True)
+    with stage("load", "extract_features"):
+        y, sr = load_audio(wav_path, sr=sr, mono=True)
 
-    # 2. Parametri STFT
-    hop_length = int(hop_seconds * sr)
-    win_length = int(win_seconds * sr)
-    n_fft = 2 ** int(np.ceil(np.log2(win_length)))  # prossima potenza di 2
+    return extract_features_from_signal(
+        y,
+        sr,
+        hop_seconds=hop_seconds,
+        win_seconds=win_seconds,
+        n_mfcc=n_mfcc,
+        n_chroma_micro=n_chroma_micro,
+        cache=cache,
+        groups=groups,
+        columns=columns,
+        chroma_backend=chroma_backend,
+        low_memory=low_memory,
+        n_threads=n_threads,
+    )
 
-    # 3. Spettrogramma di potenza
-    S = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length,
-                            win_length=win_length)) ** 2
-    S_amp = np.sqrt(S)  # ampiezza per funzioni spectral di librosa
-    S_db = librosa.power_to_db(S + 1e-10)
 
-    # Frequenze per descrittori custom
-    freqs = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
-    freqs = freqs[:, np.newaxis]  # shape (F, 1)
+def extract_features_from_signal(
+    y,
+    sr=44100,
+    hop_seconds=0.25,
+    win_seconds=1.0,
+    n_mfcc=40,
+    n_chroma_micro=24,
+    cache=None,
+    groups=None,
+    columns=None,
+    chroma_backend="cqt",
+    low_memory=False,
+    n_threads=1,
+):
+    """
+    Come extract_features, ma su un segnale mono già decodificato a `sr`
+    (ad es. l'output in memoria di clean_signal).
+    Per molti brani conviene creare una volta sola un FeatureExtractor.
+    """
+    extractor = FeatureExtractor(
+        sr=sr,
+        hop_seconds=hop_seconds,
+        win_seconds=win_seconds,
+        n_mfcc=n_mfcc,
+        n_chroma_micro=n_chroma_micro,
+        groups=groups,
+        columns=columns,
+        chroma_backend=chroma_backend,
+        cache=cache,
+        low_memory=low_memory,
+        n_threads=n_threads,
+    )
+    return extractor.extract(y)
+
+
+def stream_features(
+    wav_path,
+    sr=44100,
+    hop_seconds=0.25,
+    win_seconds=1.0,
+    n_mfcc=40,
+    n_chroma_micro=24,
+    groups=None,
+    columns=None,
+    chroma_backend="cqt",
+    chunk_frames=256,
+):
+    """
+    Come extract_features, ma in streaming: la memoria resta costante
+    qualunque sia la durata del brano (vedi FeatureExtractor.iter_trajectory).
+
+    Output:
+      - feature_names: intestazione delle colonne
+      - chunks: generatore di blocchi (n, d) float32 di righe consecutive
+    """
+    extractor = FeatureExtractor(
+        sr=sr,
+        hop_seconds=hop_seconds,
+        win_seconds=win_seconds,
+        n_mfcc=n_mfcc,
+        n_chroma_micro=n_chroma_micro,
+        groups=groups,
+        columns=columns,
+        chroma_backend=chroma_backend,
+        low_memory=True,
+    )
+    return extractor.feature_names, extractor.iter_trajectory(wav_path, chunk_frames=chunk_frames)
+
+
+# -----------------------------
+# Piano di estrazione riutilizzabile
+# -----------------------------
+def _dct_basis(n_mfcc, n_bins):
+    """
+    Prime n_mfcc righe della DCT-II ortonormale su n_bins punti.
+
+    librosa.feature.mfcc(S=S_db) applica la DCT direttamente a S_db (non c'è
+    banco mel quando S è passato): basis @ S_db dà lo stesso risultato.
+    """
+    k = np.arange(n_mfcc)[:, np.newaxis]
+    n = np.arange(n_bins)[np.newaxis, :]
+    basis = np.sqrt(2.0 / n_bins) * np.cos(np.pi * k * (2 * n + 1) / (2 * n_bins))
+    basis[0] /= np.sqrt(2.0)
+    return basis
+
+
+_CQT_FILTER_MEMO_SIZE = 64
+_VQT_FILTER_FFT = "__vqt_filter_fft"   # funzione privata di librosa.core.constantq
+
+_CQT_MEMO = contextvars.ContextVar("cqt_filter_memo", default=None)
+_CQT_PATCH = {"count": 0, "original": None}
+_CQT_PATCH_LOCK = threading.Lock()
+
+
+def _memoized_vqt_filter_fft(sr, freqs, filter_scale, norm, sparsity, hop_length=None,
+                             window="hann", gamma=0.0, dtype=np.complex64, alpha=None):
+    build = _CQT_PATCH["original"]
+    memo = _CQT_MEMO.get()
+    if memo is None:   # chiamata di librosa fuori da cqt_filter_memo (altri thread)
+        return build(sr, freqs, filter_scale, norm, sparsity, hop_length=hop_length,
+                     window=window, gamma=gamma, dtype=dtype, alpha=alpha)
+    key = (
+        sr, np.asarray(freqs).tobytes(), filter_scale, norm, sparsity,
+        hop_length, str(window), gamma, np.dtype(dtype).str,
+        None if alpha is None else np.asarray(alpha).tobytes(),
+    )
+    if key in memo:
+        memo.move_to_end(key)
+    else:
+        memo[key] = build(sr, freqs, filter_scale, norm, sparsity,
+                          hop_length=hop_length, window=window, gamma=gamma,
+                          dtype=dtype, alpha=alpha)
+        if len(memo) > _CQT_FILTER_MEMO_SIZE:
+            memo.popitem(last=False)
+    fft_basis, n_fft, lengths = memo[key]
+    return fft_basis.copy(), n_fft, lengths.copy()
+
+
+@contextmanager
+def cqt_filter_memo(memo):
+    """
+    Dentro il blocco, i kernel CQT costruiti da librosa (chroma_cqt) vengono
+    memorizzati in `memo` (un OrderedDict, ad es. quello di un FeatureExtractor).
+
+    I kernel dipendono da sr, hop e dal tuning stimato (su una griglia di
+    0.01 bin), quindi su un corpus si ripetono: si costruiscono una volta
+    e poi si riusano. vqt modifica il basis in place, per cui si restituisce
+    sempre una copia.
+
+    La funzione privata di librosa viene sostituita solo finché c'è almeno un
+    blocco attivo (poi si rimette l'originale) e la memo vale solo nel
+    contesto che l'ha attivata: le altre chiamate a librosa nel processo
+    costruiscono i kernel come sempre. Se librosa cambia struttura interna
+    si dà un warning e si calcola senza memo.
+    """
+    from librosa.core import constantq
+
+    with _CQT_PATCH_LOCK:
+        if _CQT_PATCH["count"] == 0:
+            build = getattr(constantq, _VQT_FILTER_FFT, None)
+            if build is None:
+                warnings.warn(
+                    f"librosa.core.constantq.{_VQT_FILTER_FFT} non trovata: "
+                    "kernel CQT ricalcolati a ogni chiamata",
+                    RuntimeWarning,
+                )
+                patched = False
+            else:
+                _CQT_PATCH["original"] = build
+                setattr(constantq, _VQT_FILTER_FFT, _memoized_vqt_filter_fft)
+                patched = True
+        else:
+            patched = True
+        if patched:
+            _CQT_PATCH["count"] += 1
+
+    if not patched:
+        yield
+        return
+    token = _CQT_MEMO.set(memo)
+    try:
+        yield
+    finally:
+        _CQT_MEMO.reset(token)
+        with _CQT_PATCH_LOCK:
+            _CQT_PATCH["count"] -= 1
+            if _CQT_PATCH["count"] == 0:
+                setattr(constantq, _VQT_FILTER_FFT, _CQT_PATCH["original"])
+                _CQT_PATCH["original"] = None
+
+
+class FeatureExtractor:
+    """
+    Piano di estrazione di extract_features, costruito una volta sola.
+
+    Con parametri fissi (sr, hop_seconds, win_seconds, n_mfcc, n_chroma_micro)
+    tutto ciò che non dipende dal brano viene precalcolato nel costruttore:
+    finestra di Hann (già centrata su n_fft), vettore fft_frequencies,
+    base DCT per gli MFCC, banco chroma da STFT (backend "stft") o
+    memo dei kernel CQT (backend "cqt"). Nei batch il tempo va nelle FFT.
+
+    low_memory=True: modalità a budget di memoria. Tutto in float32, la STFT
+    è calcolata a blocchi di `block_frames` frame e tutte le feature sono
+    calcolate blocco per blocco su buffer riusati, senza matrici (F, T) in RAM
+    (S vive su disco in memory-map solo se servono gli MFCC o c'è una cache).
+    n_threads > 1: la STFT (e, in low_memory, i blocchi di frame) viene
+    calcolata su un pool di thread, con risultato identico.
+    track_memory=True: misura il picco di memoria allocata (tracemalloc)
+    durante extract, in self.last_stats["peak_bytes"].
+
+    Uso:
+        fx = FeatureExtractor(sr=44100, n_mfcc=40)
+        trajectory, names = fx.extract(y)
+        for path, trajectory in fx.extract_many(paths):
+            ...
+    """
+
+    def __init__(
+        self,
+        sr=44100,
+        hop_seconds=0.25,
+        win_seconds=1.0,
+        n_mfcc=40,
+        n_chroma_micro=24,
+        groups=None,
+        columns=None,
+        chroma_backend="cqt",
+        cache=None,
+        low_memory=False,
+        block_frames=128,
+        track_memory=False,
+        n_threads=1,
+    ):
+        if chroma_backend not in CHROMA_BACKENDS:
+            raise ValueError(f"chroma_backend deve essere uno di {CHROMA_BACKENDS}")
+
+        self.sr = sr
+        self.hop_seconds = hop_seconds
+        self.win_seconds = win_seconds
+        self.n_mfcc = n_mfcc
+        self.n_chroma_micro = n_chroma_micro
+        self.chroma_backend = chroma_backend
+        self.cache = cache
+        self.low_memory = low_memory
+        self.block_frames = int(block_frames)
+        self.track_memory = track_memory
+        self.n_threads = n_threads
+        self.last_stats = {}
+
+        self.feature_names = select_feature_names(n_mfcc, n_chroma_micro, groups, columns)
+        need = set(self.feature_names)
+        self._need = need
+
+        self.need_mfcc = any(n.startswith("mfcc_") for n in need)
+        self.need_chroma = any(n.startswith("chroma") for n in need)
+        self.need_flux = self.wanted("spec_flux", "transient_strength")
+        self.need_S_amp = self.need_flux or self.wanted(
+            "spec_centroid", "spec_bandwidth", "spec_rolloff_85",
+            "spec_rolloff_95", "spec_flatness", "spec_spread",
+        )
+        self.need_S = self.need_mfcc or self.need_S_amp \
+            or self.wanted("spec_entropy", "spec_crest") \
+            or (self.need_chroma and chroma_backend == "stft")
+
+        # 2. Parametri STFT
+        self.hop_length = int(hop_seconds * sr)
+        self.win_length = int(win_seconds * sr)
+        self.n_fft = 2 ** int(np.ceil(np.log2(self.win_length)))  # prossima potenza di 2
+
+        # finestra di Hann lunga win_length, centrata su n_fft (come fa librosa.stft)
+        self.window = librosa.util.pad_center(
+            librosa.filters.get_window("hann", self.win_length, fftbins=True),
+            size=self.n_fft,
+        )
+        # Frequenze per descrittori custom
+        self.fft_freqs = librosa.fft_frequencies(sr=sr, n_fft=self.n_fft)
+        self.n_bins = len(self.fft_freqs)
+
+        if self.need_mfcc:
+            self.dct_basis = _dct_basis(n_mfcc, self.n_bins)
+        if low_memory:
+            self.fft_freqs = self.fft_freqs.astype(np.float32)
+            if self.need_mfcc:
+                self.dct_basis = self.dct_basis.astype(np.float32)
+        if self.need_chroma:
+            if chroma_backend == "stft":
+                self.chroma_filterbank = stft_chroma_filterbank(
+                    sr, self.n_fft, n_chroma_micro)
+            else:
+                # kernel CQT riusati tra i brani (vedi cqt_filter_memo)
+                self._cqt_memo = OrderedDict()
+
+    def wanted(self, *names):
+        return any(n in self._need for n in names)
+
+    def _chroma_cqt(self, **kwargs):
+        """librosa.feature.chroma_cqt con i kernel CQT memorizzati nell'estrattore."""
+        with cqt_filter_memo(self._cqt_memo):
+            return librosa.feature.chroma_cqt(**kwargs)
 
     # -----------------------------
-    # 4. MFCCs (timbre envelope)
+    # Estrazione
     # -----------------------------
-    mfcc = librosa.feature.mfcc(S=S_db, sr=sr, n_mfcc=n_mfcc)  # (n_mfcc, T)
-
-    # ---------------------------------
-    # 5. Spettral descriptors (texture)
-    # ---------------------------------
-    centroid = librosa.feature.spectral_centroid(S=S_amp, sr=sr)         # (1, T)
-    bandwidth = librosa.feature.spectral_bandwidth(S=S_amp, sr=sr)       # (1, T)
-    rolloff85 = librosa.feature.spectral_rolloff(S=S_amp, sr=sr,
-                                                 roll_percent=0.85)      # (1, T)
-    rolloff95 = librosa.feature.spectral_rolloff(S=S_amp, sr=sr,
-                                                 roll_percent=0.95)      # (1, T)
-    flatness = librosa.feature.spectral_flatness(S=S_amp)               # (1, T)
-
-    # Spectral flux (usando onset envelope)
-    flux = librosa.onset.onset_strength(S=S_amp, sr=sr)[np.newaxis, :]  # (1, T)
-
-    # Entropy, crest, spread – calcolati dal power spectrum S
-    # Normalizziamo lo spettro in probabilità per frame
-    P_norm = _safe_normalize(S, axis=0)  # (F, T)
-
-    # Entropia normalizzata (0–1)
-    entropy = -np.sum(P_norm * np.log(P_norm + 1e-10), axis=0)
-    entropy /= np.log(P_norm.shape[0] + 1e-10)
-    entropy = entropy[np.newaxis, :]  # (1, T)
-
-    # Spectral crest: max / mean
-    crest = (np.max(S, axis=0) / (np.mean(S, axis=0) + 1e-10))[np.newaxis, :]
-
-    # Spectral spread: varianza attorno al centroid (in Hz)
-    # centroid: (1, T), freqs: (F, 1)
-    # usiamo P_norm come pesi
-    centroid_Hz = centroid  # già in Hz
-    spread = np.sqrt(np.sum(P_norm * (freqs - centroid_Hz) ** 2, axis=0))
-    spread = spread[np.newaxis, :]  # (1, T)
+    def load(self, path):
+        """Caricamento audio (mono, già pulito a monte) alla sr del piano."""
+        with stage("load", "extract_features"):
+            y, _ = load_audio(path, sr=self.sr, mono=True)
+        return y
+
+    def extract_many(self, paths):
+        """Generatore di (path, trajectory) per una lista di file; i nomi sono in self.feature_names."""
+        for path in paths:
+            trajectory, _ = self.extract(self.load(path))
+            yield path, trajectory
+
+    def extract(self, y):
+        """Traiettoria (T, d) e feature_names per un segnale mono a self.sr."""
+        if not self.track_memory:
+            return self._extract(y)
+
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        try:
+            trajectory, feature_names = self._extract(y)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            if started:
+                tracemalloc.stop()
+        self.last_stats = {
+            "peak_bytes": peak - base,
+            "frames": trajectory.shape[0],
+            "low_memory": self.low_memory,
+        }
+        return trajectory, feature_names
+
+    def _extract(self, y):
+        if self.low_memory:
+            return self._extract_low_memory(y)
+
+        sr = self.sr
+        wanted = self.wanted
+
+        # blocchi calcolati: nome colonna -> riga (1, T) oppure gruppo (k, T)
+        feats = {}
+
+        # 3. Spettrogramma di potenza (solo se qualche feature lo usa)
+        if self.need_S:
+            with stage("stft", "extract_features"):
+                S = power_spectrogram(y, sr, n_fft=self.n_fft, hop_length=self.hop_length,
+                                      win_length=self.win_length, cache=self.cache,
+                                      window=self.window, n_threads=self.n_threads)
+                if self.need_S_amp:
+                    S_amp = np.sqrt(S)  # ampiezza per funzioni spectral di librosa
+
+        # -----------------------------
+        # 4. MFCCs (timbre envelope)
+        # -----------------------------
+        if self.need_mfcc:
+            with stage("mfcc", "extract_features"):
+                S_db = librosa.power_to_db(S + 1e-10)
+                feats["mfcc"] = self.dct_basis @ S_db  # (n_mfcc, T)
+                del S_db
+
+        # ---------------------------------
+        # 5. Spettral descriptors (texture)
+        # ---------------------------------
+        with stage("spectral", "extract_features"):
+            freq = self.fft_freqs
+            if wanted("spec_centroid", "spec_spread"):
+                centroid = librosa.feature.spectral_centroid(S=S_amp, sr=sr, freq=freq)  # (1, T)
+                feats["spec_centroid"] = centroid
+            if wanted("spec_bandwidth"):
+                feats["spec_bandwidth"] = librosa.feature.spectral_bandwidth(
+                    S=S_amp, sr=sr, freq=freq)
+            if wanted("spec_rolloff_85"):
+                feats["spec_rolloff_85"] = librosa.feature.spectral_rolloff(
+                    S=S_amp, sr=sr, freq=freq, roll_percent=0.85)
+            if wanted("spec_rolloff_95"):
+                feats["spec_rolloff_95"] = librosa.feature.spectral_rolloff(
+                    S=S_amp, sr=sr, freq=freq, roll_percent=0.95)
+            if wanted("spec_flatness"):
+                feats["spec_flatness"] = librosa.feature.spectral_flatness(S=S_amp)
+
+            # Spectral flux (usando onset envelope)
+            if self.need_flux:
+                flux = librosa.onset.onset_strength(S=S_amp, sr=sr)[np.newaxis, :]  # (1, T)
+                feats["spec_flux"] = flux
+                # Onset strength come "transient strength"
+                feats["transient_strength"] = flux.copy()  # già (1, T), coerente con S
+
+            # Entropy, crest, spread – calcolati dal power spectrum S
+            if wanted("spec_entropy", "spec_spread"):
+                # Normalizziamo lo spettro in probabilità per frame
+                P_norm = _safe_normalize(S, axis=0)  # (F, T)
+
+            if wanted("spec_entropy"):
+                # Entropia normalizzata (0–1)
+                entropy = -np.sum(P_norm * np.log(P_norm + 1e-10), axis=0)
+                entropy /= np.log(P_norm.shape[0] + 1e-10)
+                feats["spec_entropy"] = entropy[np.newaxis, :]  # (1, T)
+
+            if wanted("spec_crest"):
+                # Spectral crest: max / mean
+                feats["spec_crest"] = (np.max(S, axis=0) / (np.mean(S, axis=0) + 1e-10))[np.newaxis, :]
+
+            if wanted("spec_spread"):
+                # Spectral spread: varianza attorno al centroid (in Hz)
+                # centroid: (1, T), freqs: (F, 1)
+                # usiamo P_norm come pesi
+                freqs = freq[:, np.newaxis]  # shape (F, 1)
+                centroid_Hz = centroid  # già in Hz
+                spread = np.sqrt(np.sum(P_norm * (freqs - centroid_Hz) ** 2, axis=0))
+                feats["spec_spread"] = spread[np.newaxis, :]  # (1, T)
+
+        # -----------------------------
+        # 6. Energy / dynamics
+        # -----------------------------
+        if wanted("rms"):
+            with stage("energy", "extract_features"):
+                # RMS su y, allineato alla STFT
+                feats["rms"] = librosa.feature.rms(y=y, frame_length=self.win_length,
+                                                   hop_length=self.hop_length)  # (1, T_rms)
+
+        # -----------------------------
+        # 7. Pitch / Chroma domain
+        # -----------------------------
+        if self.need_chroma:
+            with stage("chroma", "extract_features"):
+                # Chroma microtonale (24 bin)
+                if self.chroma_backend == "stft":
+                    chroma_micro = chroma_from_power(S, sr, self.n_fft, self.n_chroma_micro,
+                                                     filterbank=self.chroma_filterbank)
+                else:
+                    chroma_micro = self._chroma_cqt(
+                        y=y,
+                        sr=sr,
+                        hop_length=self.hop_length,
+                        n_chroma=self.n_chroma_micro,
+                        bins_per_octave=self.n_chroma_micro,
+                    )  # (24, T_chroma)
+                feats["chroma"] = chroma_micro
+
+                if wanted("chroma_concentration"):
+                    # Chroma energy concentration (max / somma)
+                    chroma_norm = _safe_normalize(chroma_micro, axis=0)
+                    feats["chroma_concentration"] = np.max(chroma_norm, axis=0)[np.newaxis, :]
+
+        with stage("align", "extract_features"):
+            return _assemble_trajectory(feats, self.feature_names)
 
     # -----------------------------
-    # 6. Energy / dynamics
+    # Modalità a basso consumo di memoria
     # -----------------------------
-    # RMS su y, allineato alla STFT
-    rms = librosa.feature.rms(y=y, frame_length=win_length,
-                              hop_length=hop_length)  # (1, T_rms)
+    def _open_spectrogram(self, y, T):
+        """
+        Sorgente di S per la modalità low_memory: ritorna (S_mm, fill, cleanup).
+
+        - cache hit: S_mm è la voce in memory-map, fill=False
+        - cache miss: S_mm è la nuova voce da riempire a blocchi, fill=True
+        - senza cache: file temporaneo (serve solo per gli MFCC), fill=True
+        - nessuno dei due: S_mm=None, la STFT si calcola e si butta a blocchi
+        """
+        shape = (self.n_bins, T)
+        if self.cache is not None:
+            key = self.cache.key(y, self.sr, self.n_fft, self.hop_length, self.win_length,
+                                 window=self.window, dtype=np.float32)
+            S_mm = self.cache.get(key)
+            if S_mm is not None:
+                return S_mm, False, None
+            S_mm, tmp = self.cache.open_entry(key, shape, dtype=np.float32)
+            return S_mm, True, lambda S: self.cache.commit_entry(key, S, tmp)
+
+        if not self.need_mfcc:
+            return None, True, None
+
+        fd, tmp = tempfile.mkstemp(suffix=".npy")
+        os.close(fd)
+        S_mm = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32,
+                                         shape=shape, fortran_order=True)
+
+        def cleanup(S):
+            del S
+            os.remove(tmp)
+
+        return S_mm, True, cleanup
+
+    def _extract_low_memory(self, y):
+        sr = self.sr
+        wanted = self.wanted
+        B = self.block_frames
+        hop, n_fft = self.hop_length, self.n_fft
+        f32 = np.float32
+        y = np.asarray(y, dtype=f32)
+
+        feats = {}
+
+        def alloc(name, k, T):
+            feats[name] = np.zeros((k, T), dtype=f32)
+            return feats[name]
+
+        if self.need_S:
+            T = n_stft_frames(len(y), hop)
+            S_mm, fill, cleanup = self._open_spectrogram(y, T)
+            y_pad = center_pad(y, n_fft) if fill else None
+
+            state = self._block_state(B)
+            out = {n: alloc(n, 1, T)[0] for n in state["cols"]}
+            if self.need_flux:
+                d = np.zeros(T, dtype=f32)  # d[t] = flusso tra il frame t-1 e t
+            if self.need_chroma and self.chroma_backend == "stft":
+                chroma = alloc("chroma", self.n_chroma_micro, T)
+            gmax = f32(0.0)
+
+            # STFT e descrittori sono intercalati blocco per blocco: un'unica fase
+            with stage("spectral", "extract_features", low_memory=True):
+                blocks = self._stft_blocks(y_pad, T) if fill else \
+                    ((t0, min(T, t0 + B), None) for t0 in range(0, T, B))
+                for t0, t1, S in blocks:
+                    if fill:
+                        if S_mm is not None:
+                            S_mm[:, t0:t1] = S
+                    else:
+                        S = np.asarray(S_mm[:, t0:t1])
+                    if self.need_mfcc:
+                        gmax = max(gmax, S.max())
+
+                    res = self._spectral_block(S, state)
+                    for n in out:
+                        out[n][t0:t1] = res[n]
+                    if self.need_flux:
+                        d[t0:t1] = res["_flux_d"]
+
+                    if self.need_chroma and self.chroma_backend == "stft":
+                        chroma[:, t0:t1] = chroma_from_power(
+                            S, sr, n_fft, self.n_chroma_micro, filterbank=self.chroma_filterbank)
+
+            if self.need_flux:
+                # come onset_strength(S=...): ritardo di lag + n_fft // (2 * hop)
+                flux = alloc("spec_flux", 1, T)[0]
+                pad = _ONSET_PAD
+                if T > pad:
+                    flux[pad:] = d[1:T - pad + 1]
+                feats["transient_strength"] = feats["spec_flux"].copy()
 
-    # Onset strength come "transient strength"
-    transient_strength = flux.copy()  # già (1, T), coerente con S
+            if self.need_mfcc:
+                # seconda passata su S (da disco): power_to_db con top_db=80
+                # usa il massimo globale, noto solo adesso
+                with stage("mfcc", "extract_features", low_memory=True):
+                    mfcc = alloc("mfcc", self.n_mfcc, T)
+                    floor = _db_floor(gmax)
+                    for t0 in range(0, T, B):
+                        t1 = min(T, t0 + B)
+                        mfcc[:, t0:t1] = self._mfcc_block(S_mm[:, t0:t1], floor, state["work"])
+
+            if cleanup is not None:
+                cleanup(S_mm)
+            del S_mm
+
+        if wanted("rms"):
+            with stage("energy", "extract_features", low_memory=True):
+                feats["rms"] = self._rms_blocks(y)
+
+        if self.need_chroma and self.chroma_backend == "cqt":
+            with stage("chroma", "extract_features", low_memory=True):
+                feats["chroma"] = self._chroma_cqt(
+                    y=y,
+                    sr=sr,
+                    hop_length=hop,
+                    n_chroma=self.n_chroma_micro,
+                    bins_per_octave=self.n_chroma_micro,
+                ).astype(f32)
+        if wanted("chroma_concentration"):
+            chroma_norm = _safe_normalize(feats["chroma"], axis=0)
+            feats["chroma_concentration"] = np.max(chroma_norm, axis=0)[np.newaxis, :]
+
+        with stage("align", "extract_features", low_memory=True):
+            trajectory, feature_names = _assemble_trajectory(feats, self.feature_names)
+        return trajectory.astype(f32, copy=False), feature_names
+
+    def _stft_blocks(self, y_pad, T):
+        """
+        Genera (t0, t1, S_blocco) in ordine. Con n_threads > 1 i blocchi
+        successivi sono già in calcolo sul pool (al massimo n_threads in volo).
+        """
+        B, n_fft, hop = self.block_frames, self.n_fft, self.hop_length
+        bounds = [(t0, min(T, t0 + B)) for t0 in range(0, T, B)]
+        if self.n_threads is None or self.n_threads <= 1:
+            for t0, t1 in bounds:
+                yield t0, t1, stft_power_block(y_pad, t0, t1, n_fft, hop, window=self.window)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.n_threads) as pool:
+            pending = deque()
+            for t0, t1 in bounds:
+                pending.append((t0, t1, pool.submit(
+                    stft_power_block, y_pad, t0, t1, n_fft, hop, window=self.window)))
+                if len(pending) >= self.n_threads:
+                    t0_, t1_, fut = pending.popleft()
+                    yield t0_, t1_, fut.result()
+            while pending:
+                t0_, t1_, fut = pending.popleft()
+                yield t0_, t1_, fut.result()
+
+    def _rms_blocks(self, y):
+        """librosa.feature.rms(y=...) a blocchi di frame, senza la matrice dei frame intera."""
+        frame_length, hop = self.win_length, self.hop_length
+        y_pad = np.pad(y, frame_length // 2, mode="constant")
+        T = 1 + (len(y_pad) - frame_length) // hop
+        rms = np.empty((1, T), dtype=np.float32)
+        for t0 in range(0, T, self.block_frames):
+            t1 = min(T, t0 + self.block_frames)
+            rms[0, t0:t1] = self._rms_frames(y_pad[t0 * hop:(t1 - 1) * hop + frame_length])
+        return rms
+
+    def _rms_frames(self, seg):
+        """RMS dei frame consecutivi di seg (già allineato al primo frame)."""
+        x = librosa.util.frame(seg, frame_length=self.win_length, hop_length=self.hop_length)
+        return np.sqrt(np.mean(np.square(x), axis=0))
 
     # -----------------------------
-    # 7. Pitch / Chroma domain
+    # Calcoli per blocco di frame (low_memory e streaming)
     # -----------------------------
-    # Chroma microtonale (24 bin)
-    chroma_micro = librosa.feature.chroma_cqt(
-        y=y,
-        sr=sr,
-        hop_length=hop_length,
-        n_chroma=n_chroma_micro,
-        bins_per_octave=n_chroma_micro,
-    )  # (24, T_chroma)
+    def _block_state(self, width):
+        """Buffer di lavoro (F, width) e stato tra blocchi per _spectral_block."""
+        F, f32 = self.n_bins, np.float32
+        cols = [n for n in SPECTRAL_FEATURES if self.wanted(n) and n != "spec_flux"]
+        if self.wanted("spec_spread") and "spec_centroid" not in cols:
+            cols.append("spec_centroid")
+        return {
+            "cols": cols,
+            "work": np.empty((F, width), dtype=f32) if self.need_S else None,
+            "amp": np.empty((F, width), dtype=f32) if self.need_S_amp else None,
+            "P": np.empty((F, width), dtype=f32)
+            if self.wanted("spec_entropy", "spec_spread") else None,
+            "prev_amp": None,
+        }
+
+    def _spectral_block(self, S, state):
+        """
+        Descrittori spettrali per frame di un blocco S (F, b): dict nome -> (b,).
+
+        "_flux_d" è il flusso tra ogni frame e il precedente (0 per il primo
+        frame del brano); state conserva l'ultimo frame del blocco precedente.
+        """
+        sr, freq = self.sr, self.fft_freqs
+        b = S.shape[1]
+        work = state["work"]
+        res = {}
 
-    # Chroma energy concentration (max / somma)
-    chroma_norm = _safe_normalize(chroma_micro, axis=0)
-    chroma_concentration = np.max(chroma_norm, axis=0)[np.newaxis, :]  # (1, T)
+        if state["amp"] is not None:
+            amp = np.sqrt(S, out=state["amp"][:, :b])
+            if "spec_centroid" in state["cols"]:
+                res["spec_centroid"] = librosa.feature.spectral_centroid(
+                    S=amp, sr=sr, freq=freq)[0]
+            if self.wanted("spec_bandwidth"):
+                res["spec_bandwidth"] = librosa.feature.spectral_bandwidth(
+                    S=amp, sr=sr, freq=freq)[0]
+            if self.wanted("spec_rolloff_85"):
+                res["spec_rolloff_85"] = librosa.feature.spectral_rolloff(
+                    S=amp, sr=sr, freq=freq, roll_percent=0.85)[0]
+            if self.wanted("spec_rolloff_95"):
+                res["spec_rolloff_95"] = librosa.feature.spectral_rolloff(
+                    S=amp, sr=sr, freq=freq, roll_percent=0.95)[0]
+            if self.wanted("spec_flatness"):
+                res["spec_flatness"] = librosa.feature.spectral_flatness(S=amp)[0]
+
+            if self.need_flux:
+                # differenze tra frame consecutivi, col frame precedente al blocco
+                d = np.zeros(b, dtype=np.float32)
+                w = work[:, :b - 1]
+                np.subtract(amp[:, 1:], amp[:, :-1], out=w)
+                np.maximum(w, 0.0, out=w)
+                d[1:] = np.mean(w, axis=0)
+                if state["prev_amp"] is not None:
+                    d[0] = np.mean(np.maximum(0.0, amp[:, 0] - state["prev_amp"]))
+                state["prev_amp"] = amp[:, -1].copy()
+                res["_flux_d"] = d
+
+        if state["P"] is not None:
+            P = np.divide(S, np.maximum(np.sum(S, axis=0, keepdims=True), 1e-10),
+                          out=state["P"][:, :b])
+            w = work[:, :b]
+            if self.wanted("spec_entropy"):
+                np.add(P, 1e-10, out=w)
+                np.log(w, out=w)
+                w *= P
+                res["spec_entropy"] = -np.sum(w, axis=0) / np.log(self.n_bins + 1e-10)
+            if self.wanted("spec_spread"):
+                np.subtract(freq[:, np.newaxis], res["spec_centroid"][np.newaxis, :], out=w)
+                np.square(w, out=w)
+                w *= P
+                res["spec_spread"] = np.sqrt(np.sum(w, axis=0))
+
+        if self.wanted("spec_crest"):
+            res["spec_crest"] = np.max(S, axis=0) / (np.mean(S, axis=0) + 1e-10)
+        return res
+
+    def _mfcc_block(self, S, floor, work):
+        """MFCC di un blocco S (F, b): power_to_db con soglia fissa, poi DCT."""
+        w = work[:, :S.shape[1]]
+        np.add(S, np.float32(1e-10), out=w)
+        np.maximum(w, np.float32(1e-10), out=w)
+        np.log10(w, out=w)
+        w *= np.float32(10.0)
+        np.maximum(w, floor, out=w)
+        return self.dct_basis @ w
+
+    def _cqt_margin_frames(self):
+        """
+        Frame di contesto per lato con cui la chroma CQT di un segmento coincide
+        con quella del brano intero: mezza FFT del filtro più lungo (7 ottave da C1).
+        """
+        freqs = librosa.cqt_frequencies(n_bins=7 * self.n_chroma_micro,
+                                        fmin=librosa.note_to_hz("C1"),
+                                        bins_per_octave=self.n_chroma_micro)
+        lengths, _ = librosa.filters.wavelet_lengths(freqs=freqs, sr=self.sr)
+        n_fft_cqt = 2 ** int(np.ceil(np.log2(lengths.max())))
+        return -(-(n_fft_cqt // 2) // self.hop_length) + 1
 
     # -----------------------------
-    # 8. Allineamento temporale
+    # Streaming
     # -----------------------------
-    # Troviamo T comune a tutte le feature
-    T_list = [
-        mfcc.shape[1],
-        centroid.shape[1],
-        bandwidth.shape[1],
-        rolloff85.shape[1],
-        rolloff95.shape[1],
-        flatness.shape[1],
-        flux.shape[1],
-        entropy.shape[1],
-        crest.shape[1],
-        spread.shape[1],
-        rms.shape[1],
-        transient_strength.shape[1],
-        chroma_micro.shape[1],
-        chroma_concentration.shape[1],
-    ]
-    T = min(T_list)
-
-    def cut(feat):
-        return feat[:, :T]
-
-    mfcc = cut(mfcc)
-    centroid = cut(centroid)
-    bandwidth = cut(bandwidth)
-    rolloff85 = cut(rolloff85)
-    rolloff95 = cut(rolloff95)
-    flatness = cut(flatness)
-    flux = cut(flux)
-    entropy = cut(entropy)
-    crest = cut(crest)
-    spread = cut(spread)
-    rms = cut(rms)
-    transient_strength = cut(transient_strength)
-    chroma_micro = cut(chroma_micro)
-    chroma_concentration = cut(chroma_concentration)
+    def iter_trajectory(self, source, chunk_frames=None, tuning=None):
+        """
+        Traiettoria in streaming: genera blocchi (n, d) float32 di righe
+        consecutive (colonne in self.feature_names), tenendo in memoria solo
+        il contesto necessario invece del brano intero.
+
+        - source: path (letto a blocchi con iter_audio_blocks) o array mono a self.sr
+        - chunk_frames: righe per blocco (default block_frames; l'ultimo è più corto)
+        - tuning: accordatura per la chroma CQT; se None è stimata sul primo
+          segmento e poi tenuta fissa (il calcolo offline la stima sul brano intero)
+
+        Tra un blocco e l'altro si conservano: n_fft // 2 campioni per la STFT,
+        win // 2 per l'RMS, l'ultimo frame e i 3 frame di ritardo dello spectral
+        flux, e qualche frame di margine per lato per la CQT (la chroma esce
+        quindi in ritardo di quei frame). STFT, descrittori, flux e RMS coincidono
+        con il calcolo offline; gli MFCC usano come soglia top_db il massimo
+        visto finora (offline: massimo globale), quindi differiscono solo nei bin
+        più di 80 dB sotto il picco, prima che il picco sia arrivato.
+        """
+        f32 = np.float32
+        sr, hop, n_fft, win = self.sr, self.hop_length, self.n_fft, self.win_length
+        B = self.block_frames
+        C = chunk_frames or B
+        if isinstance(source, (str, os.PathLike)):
+            blocks = iter_audio_blocks(source, sr=sr, mono=True)
+        else:
+            y = np.asarray(source, dtype=f32)
+            blocks = (y[i:i + 2**18] for i in range(0, len(y), 2**18))
+
+        need_rms = self.wanted("rms")
+        cqt = self.need_chroma and self.chroma_backend == "cqt"
+        margin = self._cqt_margin_frames() if cqt else 0
+        # campioni richiesti prima del centro del primo frame / dopo l'ultimo
+        left = max(n_fft // 2, win // 2, margin * hop)
+        right = max(n_fft // 2 if self.need_S else 0,
+                    win - win // 2 if need_rms else 0,
+                    (margin + 1) * hop if cqt else 0, 1)
 
+        state = self._block_state(B) if self.need_S else None
+        d_tail = np.zeros(_ONSET_PAD - 1, dtype=f32)
+        gmax = f32(0.0)
+
+        buf, buf0, n_read = np.zeros(0, dtype=f32), 0, 0
+
+        def segment(a, b):
+            """y[a:b], con zeri fuori da [0, campioni letti)."""
+            out = np.zeros(b - a, dtype=f32)
+            lo, hi = max(a, buf0), min(b, buf0 + len(buf))
+            if hi > lo:
+                out[lo - a:hi - a] = buf[lo - buf0:hi - buf0]
+            return out
+
+        def chunk(t0, t1, n_total):
+            nonlocal d_tail, gmax, tuning
+            b = t1 - t0
+            feats = {}
+            if self.need_S:
+                # la STFT resta a sotto-blocchi di block_frames, qualunque sia b
+                parts = {}
+                for a in range(t0, t1, B):
+                    c = min(t1, a + B)
+                    seg = segment(a * hop - n_fft // 2, (c - 1) * hop + n_fft // 2)
+                    S = stft_power_block(seg, 0, c - a, n_fft, hop, window=self.window)
+                    res = self._spectral_block(S, state)
+                    if self.need_mfcc:
+                        gmax = max(gmax, S.max())
+                        res["mfcc"] = self._mfcc_block(S, _db_floor(gmax), state["work"])
+                    if self.need_chroma and self.chroma_backend == "stft":
+                        res["chroma"] = chroma_from_power(
+                            S, sr, n_fft, self.n_chroma_micro, filterbank=self.chroma_filterbank)
+                    for n, v in res.items():
+                        parts.setdefault(n, []).append(v)
+                for n, v in parts.items():
+                    v = np.concatenate(v, axis=-1)
+                    feats[n] = v if v.ndim == 2 else v[np.newaxis, :]
+                if self.need_flux:
+                    # flux[t] = d[t - 2] (ritardo di onset_strength), d[<1] = 0
+                    d_all = np.concatenate([d_tail, feats.pop("_flux_d")[0]])
+                    feats["spec_flux"] = d_all[np.newaxis, :b]
+                    feats["transient_strength"] = feats["spec_flux"].copy()
+                    d_tail = d_all[b:]
+
+            if need_rms:
+                seg = segment(t0 * hop - win // 2, (t1 - 1) * hop - win // 2 + win)
+                feats["rms"] = self._rms_frames(seg)[np.newaxis, :]
+
+            if cqt:
+                # segmento allineato ai frame, con margine di contesto per lato;
+                # ai bordi del brano il padding di librosa coincide con quello offline
+                s0 = max(0, (t0 - margin) * hop)
+                s1 = (t1 + margin) * hop
+                if n_total is not None:
+                    s1 = min(s1, n_total)
+                seg = segment(s0, s1)
+                if tuning is None:
+                    tuning = librosa.estimate_tuning(y=seg, sr=sr,
+                                                     bins_per_octave=self.n_chroma_micro)
+                c = self._chroma_cqt(
+                    y=seg, sr=sr, hop_length=hop, n_chroma=self.n_chroma_micro,
+                    bins_per_octave=self.n_chroma_micro, tuning=tuning,
+                )
+                off = (t0 * hop - s0) // hop
+                feats["chroma"] = c[:, off:off + b].astype(f32)
+
+            if self.need_chroma and self.wanted("chroma_concentration"):
+                chroma_norm = _safe_normalize(feats["chroma"], axis=0)
+                feats["chroma_concentration"] = np.max(chroma_norm, axis=0)[np.newaxis, :]
+
+            rows, _ = _assemble_trajectory(feats, self.feature_names)
+            return rows.astype(f32, copy=False)
+
+        t0 = 0
+        for block in blocks:
+            buf = np.concatenate([buf, block])
+            n_read += len(block)
+            while n_read >= (t0 + C - 1) * hop + right:
+                yield chunk(t0, t0 + C, None)
+                t0 += C
+                # scarta i campioni che nessun frame futuro userà
+                keep = max(0, t0 * hop - left)
+                if keep > buf0:
+                    buf = buf[keep - buf0:]
+                    buf0 = keep
+
+        if n_read == 0:
+            return
+        T = n_stft_frames(n_read, hop)
+        if need_rms:
+            T = min(T, 1 + (n_read + 2 * (win // 2) - win) // hop)
+        while t0 < T:
+            t1 = min(T, t0 + C)
+            yield chunk(t0, t1, n_read)
+            t0 = t1
+
+
+# ritardo in frame di onset_strength(S=...) con lag=1 e i default (2048, 512)
+_ONSET_PAD = 1 + 2048 // (2 * 512)
+
+
+def _db_floor(gmax):
+    """Soglia di power_to_db(S + 1e-10, top_db=80) dato il massimo di S."""
+    return np.float32(10.0 * np.log10(max(1e-10, gmax + np.float32(1e-10))) - 80.0)
+
+
+def _assemble_trajectory(feats, feature_names):
+    """Allinea nel tempo i blocchi calcolati e li impila nell'ordine delle colonne."""
     # -----------------------------
-    # 9. Concatenazione finale
+    # 8. Allineamento temporale
     # -----------------------------
-    features = np.vstack([
-        mfcc,                 # n_mfcc
-        centroid,             # 1
-        bandwidth,            # 1
-        rolloff85,            # 1
-        rolloff95,            # 1
-        flux,                 # 1
-        entropy,              # 1
-        crest,                # 1
-        spread,               # 1
-        flatness,             # 1
-        rms,                  # 1
-        transient_strength,   # 1
-        chroma_micro,         # n_chroma_micro
-        chroma_concentration, # 1
-    ])  # shape (d, T)
-
-    trajectory = features.T  # (T, d)
+    # Troviamo T comune a tutte le feature
+    T = min(block.shape[1] for block in feats.values())
 
     # -----------------------------
-    # 10. Nomi delle feature
+    # 9. Concatenazione finale
     # -----------------------------
-    feature_names = []
-
-    # MFCC
-    for i in range(n_mfcc):
-        feature_names.append(f"mfcc_{i+1}")
-
-    # Spectral descriptors
-    feature_names += [
-        "spec_centroid",
-        "spec_bandwidth",
-        "spec_rolloff_85",
-        "spec_rolloff_95",
-        "spec_flux",
-        "spec_entropy",
-        "spec_crest",
-        "spec_spread",
-        "spec_flatness",
-        "rms",
-        "transient_strength",
-    ]
-
-    # Chroma micro
-    for i in range(n_chroma_micro):
-        feature_names.append(f"chroma24_{i+1}")
+    rows = []
+    for name in feature_names:
+        if name.startswith("mfcc_"):
+            row = feats["mfcc"][int(name[5:]) - 1]
+        elif name.startswith("chroma24_"):
+            row = feats["chroma"][int(name[9:]) - 1]
+        else:
+            row = feats[name][0]
+        rows.append(row[:T])
 
-    feature_names.append("chroma_concentration")
+    trajectory = np.vstack(rows).T  # (T, d)
 
     assert trajectory.shape[1] == len(feature_names)
 
-    return trajectory, feature_names
\ No newline at end of file
+    return trajectory, feature_names
@@ -0,0 +1,566 @@
+import json
+import os
+import shutil
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.neighbors import BallTree, KDTree
+
+from utils.Embedding import LandmarkUMAP
+from utils.Projection import ProjectionModel
+from utils.TrajectoryStore import TrajectoryStore, _write_json_atomic
+
+SPACES = ("raw", "scaled", "pca", "umap")
+BACKENDS = ("exact", "ivf")
+
+
+# --------------------
+# 1) Backend esatto: albero + coda di frame aggiunti dopo
+# --------------------
+class _TreeBackend:
+    """
+    KDTree (spazi piccoli: PCA, UMAP) o BallTree (feature complete) sulle
+    righe [0, n_tree); le righe aggiunte dopo restano in una coda cercata a
+    forza bruta, finché non superano rebuild_fraction dell'albero: allora
+    l'albero viene ricostruito su tutto.
+
+    sklearn costruisce l'albero su una copia float64 in RAM di tutte le righe
+    indicizzate (n x dim x 8 byte, salvata anche in tree.joblib): va bene per
+    PCA / UMAP, meno per le feature complete di decine di milioni di frame.
+    Oltre max_tree_mb si ha un ValueError: in quei casi il backend "ivf"
+    lavora in memory-map.
+    """
+
+    def __init__(self, root, leaf_size=40, rebuild_fraction=0.25, max_tree_mb=4096):
+        self.path = Path(root) / "tree.joblib"
+        self.leaf_size = leaf_size
+        self.rebuild_fraction = rebuild_fraction
+        self.max_tree_mb = max_tree_mb
+        self.tree = None
+        self.n_tree = 0
+
+    def load(self):
+        if self.path.exists():
+            self.tree, self.n_tree = joblib.load(self.path)
+        return self
+
+    def update(self, vectors):
+        n, dim = vectors.shape
+        if n - self.n_tree > self.rebuild_fraction * self.n_tree:
+            mb = n * dim * 8 / 2**20
+            if mb > self.max_tree_mb:
+                raise ValueError(
+                    f"Albero su {n} x {dim} float64 ({mb:.0f} MB) oltre max_tree_mb="
+                    f"{self.max_tree_mb}: usare backend='ivf' o uno spazio più piccolo"
+                )
+            cls = KDTree if dim <= 16 else BallTree
+            self.tree = cls(np.asarray(vectors, dtype=np.float64), leaf_size=self.leaf_size)
+            self.n_tree = n
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            joblib.dump((self.tree, self.n_tree), tmp)
+            os.replace(tmp, self.path)
+
+    def search(self, vectors, Q, k, block_rows=65_536):
+        n = len(vectors)
+        k = min(k, n)
+        dist = np.full((len(Q), k), np.inf)
+        rows = np.full((len(Q), k), -1, dtype=np.int64)
+        if self.n_tree:
+            kt = min(k, self.n_tree)
+            dist[:, :kt], rows[:, :kt] = self.tree.query(Q, k=kt)
+        # coda: forza bruta a blocchi, poi fusione con i risultati dell'albero
+        q2 = (Q ** 2).sum(axis=1)[:, None]
+        for i in range(self.n_tree, n, block_rows):
+            B = np.asarray(vectors[i:min(i + block_rows, n)], dtype=np.float64)
+            d = np.sqrt(np.maximum(q2 - 2 * Q @ B.T + (B ** 2).sum(axis=1), 0))
+            dist, rows = _merge_topk(dist, rows, d, np.arange(i, i + len(B)), k)
+        return dist, rows
+
+
+# --------------------
+# 2) Backend approssimato: IVF + codici uint8
+# --------------------
+class _IVFBackend:
+    """
+    Indice a liste invertite: k-means (MiniBatchKMeans su un campione) divide
+    lo spazio in n_lists celle; ogni frame è salvato come codice uint8 per
+    dimensione (quantizzazione scalare, 4x meno spazio dei float32).
+
+    Su disco è una serie di segmenti seg_<i>/, ognuno con codici (codes.u8) e
+    righe dello store (rows.i64) ordinati per cella, letti in memory-map, e
+    gli offset di ogni cella (offsets.i64). update() scrive un segmento nuovo
+    solo con i frame aggiunti (assegnati ai centroidi esistenti); oltre
+    max_segments i segmenti vengono fusi in uno. segments.json, riscritto in
+    modo atomico, elenca i segmenti validi. In RAM restano solo centroidi e
+    offset (più ~20 byte per frame del segmento in scrittura).
+
+    Le query si fanno a lotti: per ogni cella visitata da almeno una query si
+    calcolano in un colpo le distanze sui codici per tutte le query che la
+    visitano; per query si tengono i migliori `rerank` candidati e su quelli
+    si ricalcola la distanza esatta.
+    """
+
+    def __init__(self, root, n_lists=None, n_probe=8, rerank=64, train_rows=200_000,
+                 max_segments=8, block_rows=65_536, seed=0):
+        self.root = Path(root)
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.rerank = rerank
+        self.train_rows = train_rows
+        self.max_segments = max_segments
+        self.block_rows = block_rows
+        self.seed = seed
+        self.centroids = None
+        self.segments = []   # (nome, offsets, codes, rows)
+        self._next_segment = 0
+
+    # -----------------------------
+    # Persistenza
+    # -----------------------------
+    def load(self):
+        path = self.root / "ivf.npz"
+        if path.exists():
+            with np.load(path) as f:
+                self.centroids = f["centroids"]
+                self.lo = f["lo"]
+                self.step = f["step"]
+            self.n_lists = len(self.centroids)
+            try:
+                with open(self.root / "segments.json", encoding="utf-8") as f:
+                    state = json.load(f)
+            except FileNotFoundError:
+                state = {"segments": [], "next": 0}
+            self.segments = [self._open_segment(name) for name in state["segments"]]
+            self._next_segment = state["next"]
+        return self
+
+    def _open_segment(self, name):
+        d = self.root / name
+        offsets = np.fromfile(d / "offsets.i64", dtype=np.int64)
+        n = int(offsets[-1])
+        codes = np.memmap(d / "codes.u8", dtype=np.uint8, mode="r", shape=(n, len(self.lo)))
+        rows = np.memmap(d / "rows.i64", dtype=np.int64, mode="r", shape=(n,))
+        return name, offsets, codes, rows
+
+    def _save_segments(self):
+        _write_json_atomic(self.root / "segments.json", {
+            "segments": [seg[0] for seg in self.segments],
+            "next": self._next_segment,
+        })
+
+    @property
+    def n_indexed(self):
+        return sum(len(seg[3]) for seg in self.segments)
+
+    # -----------------------------
+    # Costruzione
+    # -----------------------------
+    def _train(self, vectors):
+        n, d = vectors.shape
+        rng = np.random.default_rng(self.seed)
+        sample = np.sort(rng.choice(n, size=min(n, self.train_rows), replace=False))
+        X = np.asarray(vectors[sample], dtype=np.float32)
+        if self.n_lists is None:
+            self.n_lists = int(np.clip(4 * np.sqrt(n), 16, 65_536))
+        self.n_lists = min(self.n_lists, len(X))
+        km = MiniBatchKMeans(n_clusters=self.n_lists, random_state=self.seed,
+                             batch_size=4096, n_init=3).fit(X)
+        self.centroids = km.cluster_centers_.astype(np.float32)
+        # range per dimensione dal campione, con un margine per i frame futuri
+        lo, hi = X.min(axis=0), X.max(axis=0)
+        margin = 0.05 * (hi - lo)
+        self.lo = (lo - margin).astype(np.float32)
+        self.step = np.maximum((hi - lo + 2 * margin) / 255, 1e-12).astype(np.float32)
+        np.savez(self.root / "ivf.npz", centroids=self.centroids, lo=self.lo, step=self.step)
+        self.segments = []
+        self._save_segments()
+
+    def _nearest_lists(self, X, n_probe):
+        d = (X ** 2).sum(axis=1)[:, None] - 2 * X @ self.centroids.T + (self.centroids ** 2).sum(axis=1)
+        if n_probe >= self.n_lists:
+            return np.argsort(d, axis=1)
+        part = np.argpartition(d, n_probe - 1, axis=1)[:, :n_probe]
+        return np.take_along_axis(part, np.argsort(np.take_along_axis(d, part, axis=1), axis=1), axis=1)
+
+    def _codes(self, X):
+        return np.clip(np.rint((X - self.lo) / self.step), 0, 255).astype(np.uint8)
+
+    def _write_segment(self, lists, blocks):
+        """
+        Nuovo segmento: lists è la cella di ogni frame (nell'ordine dei
+        blocchi), blocks un generatore di (posizione, codici, righe). Ogni
+        blocco finisce al suo posto nel file ordinato per cella (ordine stabile).
+        """
+        name = f"seg_{self._next_segment:05d}"
+        self._next_segment += 1
+        d = self.root / name
+        d.mkdir(parents=True, exist_ok=True)
+        n = len(lists)
+        counts = np.bincount(lists, minlength=self.n_lists)
+        offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        dest = np.empty(n, dtype=np.int64)
+        dest[np.argsort(lists, kind="stable")] = np.arange(n)
+
+        codes = np.memmap(d / "codes.u8", dtype=np.uint8, mode="w+", shape=(n, len(self.lo)))
+        rows = np.memmap(d / "rows.i64", dtype=np.int64, mode="w+", shape=(n,))
+        for pos, c, r in blocks:
+            codes[dest[pos:pos + len(c)]] = c
+            rows[dest[pos:pos + len(r)]] = r
+        codes.flush()
+        rows.flush()
+        del codes, rows
+        offsets.tofile(d / "offsets.i64")
+        return name
+
+    def update(self, vectors):
+        if self.centroids is None:
+            self._train(vectors)
+        start, n, B = self.n_indexed, len(vectors), self.block_rows
+        if n <= start:
+            return
+        lists = np.concatenate([
+            self._nearest_lists(np.asarray(vectors[i:min(i + B, n)], dtype=np.float32), 1)[:, 0]
+            for i in range(start, n, B)
+        ]).astype(np.int32)
+
+        def blocks():
+            for i in range(start, n, B):
+                X = np.asarray(vectors[i:min(i + B, n)], dtype=np.float32)
+                yield i - start, self._codes(X), np.arange(i, i + len(X))
+
+        name = self._write_segment(lists, blocks())
+        self.segments.append(self._open_segment(name))
+        self._save_segments()
+        if len(self.segments) > self.max_segments:
+            self._merge_segments()
+
+    def _merge_segments(self):
+        """Fonde tutti i segmenti in uno (dentro ogni cella le righe restano in ordine)."""
+        old = self.segments
+        cells = np.arange(self.n_lists, dtype=np.int32)
+        lists = np.concatenate([np.repeat(cells, np.diff(off)) for _, off, _, _ in old])
+        B = self.block_rows
+
+        def blocks():
+            base = 0
+            for _, _, codes, rows in old:
+                for i in range(0, len(rows), B):
+                    yield base + i, np.asarray(codes[i:i + B]), np.asarray(rows[i:i + B])
+                base += len(rows)
+
+        name = self._write_segment(lists, blocks())
+        self.segments = [self._open_segment(name)]
+        self._save_segments()
+        names = [seg[0] for seg in old]
+        del old
+        for old_name in names:
+            shutil.rmtree(self.root / old_name, ignore_errors=True)
+
+    # -----------------------------
+    # Query
+    # -----------------------------
+    def search(self, vectors, Q, k, n_probe=None, rerank=None):
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        rerank = max(rerank or self.rerank, k)
+        Q = np.asarray(Q, dtype=np.float32)
+        nq = len(Q)
+        dist = np.full((nq, k), np.inf)
+        rows = np.full((nq, k), -1, dtype=np.int64)
+
+        # distanza sui codici: sum_j w_j (c_j - qc_j)^2, w = step^2, qc = (q - lo) / step
+        w = self.step ** 2
+        qc = (Q - self.lo) / self.step
+        qw = qc * w
+        qn = (qc * qw).sum(axis=1)
+
+        # coppie (cella, query) raggruppate per cella: ogni cella si legge una volta
+        probes = self._nearest_lists(Q, n_probe)
+        cell = probes.ravel()
+        order = np.argsort(cell, kind="stable")
+        cell, query = cell[order], np.repeat(np.arange(nq), n_probe)[order]
+        bounds = np.flatnonzero(np.r_[True, cell[1:] != cell[:-1], True])
+
+        cand_q, cand_d, cand_r = [], [], []
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            c, qs = cell[a], query[a:b]
+            for _, offsets, codes, seg_rows in self.segments:
+                s, e = offsets[c], offsets[c + 1]
+                if s == e:
+                    continue
+                C = np.asarray(codes[s:e], dtype=np.float32)
+                d = ((C * C) @ w)[:, None] - 2 * C @ qw[qs].T + qn[qs]   # (m, len(qs))
+                r = np.asarray(seg_rows[s:e])
+                if len(C) > rerank:
+                    top = np.argpartition(d, rerank - 1, axis=0)[:rerank]
+                    d, r = np.take_along_axis(d, top, axis=0), r[top]
+                else:
+                    r = np.broadcast_to(r[:, None], d.shape)
+                cand_q.append(np.broadcast_to(qs, d.shape).ravel())
+                cand_d.append(d.ravel())
+                cand_r.append(r.ravel())
+        if not cand_q:
+            return dist, rows
+
+        # i migliori `rerank` per query sulla distanza approssimata...
+        q, d, r = np.concatenate(cand_q), np.concatenate(cand_d), np.concatenate(cand_r)
+        o = np.lexsort((d, q))
+        q, r = q[o], r[o]
+        keep = np.arange(len(q)) - np.searchsorted(q, q) < rerank
+        q, r = q[keep], r[keep]
+
+        # ...poi distanza esatta, leggendo le righe in ordine dalla memory-map
+        uniq, inv = np.unique(r, return_inverse=True)
+        V = np.asarray(vectors[uniq], dtype=np.float64)[inv]
+        exact = np.sqrt(((V - Q[q].astype(np.float64)) ** 2).sum(axis=1))
+        o = np.lexsort((exact, q))
+        q, r, exact = q[o], r[o], exact[o]
+        rank = np.arange(len(q)) - np.searchsorted(q, q)
+        sel = rank < k
+        dist[q[sel], rank[sel]] = exact[sel]
+        rows[q[sel], rank[sel]] = r[sel]
+        return dist, rows
+
+
+def _merge_topk(dist, rows, d_new, rows_new, k):
+    """Fonde i k migliori (dist, rows) con una nuova matrice di distanze."""
+    d = np.concatenate([dist, d_new], axis=1)
+    r = np.concatenate([rows, np.broadcast_to(rows_new, d_new.shape)], axis=1)
+    kk = min(k, d.shape[1])
+    part = np.argpartition(d, kk - 1, axis=1)[:, :kk]
+    order = np.argsort(np.take_along_axis(d, part, axis=1), axis=1)
+    idx = np.take_along_axis(part, order, axis=1)
+    return np.take_along_axis(d, idx, axis=1), np.take_along_axis(r, idx, axis=1)
+
+
+# --------------------
+# 3) Indice dei frame dello store
+# --------------------
+class FrameIndex:
+    """
+    Indice dei vicini più prossimi sui frame di un TrajectoryStore, per cercare
+    "i momenti di altri brani che suonano come questo":
+
+    - space: "raw" (feature dello store), "scaled" / "pca" (ProjectionModel
+      del corpus), "umap" (LandmarkUMAP)
+    - backend: "exact" (KDTree / BallTree) o "ivf" (approssimato, k-means +
+      codici uint8, latenza di pochi ms anche con decine di milioni di frame)
+    - persistente in una cartella: header.json, vettori nello spazio scelto
+      (vectors.f32, solo append; per "raw" si usa direttamente lo store),
+      modello di proiezione e strutture del backend
+    - update(): indicizza i brani aggiunti allo store dopo l'ultima volta
+
+    Le righe dell'indice sono le righe dello store (che è solo append), quindi
+    ogni risultato si traduce in (brano, frame, tempo) senza tabelle in più.
+    """
+
+    def __init__(self, root, store, space="pca", backend="exact", projection=None,
+                 embedding=None, **backend_params):
+        """
+        Apre l'indice in `root` (header.json esistente: space, backend e
+        parametri vengono da lì) o ne crea uno vuoto; update() lo riempie.
+        """
+        self.root = Path(root)
+        self.store = TrajectoryStore(store) if isinstance(store, (str, Path)) else store
+        header_path = self.root / "header.json"
+
+        if header_path.exists():
+            with open(header_path, encoding="utf-8") as f:
+                header = json.load(f)
+            if header["feature_names"] != self.store.feature_names:
+                raise ValueError(f"L'indice {self.root} è di uno store con altre feature")
+            space, backend = header["space"], header["backend"]
+            backend_params = header["backend_params"]
+            if space in ("scaled", "pca"):
+                projection = ProjectionModel.load(self.root / "projection.npz")
+            elif space == "umap":
+                embedding = LandmarkUMAP.load(self.root / "embedding.joblib")
+        else:
+            if space not in SPACES:
+                raise ValueError(f"space deve essere uno di {SPACES}, non {space!r}")
+            if backend not in BACKENDS:
+                raise ValueError(f"backend deve essere uno di {BACKENDS}, non {backend!r}")
+            if space in ("scaled", "pca") and projection is None:
+                raise ValueError(f"Lo spazio {space!r} richiede un ProjectionModel")
+            if space == "umap" and embedding is None:
+                raise ValueError("Lo spazio 'umap' richiede un LandmarkUMAP")
+            self.root.mkdir(parents=True, exist_ok=True)
+            if projection is not None and space in ("scaled", "pca"):
+                projection.save(self.root / "projection.npz")
+            if space == "umap":
+                embedding.save(self.root / "embedding.joblib")
+            header = {
+                "version": 1,
+                "space": space,
+                "backend": backend,
+                "backend_params": backend_params,
+                "feature_names": self.store.feature_names,
+                "n_tracks": 0,
+                "n_rows": 0,
+            }
+            _write_json_atomic(header_path, header)
+
+        self.space = space
+        self.backend_name = backend
+        self.projection = projection
+        self.embedding = embedding
+        self.n_tracks = header["n_tracks"]
+        self.n_rows = header["n_rows"]
+        self._header = header
+        self._vectors_path = self.root / "vectors.f32"
+        self._mm = None
+        cls = _TreeBackend if backend == "exact" else _IVFBackend
+        self.backend = cls(self.root, **backend_params).load()
+
+    # -----------------------------
+    # Spazio dei vettori
+    # -----------------------------
+    @property
+    def dim(self):
+        if self.space == "raw":
+            return self.store.n_features
+        if self.space == "scaled":
+            return len(self.projection.columns_)
+        if self.space == "pca":
+            return self.projection.n_components
+        return self.embedding.umap_params["n_components"]
+
+    def encode(self, X, feature_names=None):
+        """Frame (n, d) nello schema dello store -> vettori float32 dell'indice."""
+        X = np.atleast_2d(np.asarray(X))
+        if self.space == "raw":
+            return X.astype(np.float32, copy=False)
+        if self.space == "scaled":
+            return self.projection.standardize(X.astype(np.float32, copy=False), feature_names)
+        if self.space == "pca":
+            return self.projection.transform(X.astype(np.float32, copy=False), feature_names)
+        return self.embedding.transform(X, feature_names, n_jobs=1)
+
+    @property
+    def vectors(self):
+        """Matrice (n_rows, dim) dei vettori indicizzati, in memory-map."""
+        if self.space == "raw":
+            return self.store.data[:self.n_rows]
+        if self._mm is None or self._mm.shape[0] != self.n_rows:
+            if self.n_rows == 0:
+                self._mm = np.zeros((0, self.dim), dtype=np.float32)
+            else:
+                self._mm = np.memmap(self._vectors_path, dtype=np.float32, mode="r",
+                                     shape=(self.n_rows, self.dim))
+        return self._mm
+
+    # -----------------------------
+    # Inserimento incrementale
+    # -----------------------------
+    def update(self, n_jobs=None):
+        """
+        Indicizza i brani dello store non ancora nell'indice (tutti, la prima
+        volta). Ritorna il numero di frame aggiunti.
+        """
+        self.store.refresh()
+        new = self.store.names[self.n_tracks:]
+        if not new:
+            return 0
+        if self.space != "raw":
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(self.n_rows * self.dim * 4)
+                f.seek(0, os.SEEK_END)
+                for name in new:
+                    if self.space == "umap":
+                        V = self.embedding.transform_store(self.store, name=name, n_jobs=n_jobs)
+                    else:
+                        V = self.encode(self.store.track(name), self.store.feature_names)
+                    f.write(memoryview(np.ascontiguousarray(V, dtype=np.float32)).cast("B"))
+                f.flush()
+                os.fsync(f.fileno())
+
+        added = self.store.n_rows - self.n_rows
+        self.n_tracks = len(self.store.names)
+        self.n_rows = self.store.n_rows
+        self.backend.update(self.vectors)
+        self._header.update(n_tracks=self.n_tracks, n_rows=self.n_rows)
+        _write_json_atomic(self.root / "header.json", self._header)
+        return added
+
+    # -----------------------------
+    # Query
+    # -----------------------------
+    def _locate(self, rows):
+        starts = np.cumsum(np.concatenate(([0], self.store.track_lengths()[:self.n_tracks])))
+        track = np.searchsorted(starts, rows, side="right") - 1
+        return track, rows - starts[track]
+
+    def search(self, V, k=10, exclude=None, **search_params):
+        """
+        k vicini di vettori V (n, dim) già nello spazio dell'indice:
+        (distanze, righe dello store), (n, k), ordinati per distanza (-1 / inf
+        se mancano). exclude: (start, stop) di righe da scartare per ogni
+        query (ad es. il brano stesso); si cercano allora più vicini finché
+        ne restano k.
+        """
+        V = np.atleast_2d(np.asarray(V, dtype=np.float64 if self.backend_name == "exact" else np.float32))
+        if self.n_rows == 0:
+            raise ValueError("Indice vuoto: chiamare update()")
+        kk, found = k, -1
+        while True:
+            dist, rows = self.backend.search(self.vectors, V, min(kk, self.n_rows), **search_params)
+            if exclude is None:
+                return dist[:, :k], rows[:, :k]
+            lo, hi = np.asarray(exclude[0])[..., None], np.asarray(exclude[1])[..., None]
+            keep = (rows >= 0) & ~((rows >= lo) & (rows < hi))
+            # basta quando ogni query ha k risultati o il backend non ne dà altri
+            n_keep = keep.sum(axis=1).min()
+            if n_keep >= k or kk >= self.n_rows or n_keep == found:
+                break
+            kk, found = kk * 4, n_keep
+        order = np.argsort(~keep, axis=1, kind="stable")[:, :k]
+        dist = np.where(np.take_along_axis(keep, order, axis=1), np.take_along_axis(dist, order, axis=1), np.inf)
+        rows = np.where(np.isfinite(dist), np.take_along_axis(rows, order, axis=1), -1)
+        return dist, rows
+
+    def query(self, X, k=10, feature_names=None, exclude=None, **search_params):
+        """
+        k frame più vicini a ogni frame di X (schema dello store), come
+        DataFrame con colonne query, rank, track, frame, time_sec, distance.
+        """
+        dist, rows = self.search(self.encode(X, feature_names), k, exclude=exclude, **search_params)
+        return self._results(dist, rows)
+
+    def query_track(self, name, frames=None, k=10, exclude_self=True, **search_params):
+        """
+        Vicini dei frame `frames` (default: tutti) del brano `name`; con
+        exclude_self i risultati vengono solo da altri brani.
+        """
+        start, stop = self.store.offsets(name)
+        if start >= self.n_rows:
+            raise ValueError(f"Il brano '{name}' non è ancora nell'indice: chiamare update()")
+        rows = np.arange(start, stop) if frames is None else start + np.asarray(frames)
+        V = self.vectors[rows]
+        dist, nn = self.search(V, k, exclude=(start, stop) if exclude_self else None, **search_params)
+        return self._results(dist, nn)
+
+    def _results(self, dist, rows):
+        n, k = rows.shape
+        valid = rows.ravel() >= 0
+        flat = rows.ravel()[valid]
+        track, frame = self._locate(flat)
+        hop = self.store.params.get("hop_seconds")
+        return pd.DataFrame({
+            "query": np.repeat(np.arange(n), k)[valid],
+            "rank": np.tile(np.arange(k), n)[valid],
+            "track": np.asarray(self.store.names, dtype=object)[track],
+            "frame": frame,
+            "time_sec": frame * hop if hop is not None else np.nan,
+            "distance": dist.ravel()[valid],
+        })
+
+
+def open_frame_index(root, store, space="pca", backend="exact", projection=None,
+                     embedding=None, **backend_params):
+    """FrameIndex in `root`, aggiornato con gli ultimi brani dello store."""
+    index = FrameIndex(root, store, space=space, backend=backend, projection=projection,
+                       embedding=embedding, **backend_params)
+    index.update()
+    return index
@@ -0,0 +1,225 @@
+import contextvars
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+
+# --------------------
+# 1) Registro globale dei sink
+# --------------------
+# Finché non c'è nessun sink, stage() ritorna un context manager vuoto già
+# pronto: nessun timer, nessun evento, nessuna allocazione.
+_SINKS = []
+_TRACK_MEMORY = False
+_STARTED_TRACING = False
+_TAGS = contextvars.ContextVar("instrumentation_tags", default={})
+_STACK = threading.local()
+
+
+def enabled():
+    return bool(_SINKS)
+
+
+def add_sink(sink, track_memory=False):
+    """
+    Attiva la strumentazione verso `sink` (un oggetto con .emit(event)).
+    track_memory=True: per ogni fase anche il picco di allocazioni (tracemalloc,
+    che rallenta sensibilmente le fasi con molte piccole allocazioni).
+    """
+    global _TRACK_MEMORY, _STARTED_TRACING
+    _SINKS.append(sink)
+    if track_memory:
+        _TRACK_MEMORY = True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _STARTED_TRACING = True
+    return sink
+
+
+def remove_sink(sink):
+    global _TRACK_MEMORY, _STARTED_TRACING
+    _SINKS.remove(sink)
+    if not _SINKS and _TRACK_MEMORY:
+        _TRACK_MEMORY = False
+        if _STARTED_TRACING:
+            _STARTED_TRACING = False
+            tracemalloc.stop()
+
+
+@contextmanager
+def instrument(sink=None, track_memory=False, **tags):
+    """
+    Strumentazione attiva solo dentro il blocco `with`:
+
+        with instrument(MemorySink(), track=path) as sink:
+            extract_features(path)
+        sink.summary()
+    """
+    sink = sink if sink is not None else MemorySink()
+    add_sink(sink, track_memory=track_memory)
+    try:
+        with tags_context(**tags):
+            yield sink
+    finally:
+        remove_sink(sink)
+
+
+@contextmanager
+def tags_context(**tags):
+    """Tag aggiunti a tutti gli eventi emessi nel blocco (ad es. track=path)."""
+    token = _TAGS.set({**_TAGS.get(), **tags})
+    try:
+        yield
+    finally:
+        _TAGS.reset(token)
+
+
+def emit(event):
+    for sink in list(_SINKS):
+        sink.emit(event)
+
+
+# --------------------
+# 2) Fasi
+# --------------------
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ("name", "func", "tags", "t0", "base", "child_peak")
+
+    def __init__(self, name, func, tags):
+        self.name = name
+        self.func = func
+        self.tags = tags
+
+    def __enter__(self):
+        stack = getattr(_STACK, "stages", None)
+        if stack is None:
+            stack = _STACK.stages = []
+        if _TRACK_MEMORY and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            # il picco finora appartiene alla fase esterna, prima del reset
+            if stack:
+                stack[-1].child_peak = max(stack[-1].child_peak, peak)
+            tracemalloc.reset_peak()
+            self.base = current
+            self.child_peak = current
+        else:
+            self.base = None
+        stack.append(self)
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.t0
+        stack = _STACK.stages
+        stack.pop()
+        event = {"stage": self.name, "func": self.func, "wall_s": wall,
+                 "ts": time.time(), **_TAGS.get(), **self.tags}
+        if self.base is not None and tracemalloc.is_tracing():
+            peak = max(tracemalloc.get_traced_memory()[1], self.child_peak)
+            event["peak_bytes"] = peak - self.base
+            if stack:
+                stack[-1].child_peak = max(stack[-1].child_peak, peak)
+        if exc_type is not None:
+            event["error"] = exc_type.__name__
+        emit(event)
+        return False
+
+
+def stage(name, func=None, **tags):
+    """
+    Context manager per una fase (load, stft, mfcc, spectral, energy, chroma,
+    align, filter, pitch, notes, write). Senza sink è un no-op.
+    """
+    if not _SINKS:
+        return _NULL_STAGE
+    return _Stage(name, func, tags)
+
+
+# --------------------
+# 3) Sink
+# --------------------
+class MemorySink:
+    """Raccoglie gli eventi in memoria; summary() dà i percentili per fase."""
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def emit(self, event):
+        with self._lock:
+            self.events.append(event)
+
+    def clear(self):
+        with self._lock:
+            self.events.clear()
+
+    def summary(self, by=("func", "stage"), percentiles=(50, 90, 99)):
+        """
+        Statistiche per gruppo (default: funzione + fase) su tutto il batch:
+        count, total_s, mean_s, p50_s/p90_s/p99_s e, se misurato, il picco
+        massimo e mediano di allocazioni.
+        """
+        groups = {}
+        for e in self.events:
+            groups.setdefault(tuple(e.get(k) for k in by), []).append(e)
+
+        out = {}
+        for key, events in groups.items():
+            wall = np.array([e["wall_s"] for e in events])
+            row = {
+                "count": len(events),
+                "total_s": float(wall.sum()),
+                "mean_s": float(wall.mean()),
+            }
+            for p, v in zip(percentiles, np.percentile(wall, percentiles)):
+                row[f"p{p:g}_s"] = float(v)
+            peaks = [e["peak_bytes"] for e in events if "peak_bytes" in e]
+            if peaks:
+                row["peak_bytes_max"] = int(max(peaks))
+                row["peak_bytes_p50"] = float(np.percentile(peaks, 50))
+            out[key if len(by) > 1 else key[0]] = row
+        return out
+
+
+class JsonLinesSink:
+    """Un evento JSON per riga, in append su `path` (thread-safe)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._f = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def emit(self, event):
+        line = json.dumps(event, default=str)
+        with self._lock:
+            self._f.write(line + "\n")
+            self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+
+def read_jsonl(path):
+    """Eventi di un file scritto da JsonLinesSink (ad es. per ricaricarli in un MemorySink)."""
+    sink = MemorySink()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                sink.emit(json.loads(line))
+    return sink
@@ -0,0 +1,44 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+
+# --------------------
+# Manifest dei batch ripristinabili (clean_crate, wav_to_midi_folder)
+# --------------------
+def params_hash(params):
+    """Hash stabile dei parametri di un batch (per capire se un output è da rifare)."""
+    blob = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha1(blob.encode()).hexdigest()[:16]
+
+
+def load_manifest(path):
+    """Manifest JSON {nome file: voce}; vuoto se manca o è illeggibile."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_manifest(manifest, path):
+    # scrittura atomica: se il run viene interrotto il manifest resta valido
+    tmp = Path(f"{path}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def is_up_to_date(in_path, out_path, entry, params_hash):
+    """
+    True se l'output esiste, è più recente dell'input e la voce del manifest
+    è "ok" con lo stesso hash dei parametri.
+    """
+    if entry is None or entry.get("status") != "ok":
+        return False
+    if entry.get("params") != params_hash:
+        return False
+    if not out_path.exists():
+        return False
+    return out_path.stat().st_mtime >= in_path.stat().st_mtime
@@ -0,0 +1,102 @@
+from pathlib import Path
+
+import librosa
+import numpy as np
+
+from utils.AudioCleaning import clean_signal, summarize_signal, write_audio
+from utils.AudioLoading import load_audio
+from utils.FeatureExtraction import FeatureExtractor
+
+
+# --------------------
+# Pipeline fusa: una sola decodifica per brano
+# --------------------
+def process_track(
+    in_path,
+    clean_path=None,
+    sr=44100,
+    use_mono=True,
+    apply_bandpass=True,
+    lowcut=30.0,
+    highcut=18000.0,
+    trim_edges=False,
+    trim_db=40.0,
+    hop_seconds=0.25,
+    win_seconds=1.0,
+    n_mfcc=40,
+    n_chroma_micro=24,
+    groups=None,
+    columns=None,
+    chroma_backend="cqt",
+    cache=None,
+    extractor=None,
+    n_threads=1,
+):
+    """
+    clean_techno → summarize_audio (raw e clean) → extract_features, in memoria.
+
+    Il file viene decodificato e ricampionato una volta sola; pulizia,
+    riassunti e traiettoria sono calcolati sugli stessi buffer.
+
+    - clean_path: se dato, salva anche il WAV pulito (come clean_techno);
+      con None non si scrive nulla su disco
+    - groups / columns: sottoinsieme di feature della traiettoria
+      (vedi extract_features), chroma_backend ("cqt" / "stft")
+    - cache:      SpectrogramCache opzionale, condivisa da tutte le fasi
+    - extractor:  FeatureExtractor già costruito (per i batch); se dato,
+      i suoi parametri sostituiscono quelli di feature qui sopra
+    - n_threads:  STFT multi-thread per riassunti e traiettoria (brani lunghi)
+
+    Nota: la traiettoria è calcolata sul segnale pulito in float, non sul WAV
+    a 16 bit riletto da disco; le differenze sono dell'ordine del LSB.
+
+    Ritorna un dict con "raw" e "clean" (i riassunti di summarize_audio),
+    "trajectory" (T, d) e "feature_names".
+    """
+    # 1. Un'unica decodifica (+ ricampionamento)
+    y_raw, sr = load_audio(in_path, sr=sr, mono=use_mono, cache=False)
+
+    # 2. Pulizia in memoria
+    y_clean = clean_signal(
+        y_raw,
+        sr,
+        apply_bandpass=apply_bandpass,
+        lowcut=lowcut,
+        highcut=highcut,
+        trim_edges=trim_edges,
+        trim_db=trim_db,
+    )
+    if clean_path is not None:
+        write_audio(clean_path, y_clean, sr)
+
+    # summarize_audio / extract_features lavorano in mono float32
+    y_raw_mono = librosa.to_mono(y_raw)
+    y_clean_mono = librosa.to_mono(y_clean).astype(np.float32)
+
+    # 3. Riassunti raw / clean
+    raw_summary = summarize_signal(y_raw_mono, sr, cache=cache, n_threads=n_threads)
+    clean_summary = summarize_signal(y_clean_mono, sr, cache=cache, n_threads=n_threads)
+
+    # 4. Traiettoria completa
+    if extractor is None:
+        extractor = FeatureExtractor(
+            sr=sr,
+            hop_seconds=hop_seconds,
+            win_seconds=win_seconds,
+            n_mfcc=n_mfcc,
+            n_chroma_micro=n_chroma_micro,
+            groups=groups,
+            columns=columns,
+            chroma_backend=chroma_backend,
+            cache=cache,
+            n_threads=n_threads,
+        )
+    trajectory, feature_names = extractor.extract(y_clean_mono)
+
+    return {
+        "track": Path(in_path).stem,
+        "raw": raw_summary,
+        "clean": clean_summary,
+        "trajectory": trajectory,
+        "feature_names": feature_names,
+    }
@@ -0,0 +1,300 @@
+import hashlib
+import json
+from pathlib import Path
+
+import numpy as np
+from sklearn.decomposition import IncrementalPCA
+
+from utils.FeatureExtraction import FEATURE_GROUPS, feature_group
+from utils.TrajectoryStore import TrajectoryStore
+
+
+# --------------------
+# 1) Statistiche in streaming
+# --------------------
+class RunningMoments:
+    """
+    Media e varianza per colonna aggiornate a blocchi (formula di Chan et al.
+    per unire due insiemi), in float64: stesso risultato di StandardScaler
+    sull'intera matrice, senza tenerla in memoria.
+    """
+
+    def __init__(self, n_features):
+        self.n = 0
+        self.mean = np.zeros(n_features)
+        self.m2 = np.zeros(n_features)
+
+    def update(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        nb = len(X)
+        if nb == 0:
+            return self
+        mean_b = X.mean(axis=0)
+        m2_b = ((X - mean_b) ** 2).sum(axis=0)
+        n = self.n + nb
+        delta = mean_b - self.mean
+        self.mean = self.mean + delta * (nb / n)
+        self.m2 = self.m2 + m2_b + delta ** 2 * (self.n * nb / n)
+        self.n = n
+        return self
+
+    @property
+    def var(self):
+        return self.m2 / self.n if self.n else np.zeros_like(self.m2)
+
+
+# --------------------
+# 2) Modello di proiezione (scaler + PCA) su tutto il corpus
+# --------------------
+class ProjectionModel:
+    """
+    Standardizzazione + PCA stimate una volta su tutte le traiettorie del
+    corpus, così ogni brano (e ogni frame nuovo) finisce nello stesso spazio.
+
+    - fit(store): due passate a blocchi sulla matrice dello store
+      (TrajectoryStore o array (N, d)): momenti in streaming per lo scaler,
+      poi IncrementalPCA sui blocchi standardizzati. I blocchi sono
+      dimensionati su memory_mb, indipendentemente dal numero di frame.
+    - save / load: un .npz con i parametri e lo schema (feature_names dello
+      store e colonne usate); transform controlla lo schema dei dati.
+    - transform(X): un solo prodotto matrice, X[:, colonne] @ A + b.
+
+    Attributi come in sklearn: mean_, scale_, components_,
+    explained_variance_, explained_variance_ratio_, n_samples_seen_.
+    """
+
+    def __init__(self, n_components=10, columns=None, drop=(), memory_mb=256):
+        """
+        - columns: colonne da usare (nomi o gruppo di FEATURE_GROUPS); default tutte
+        - drop:    colonne da escludere (ad es. ["spec_flatness", "transient_strength"])
+        """
+        self.n_components = n_components
+        self.columns = columns
+        self.drop = list(drop)
+        self.memory_mb = memory_mb
+        self.feature_names = None   # schema dei dati in ingresso
+        self.columns_ = None        # colonne usate, in ordine
+
+    # -----------------------------
+    # Schema
+    # -----------------------------
+    def _select(self, feature_names):
+        if self.columns is None:
+            names = list(feature_names)
+        elif isinstance(self.columns, str):
+            if self.columns in FEATURE_GROUPS:
+                names = [n for n in feature_names if feature_group(n) == self.columns]
+            else:
+                names = [self.columns]
+        else:
+            names = list(self.columns)
+        return [n for n in names if n not in self.drop]
+
+    def column_index(self, feature_names):
+        """Indici delle colonne del modello nei dati con questi feature_names."""
+        pos = {n: i for i, n in enumerate(feature_names)}
+        missing = [n for n in self.columns_ if n not in pos]
+        if missing:
+            raise ValueError(f"Colonne del modello assenti nei dati: {missing}")
+        return np.array([pos[n] for n in self.columns_])
+
+    # -----------------------------
+    # Fit a blocchi
+    # -----------------------------
+    def _chunk_rows(self, d):
+        # blocco float64 + copia standardizzata + SVD di IncrementalPCA
+        # (blocco impilato alle componenti): ~6 copie del blocco
+        rows = int(self.memory_mb * 2**20 / (6 * 8 * max(d, 1)))
+        return max(rows, 4 * self.n_components, 1)
+
+    def fit(self, store, feature_names=None):
+        """store: TrajectoryStore oppure matrice (N, d) con i suoi feature_names."""
+        if isinstance(store, TrajectoryStore):
+            X = store.data
+            feature_names = store.feature_names
+        else:
+            X = store
+            if feature_names is None:
+                raise ValueError("Servono i feature_names delle colonne di X")
+        self.feature_names = list(feature_names)
+        self.columns_ = self._select(self.feature_names)
+        idx = self.column_index(self.feature_names)
+        d = len(idx)
+        N = len(X)
+        if N < self.n_components:
+            raise ValueError(f"{N} frame: servono almeno n_components={self.n_components} righe")
+        chunk = self._chunk_rows(d)
+
+        # 1) media e varianza
+        moments = RunningMoments(d)
+        for i in range(0, N, chunk):
+            moments.update(X[i:i + chunk][:, idx])
+        self.mean_ = moments.mean
+        std = np.sqrt(moments.var)
+        self.scale_ = np.where(std > 0, std, 1.0)   # colonne costanti: scala 1, come StandardScaler
+        self.var_ = moments.var
+
+        # 2) PCA incrementale sui blocchi standardizzati; l'ultimo blocco,
+        # se più corto di n_components, viene unito al precedente
+        ipca = IncrementalPCA(n_components=self.n_components)
+        starts = list(range(0, N, chunk))
+        if len(starts) > 1 and N - starts[-1] < self.n_components:
+            starts.pop()
+        for k, i in enumerate(starts):
+            end = starts[k + 1] if k + 1 < len(starts) else N
+            ipca.partial_fit((np.asarray(X[i:end][:, idx], dtype=np.float64) - self.mean_) / self.scale_)
+
+        self.components_ = ipca.components_
+        self.explained_variance_ = ipca.explained_variance_
+        self.explained_variance_ratio_ = ipca.explained_variance_ratio_
+        self.singular_values_ = ipca.singular_values_
+        self.pca_mean_ = ipca.mean_
+        self.n_samples_seen_ = int(ipca.n_samples_seen_)
+        self._build_affine()
+        return self
+
+    def _build_affine(self):
+        # (X - mean) / scale - pca_mean, poi @ components.T  ==  X @ A + b
+        # (array contigui: stessi risultati prima e dopo save / load)
+        self.components_ = np.ascontiguousarray(self.components_)
+        A = (self.components_ / self.scale_).T
+        b = -((self.mean_ / self.scale_ + self.pca_mean_) @ self.components_.T)
+        self._A64, self._b64 = A, b
+        self._A32, self._b32 = A.astype(np.float32), b.astype(np.float32)
+        self._idx_cache = {}
+
+    # -----------------------------
+    # Applicazione
+    # -----------------------------
+    def _columns_of(self, X, feature_names):
+        """Colonne del modello da X: schema completo (d dello store) o già selezionate."""
+        if feature_names is not None:
+            key = tuple(feature_names)
+            if key not in self._idx_cache:
+                self._idx_cache[key] = self.column_index(feature_names)
+            return X[..., self._idx_cache[key]]
+        if X.shape[-1] == len(self.feature_names):
+            if len(self.columns_) == len(self.feature_names):
+                return X
+            key = tuple(self.feature_names)
+            if key not in self._idx_cache:
+                self._idx_cache[key] = self.column_index(self.feature_names)
+            return X[..., self._idx_cache[key]]
+        if X.shape[-1] == len(self.columns_):
+            return X
+        raise ValueError(
+            f"{X.shape[-1]} colonne: attese {len(self.feature_names)} (schema completo) "
+            f"o {len(self.columns_)} (colonne del modello)"
+        )
+
+    def transform(self, X, feature_names=None):
+        """
+        Proiezione di frame (n, d) o di un singolo frame (d,). Con dati float32
+        il calcolo è in float32 (dati dello store), altrimenti in float64.
+        feature_names: schema di X, se diverso da quello del fit.
+        """
+        X = self._columns_of(np.asarray(X), feature_names)
+        if X.dtype == np.float32:
+            return X @ self._A32 + self._b32
+        return X.astype(np.float64, copy=False) @ self._A64 + self._b64
+
+    def standardize(self, X, feature_names=None):
+        """Solo lo scaler (X - mean) / scale sulle colonne del modello."""
+        X = self._columns_of(np.asarray(X), feature_names)
+        return ((X - self.mean_) / self.scale_).astype(X.dtype if X.dtype == np.float32 else np.float64)
+
+    def transform_store(self, store, name=None, chunk_rows=None):
+        """Proiezione di un brano dello store (o di tutto lo store, a blocchi)."""
+        if name is not None:
+            return self.transform(store.track(name), store.feature_names)
+        chunk_rows = chunk_rows or self._chunk_rows(store.n_features)
+        out = np.empty((store.n_rows, self.n_components), dtype=np.float32)
+        for i, block in store.iter_rows(chunk_rows):
+            out[i:i + len(block)] = self.transform(block, store.feature_names)
+        return out
+
+    # -----------------------------
+    # Persistenza
+    # -----------------------------
+    def fingerprint(self):
+        """
+        Hash di schema e parametri stimati: identifica lo spazio di proiezione
+        (uguale per il modello e per la sua copia salvata e ricaricata).
+        """
+        h = hashlib.sha1(json.dumps([self.feature_names, self.columns_, self.n_components]).encode())
+        for a in (self.mean_, self.scale_, self.components_, self.pca_mean_):
+            h.update(np.ascontiguousarray(a, dtype=np.float64).tobytes())
+        return h.hexdigest()[:16]
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        meta = {
+            "version": 1,
+            "n_components": self.n_components,
+            "feature_names": self.feature_names,
+            "columns": self.columns_,
+            "drop": self.drop,
+            "n_samples_seen": self.n_samples_seen_,
+        }
+        tmp = path.with_name(path.name + ".tmp.npz")
+        np.savez(
+            tmp,
+            meta=np.array(json.dumps(meta, ensure_ascii=False)),
+            mean=self.mean_,
+            scale=self.scale_,
+            var=self.var_,
+            components=self.components_,
+            explained_variance=self.explained_variance_,
+            explained_variance_ratio=self.explained_variance_ratio_,
+            singular_values=self.singular_values_,
+            pca_mean=self.pca_mean_,
+        )
+        tmp.replace(path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as f:
+            meta = json.loads(str(f["meta"]))
+            model = cls(n_components=meta["n_components"], columns=meta["columns"], drop=meta["drop"])
+            model.feature_names = meta["feature_names"]
+            model.columns_ = meta["columns"]
+            model.n_samples_seen_ = meta["n_samples_seen"]
+            model.mean_ = f["mean"]
+            model.scale_ = f["scale"]
+            model.var_ = f["var"]
+            model.components_ = f["components"]
+            model.explained_variance_ = f["explained_variance"]
+            model.explained_variance_ratio_ = f["explained_variance_ratio"]
+            model.singular_values_ = f["singular_values"]
+            model.pca_mean_ = f["pca_mean"]
+        model._build_affine()
+        return model
+
+
+def fit_projection(store, path=None, n_components=10, columns=None, drop=(), memory_mb=256,
+                   allow_stale=False):
+    """
+    ProjectionModel dello store: caricato da `path` se esiste ed è stato
+    stimato sullo stesso schema e su tutte le righe attuali dello store,
+    altrimenti stimato e salvato in `path`.
+
+    Dopo aver aggiunto brani allo store il modello salvato descrive solo il
+    vecchio sottoinsieme del corpus, quindi viene ristimato; allow_stale=True
+    lo riusa comunque (ad es. per tenere fisso lo spazio di UMAP e degli
+    indici già costruiti sopra).
+    """
+    if isinstance(store, (str, Path)):
+        store = TrajectoryStore(store)
+    if path is not None and Path(path).exists():
+        model = ProjectionModel.load(path)
+        wanted = ProjectionModel(n_components, columns=columns, drop=drop)
+        if (model.feature_names == store.feature_names and model.n_components == n_components
+                and model.columns_ == wanted._select(store.feature_names)
+                and (allow_stale or model.n_samples_seen_ == store.n_rows)):
+            return model
+    model = ProjectionModel(n_components, columns=columns, drop=drop, memory_mb=memory_mb).fit(store)
+    if path is not None:
+        model.save(path)
+    return model
@@ -0,0 +1,252 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import librosa
+import numpy as np
+
+
+# --------------------
+# 1) Hash del contenuto audio
+# --------------------
+def audio_hash(y):
+    """
+    Hash del contenuto di un segnale già decodificato (mono o stereo).
+    Due file con lo stesso audio (anche se rinominati o spostati)
+    producono lo stesso hash, quindi condividono le voci di cache.
+    """
+    y = np.ascontiguousarray(y, dtype=np.float32)
+    h = hashlib.blake2b(digest_size=20)
+    h.update(str(y.shape).encode())
+    h.update(memoryview(y).cast("B"))
+    return h.hexdigest()
+
+
+def spectrogram_dtype(y):
+    """dtype di |STFT(y)|^2 con librosa: float32 per audio float32, float64 per float64."""
+    return np.result_type(np.asarray(y).dtype, np.float32)
+
+
+def _window_key(window):
+    """Finestra nella chiave di cache: il nome, o l'hash dei campioni se è un array."""
+    if isinstance(window, (str, tuple, float)):
+        return str(window)
+    w = np.ascontiguousarray(window, dtype=np.float64)
+    return hashlib.blake2b(memoryview(w).cast("B"), digest_size=12).hexdigest()
+
+
+# --------------------
+# 2) Cache su disco degli spettrogrammi
+# --------------------
+class SpectrogramCache:
+    """
+    Cache su disco di spettrogrammi di potenza |STFT|^2, indirizzata per contenuto.
+
+    - chiave: hash dell'audio + (sr, n_fft, hop_length, win_length, window, dtype)
+    - ogni voce è un file .npy nel dtype dello spettrogramma (float32 per audio
+      float32, come la STFT di librosa), riletto in memory-map copy-on-write:
+      stesso dtype e stessa scrivibilità del risultato calcolato, senza copie
+      e senza toccare il file su disco
+    - politica LRU limitata in byte: a ogni accesso si aggiorna l'mtime del file,
+      e quando la dimensione totale supera max_bytes si eliminano le voci
+      usate meno di recente.
+    """
+
+    def __init__(self, root=".spec_cache", max_bytes=20 * 1024**3):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_bytes)
+
+    def key(self, y, sr, n_fft, hop_length, win_length=None, content_hash=None,
+            window="hann", dtype=None):
+        """
+        dtype: dtype dello spettrogramma (default: quello che librosa.stft
+        darebbe per y, vedi spectrogram_dtype).
+        """
+        if win_length is None:
+            win_length = n_fft
+        if content_hash is None:
+            content_hash = audio_hash(y)
+        if dtype is None:
+            dtype = spectrogram_dtype(y)
+        params = json.dumps(
+            [int(sr), int(n_fft), int(hop_length), int(win_length),
+             _window_key(window), np.dtype(dtype).str]
+        )
+        h = hashlib.blake2b(digest_size=20)
+        h.update(content_hash.encode())
+        h.update(params.encode())
+        return h.hexdigest()
+
+    def _path(self, key):
+        return self.root / f"{key}.npy"
+
+    def get(self, key):
+        """Ritorna lo spettrogramma in memory-map (copy-on-write) o None."""
+        path = self._path(key)
+        try:
+            S = np.load(path, mmap_mode="c")
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        # "tocca" il file: l'mtime fa da timestamp di ultimo utilizzo
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return S
+
+    def put(self, key, S):
+        path = self._path(key)
+        tmp = path.with_name(f"{key}.{os.getpid()}.tmp.npy")
+        # np.save conserva l'ordine in memoria (la STFT di librosa è
+        # Fortran-order): le riduzioni successive danno risultati identici
+        np.save(tmp, np.asarray(S))
+        # rename atomico: un processo concorrente non vede mai file a metà
+        os.replace(tmp, path)
+        self.evict()
+        return path
+
+    def open_entry(self, key, shape, dtype=np.float32):
+        """
+        Voce scrivibile a blocchi (memory-map, Fortran-order come la STFT di
+        librosa): per riempirla senza tenere S intero in RAM. dtype deve essere
+        quello usato nella chiave. Va chiusa con commit_entry.
+        """
+        tmp = self._path(key).with_name(f"{key}.{os.getpid()}.tmp.npy")
+        S = np.lib.format.open_memmap(tmp, mode="w+", dtype=dtype,
+                                      shape=tuple(shape), fortran_order=True)
+        return S, tmp
+
+    def commit_entry(self, key, S, tmp):
+        S.flush()
+        del S
+        os.replace(tmp, self._path(key))
+        self.evict()
+
+    def size_bytes(self):
+        return sum(p.stat().st_size for p in self.root.glob("*.npy"))
+
+    def evict(self):
+        """Elimina le voci meno recenti finché la cache sta in max_bytes."""
+        entries = []
+        for p in self.root.glob("*.npy"):
+            if p.name.endswith(".tmp.npy"):
+                continue
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+
+        total = sum(size for _, size, _ in entries)
+        entries.sort(key=lambda e: e[0])  # più vecchie per prime
+        for _, size, p in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for p in self.root.glob("*.npy"):
+            p.unlink(missing_ok=True)
+
+
+# --------------------
+# 3) Spettrogramma di potenza (con cache opzionale)
+# --------------------
+def power_spectrogram(y, sr, n_fft, hop_length, win_length=None, cache=None,
+                      window="hann", n_threads=1):
+    """
+    S = |STFT(y)|^2, come calcolato finora in summarize_audio / extract_features.
+
+    window può anche essere un array già centrato su n_fft (precalcolato,
+    vedi FeatureExtractor): il risultato è lo stesso, senza ricostruirlo.
+
+    n_threads > 1: STFT a blocchi di frame su un pool di thread (le FFT
+    rilasciano il GIL), utile per un singolo brano lungo. I blocchi sono
+    allineati ai frame, quindi il risultato è identico bit per bit.
+
+    Se `cache` (SpectrogramCache) è dato, la STFT viene calcolata solo la prima
+    volta per quel contenuto audio e quei parametri; le volte successive
+    lo spettrogramma viene riletto dal disco in memory-map.
+    """
+    if cache is not None:
+        key = cache.key(y, sr, n_fft, hop_length, win_length, window=window)
+        S = cache.get(key)
+        if S is not None:
+            return S
+
+    if n_threads is not None and n_threads > 1:
+        S = stft_power_threaded(y, n_fft, hop_length, win_length=win_length,
+                                window=window, n_threads=n_threads)
+    else:
+        stft_win_length = win_length if isinstance(window, str) else len(window)
+        S = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length,
+                                win_length=stft_win_length, window=window)) ** 2
+
+    if cache is not None:
+        cache.put(key, S)
+    return S
+
+
+# --------------------
+# 4) STFT a blocchi di frame
+# --------------------
+def n_stft_frames(n_samples, hop_length):
+    """Numero di frame di librosa.stft(center=True) su n_samples campioni."""
+    return 1 + n_samples // hop_length
+
+
+def center_pad(y, n_fft):
+    """Padding a zeri di n_fft // 2 per lato, come librosa.stft(center=True)."""
+    return np.pad(y, (n_fft // 2, n_fft // 2), mode="constant")
+
+
+def stft_power_block(y_pad, t0, t1, n_fft, hop_length, window="hann"):
+    """
+    Frame [t0, t1) di |STFT|^2, calcolati dal segnale già centrato (center_pad).
+
+    Ogni frame dipende solo dai suoi n_fft campioni, quindi i blocchi
+    concatenati coincidono con la STFT del brano intero.
+    """
+    seg = y_pad[t0 * hop_length:(t1 - 1) * hop_length + n_fft]
+    win_length = n_fft if not isinstance(window, str) else None
+    return np.abs(librosa.stft(seg, n_fft=n_fft, hop_length=hop_length,
+                               win_length=win_length, window=window,
+                               center=False)) ** 2
+
+
+def stft_power_threaded(y, n_fft, hop_length, win_length=None, window="hann",
+                        n_threads=4, chunks_per_thread=4):
+    """
+    |STFT(y)|^2 come librosa.stft(center=True), calcolata su un pool di thread.
+
+    Il segnale centrato viene diviso in blocchi di frame (con la sovrapposizione
+    di n_fft - hop campioni implicita nello slicing), ogni thread scrive il suo
+    blocco direttamente nella matrice di uscita (F, T), Fortran-order.
+    """
+    if isinstance(window, str):
+        window = librosa.util.pad_center(
+            librosa.filters.get_window(window, win_length or n_fft, fftbins=True),
+            size=n_fft,
+        )
+    y_pad = center_pad(y, n_fft)
+    T = n_stft_frames(len(y), hop_length)
+    # stesso dtype di librosa.stft su y (float64 per audio float64)
+    S = np.empty((n_fft // 2 + 1, T), dtype=spectrogram_dtype(y), order="F")
+
+    step = max(1, -(-T // (n_threads * chunks_per_thread)))
+    bounds = [(t0, min(T, t0 + step)) for t0 in range(0, T, step)]
+
+    def run(bound):
+        t0, t1 = bound
+        S[:, t0:t1] = stft_power_block(y_pad, t0, t1, n_fft, hop_length, window=window)
+
+    with ThreadPoolExecutor(max_workers=n_threads) as pool:
+        list(pool.map(run, bounds))
+    return S
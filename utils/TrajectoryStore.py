@@ -0,0 +1,252 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from utils.FeatureExtraction import FEATURE_GROUPS, feature_group
+
+
+# --------------------
+# 1) Store colonnare delle traiettorie
+# --------------------
+class TrajectoryStore:
+    """
+    Archivio delle traiettorie di un intero corpus, in una cartella:
+
+    - header.json: feature_names e parametri di estrazione
+      (sr, hop_seconds, win_seconds, n_mfcc, n_chroma_micro, ...)
+    - data.f32:    tutte le righe (frame) di tutti i brani, float32, una dopo
+                   l'altra; si legge come un'unica matrice (N, d) in memory-map
+    - index.json:  per ogni brano nome, riga di inizio e numero di frame
+
+    Solo append: un brano aggiunto non si modifica più. L'indice viene riscritto
+    in modo atomico dopo i dati, quindi dopo un'interruzione le righe non
+    indicizzate vengono ignorate (e sovrascritte all'append successivo).
+
+    Le letture sono viste sulla memory-map, senza copie: ad es.
+    store.columns("mfcc") sono gli MFCC di tutti i brani in una sola slice.
+    """
+
+    def __init__(self, root, feature_names=None, params=None):
+        """
+        Apre lo store in `root`; se non esiste lo crea con feature_names e params.
+        Se esiste e feature_names / params sono dati, devono coincidere con
+        quelli salvati (ValueError altrimenti): niente traiettorie incompatibili
+        nella stessa matrice.
+        """
+        self.root = Path(root)
+        header_path = self.root / "header.json"
+
+        if header_path.exists():
+            with open(header_path, encoding="utf-8") as f:
+                header = json.load(f)
+            if feature_names is not None and list(feature_names) != header["feature_names"]:
+                raise ValueError(f"feature_names diversi da quelli dello store {self.root}")
+            if params is not None and _jsonable(params) != header["params"]:
+                raise ValueError(
+                    f"Parametri {params} diversi da quelli dello store: {header['params']}"
+                )
+        else:
+            if feature_names is None:
+                raise FileNotFoundError(f"Nessuno store in {self.root} (servono feature_names per crearlo)")
+            header = {
+                "version": 1,
+                "dtype": "float32",
+                "feature_names": list(feature_names),
+                "params": _jsonable(params or {}),
+            }
+            self.root.mkdir(parents=True, exist_ok=True)
+            _write_json_atomic(header_path, header)
+            _write_json_atomic(self.root / "index.json",
+                               {"names": [], "offsets": [], "n_frames": []})
+
+        self.feature_names = header["feature_names"]
+        self.params = header["params"]
+        self.n_features = len(self.feature_names)
+        self._col = {name: i for i, name in enumerate(self.feature_names)}
+        self._data_path = self.root / "data.f32"
+        self._load_index()
+        self._mm = None
+
+    # -----------------------------
+    # Indice
+    # -----------------------------
+    def _load_index(self):
+        with open(self.root / "index.json", encoding="utf-8") as f:
+            index = json.load(f)
+        self.names = index["names"]
+        self._offsets = np.asarray(index["offsets"], dtype=np.int64)
+        self._n_frames = np.asarray(index["n_frames"], dtype=np.int64)
+        self._pos = {name: i for i, name in enumerate(self.names)}
+
+    def _save_index(self):
+        _write_json_atomic(self.root / "index.json", {
+            "names": self.names,
+            "offsets": self._offsets.tolist(),
+            "n_frames": self._n_frames.tolist(),
+        })
+
+    @property
+    def n_rows(self):
+        return int(self._offsets[-1] + self._n_frames[-1]) if len(self.names) else 0
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._pos
+
+    def offsets(self, name):
+        """(start, stop) delle righe del brano nella matrice."""
+        i = self._pos[name]
+        start = int(self._offsets[i])
+        return start, start + int(self._n_frames[i])
+
+    def track_lengths(self):
+        """Numero di frame di ogni brano, nell'ordine di self.names."""
+        return self._n_frames.copy()
+
+    def track_ids(self):
+        """Indice del brano (posizione in self.names) per ogni riga della matrice."""
+        return np.repeat(np.arange(len(self.names)), self._n_frames)
+
+    # -----------------------------
+    # Scrittura (solo append)
+    # -----------------------------
+    def append(self, name, trajectory):
+        """Aggiunge la traiettoria (T, d) di un brano."""
+        return self.append_chunks(name, [trajectory])
+
+    def append_chunks(self, name, chunks):
+        """
+        Aggiunge un brano a blocchi di righe (n, d), ad es. da
+        FeatureExtractor.iter_trajectory, senza tenerlo tutto in memoria.
+        """
+        if name in self._pos:
+            raise ValueError(f"Il brano '{name}' è già nello store")
+
+        start = self.n_rows
+        n = 0
+        with open(self._data_path, "ab") as f:
+            # scarta eventuali righe scritte ma non indicizzate
+            f.truncate(start * self.n_features * 4)
+            f.seek(0, os.SEEK_END)
+            for chunk in chunks:
+                chunk = np.ascontiguousarray(chunk, dtype=np.float32)
+                if chunk.ndim != 2 or chunk.shape[1] != self.n_features:
+                    raise ValueError(
+                        f"Blocco di shape {chunk.shape}, attese {self.n_features} colonne"
+                    )
+                f.write(memoryview(chunk).cast("B"))
+                n += len(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.names.append(name)
+        self._pos[name] = len(self.names) - 1
+        self._offsets = np.append(self._offsets, start)
+        self._n_frames = np.append(self._n_frames, n)
+        self._save_index()
+        self._mm = None
+        return start, start + n
+
+    # -----------------------------
+    # Lettura (viste senza copia)
+    # -----------------------------
+    @property
+    def data(self):
+        """Matrice (N, d) di tutte le righe indicizzate, in memory-map di sola lettura."""
+        n = self.n_rows
+        if self._mm is None or self._mm.shape[0] != n:
+            if n == 0:
+                self._mm = np.zeros((0, self.n_features), dtype=np.float32)
+            else:
+                self._mm = np.memmap(self._data_path, dtype=np.float32, mode="r",
+                                     shape=(n, self.n_features))
+        return self._mm
+
+    def refresh(self):
+        """Rilegge l'indice (brani aggiunti da un altro processo)."""
+        self._load_index()
+        self._mm = None
+
+    def track(self, name):
+        """Traiettoria (T, d) di un brano."""
+        start, stop = self.offsets(name)
+        return self.data[start:stop]
+
+    def __getitem__(self, name):
+        return self.track(name)
+
+    def column_index(self, columns):
+        """
+        Indici delle colonne: un gruppo di FEATURE_GROUPS ("mfcc", "chroma", ...),
+        un nome di colonna o una lista di nomi.
+        """
+        if isinstance(columns, str):
+            if columns in FEATURE_GROUPS:
+                return [i for i, n in enumerate(self.feature_names) if feature_group(n) == columns]
+            columns = [columns]
+        return [self._col[c] for c in columns]
+
+    def columns(self, columns, name=None):
+        """
+        Colonne di tutto il corpus (o di un brano). Se le colonne sono
+        contigue (come un gruppo) il risultato è una vista, altrimenti una copia.
+        """
+        idx = self.column_index(columns)
+        X = self.data if name is None else self.track(name)
+        if idx and idx == list(range(idx[0], idx[-1] + 1)):
+            return X[:, idx[0]:idx[-1] + 1]
+        return X[:, idx]
+
+    def iter_tracks(self):
+        """Generatore di (name, trajectory) nell'ordine di inserimento."""
+        for name in list(self.names):
+            yield name, self.track(name)
+
+    def iter_rows(self, chunk_rows, columns=None, start=0, stop=None):
+        """
+        Generatore di (riga iniziale, blocco) su tutta la matrice (o sulle righe
+        [start, stop)), chunk_rows righe alla volta senza badare ai confini dei
+        brani: per statistiche e modelli su tutto il corpus a memoria fissa.
+        columns: come in columns() (gruppo, nome o lista di nomi).
+        """
+        X = self.data
+        if columns is not None:
+            idx = self.column_index(columns)
+        stop = self.n_rows if stop is None else min(stop, self.n_rows)
+        for i in range(start, stop, chunk_rows):
+            block = X[i:min(i + chunk_rows, stop)]
+            yield i, (block if columns is None else block[:, idx])
+
+
+# --------------------
+# 2) Migrazione dal vecchio formato (un .npy per brano)
+# --------------------
+def import_npy_dir(traj_dir, root, params=None, suffix="_traj.npy"):
+    """
+    Importa trajectories_rich/<name>_traj.npy + feature_names.npy in uno store.
+    I brani già presenti vengono saltati.
+    """
+    traj_dir = Path(traj_dir)
+    feature_names = np.load(traj_dir / "feature_names.npy", allow_pickle=True).tolist()
+    store = TrajectoryStore(root, feature_names=feature_names, params=params)
+    for path in sorted(traj_dir.glob(f"*{suffix}")):
+        name = path.name[:-len(suffix)]
+        if name not in store:
+            store.append(name, np.load(path, mmap_mode="r"))
+    return store
+
+
+def _jsonable(params):
+    """Parametri normalizzati come dopo un giro in JSON (per i confronti)."""
+    return json.loads(json.dumps(params, sort_keys=True))
+
+
+def _write_json_atomic(path, obj):
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False)
+    os.replace(tmp, path)
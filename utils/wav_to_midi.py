@@ -1,7 +1,22 @@
+import argparse
+import multiprocessing as mp
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
 import numpy as np
 import librosa
 import pretty_midi
+from tqdm import tqdm
+
+if __package__ in (None, ""):
+    # lanciato come script (python utils/wav_to_midi.py): serve la radice del repo
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from utils.AudioLoading import load_audio, set_cache_limit  # noqa: E402
+from utils.Instrumentation import stage  # noqa: E402
+from utils.Manifest import is_up_to_date, load_manifest, params_hash, save_manifest  # noqa: E402
 
 
 def wav_to_midi(
@@ -13,66 +28,39 @@ def wav_to_midi(
     frame_length: int = 2048,
     min_note_length: float = 0.05,   # seconds
     velocity: int = 90,
+    chunk_frames: int = 4096,
+    verbose: bool = True,
 ):
     # 1. Load audio
-    y, sr = librosa.load(wav_path, sr=None, mono=True)
-
-    # 2. Estimate fundamental frequency over time (f0)
-    f0 = librosa.yin(
-        y,
-        fmin=librosa.note_to_hz(fmin),
-        fmax=librosa.note_to_hz(fmax),
-        sr=sr,
-        frame_length=frame_length,
-        hop_length=hop_length,
-    )
+    with stage("load", "wav_to_midi"):
+        y, sr = load_audio(wav_path, sr=None, mono=True)
+
+    # 2. Estimate fundamental frequency over time (f0), a blocchi di frame
+    with stage("pitch", "wav_to_midi"):
+        f0 = yin_chunked(
+            y,
+            fmin=librosa.note_to_hz(fmin),
+            fmax=librosa.note_to_hz(fmax),
+            sr=sr,
+            frame_length=frame_length,
+            hop_length=hop_length,
+            chunk_frames=chunk_frames,
+        )
+
+    with stage("notes", "wav_to_midi"):
+        # Times (in seconds) for each frame
+        times = librosa.times_like(f0, sr=sr, hop_length=hop_length)
+
+        # 3. Convert f0 (Hz) to MIDI notes, NaN where unvoiced
+        midi_f0 = librosa.hz_to_midi(f0)
+        # Round to nearest integer MIDI note
+        midi_f0_rounded = np.rint(midi_f0)
+
+        # Mark unvoiced frames as NaN explicitly
+        midi_f0_rounded[np.isnan(midi_f0)] = np.nan
 
-    # Times (in seconds) for each frame
-    times = librosa.times_like(f0, sr=sr, hop_length=hop_length)
-
-    # 3. Convert f0 (Hz) to MIDI notes, NaN where unvoiced
-    midi_f0 = librosa.hz_to_midi(f0)
-    # Round to nearest integer MIDI note
-    midi_f0_rounded = np.rint(midi_f0)
-
-    # Mark unvoiced frames as NaN explicitly
-    midi_f0_rounded[np.isnan(midi_f0)] = np.nan
-
-    # 4. Group consecutive frames with same MIDI note into note events
-    notes = []
-    current_note = None
-    start_time = None
-
-    for t, m in zip(times, midi_f0_rounded):
-        if np.isnan(m):  # unvoiced / silence
-            if current_note is not None:
-                # End current note
-                end_time = t
-                if end_time - start_time >= min_note_length:
-                    notes.append((int(current_note), float(start_time), float(end_time)))
-                current_note = None
-                start_time = None
-            continue
-
-        m = int(m)
-
-        if current_note is None:
-            # Start new note
-            current_note = m
-            start_time = t
-        elif m != current_note:
-            # Note change: close previous note, start new one
-            end_time = t
-            if end_time - start_time >= min_note_length:
-                notes.append((int(current_note), float(start_time), float(end_time)))
-            current_note = m
-            start_time = t
-
-    # Close the last open note if any
-    if current_note is not None and start_time is not None:
-        end_time = times[-1]
-        if end_time - start_time >= min_note_length:
-            notes.append((int(current_note), float(start_time), float(end_time)))
+        # 4. Group consecutive frames with same MIDI note into note events
+        notes = segment_notes(times, midi_f0_rounded, min_note_length)
 
     # 5. Build MIDI with pretty_midi
     pm = pretty_midi.PrettyMIDI()
@@ -90,16 +78,187 @@ def wav_to_midi(
     pm.instruments.append(instrument)
 
     # 6. Write MIDI file
-    pm.write(midi_path)
-    print(f"Saved MIDI to {midi_path}")
+    with stage("write", "wav_to_midi"):
+        pm.write(midi_path)
+    if verbose:
+        print(f"Saved MIDI to {midi_path}")
+    return midi_path
 
 
-if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: python wav_to_midi.py input.wav output.mid")
-        sys.exit(1)
+def yin_chunked(y, fmin, fmax, sr, frame_length=2048, hop_length=512, chunk_frames=4096):
+    """
+    librosa.yin(center=True) calcolato a blocchi di `chunk_frames` frame.
+
+    Ogni frame di YIN dipende solo dai suoi frame_length campioni, quindi il
+    risultato coincide con la chiamata sul brano intero, ma la matrice dei
+    frame (frame_length x T) non viene mai costruita tutta insieme.
+    """
+    pad = frame_length // 2
+    n = len(y)
+    T = 1 + n // hop_length
+    f0 = None
+    for t0 in range(0, T, chunk_frames):
+        t1 = min(T, t0 + chunk_frames)
+        # campioni [a, b) del segnale centrato (zeri fuori dal brano, come center=True)
+        a = t0 * hop_length - pad
+        b = (t1 - 1) * hop_length - pad + frame_length
+        seg = y[max(a, 0):min(b, n)]
+        if a < 0 or b > n:
+            seg = np.pad(seg, (max(0, -a), max(0, b - n)))
+        block = librosa.yin(seg, fmin=fmin, fmax=fmax, sr=sr, frame_length=frame_length,
+                            hop_length=hop_length, center=False)
+        if f0 is None:
+            f0 = np.empty(T, dtype=block.dtype)
+        f0[t0:t1] = block
+    return f0
+
+
+def segment_notes(times, midi, min_note_length=0.05):
+    """
+    Note (pitch, start, end) dai run di frame consecutivi con la stessa nota.
+
+    Run-length encoding vettoriale, con la stessa semantica del ciclo frame
+    per frame: una nota inizia al primo frame del run e finisce al frame
+    successivo all'ultimo (o all'ultimo frame del brano); i frame NaN
+    (unvoiced) chiudono la nota; si tengono solo le note lunghe almeno
+    min_note_length secondi.
+    """
+    n = len(midi)
+    if n == 0:
+        return []
+    voiced = ~np.isnan(midi)
+    codes = np.where(voiced, midi, -1.0)  # le note MIDI sono >= 0
+
+    change = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+    starts = np.concatenate(([0], change))
+    ends = np.concatenate((change, [n]))
+
+    start_t = times[starts]
+    end_t = times[np.minimum(ends, n - 1)]  # run finale: fine all'ultimo frame
+    keep = voiced[starts] & (end_t - start_t >= min_note_length)
+
+    pitches = codes[starts[keep]].astype(int)
+    return [(int(p), float(s), float(e))
+            for p, s, e in zip(pitches, start_t[keep], end_t[keep])]
+
 
-    wav_path = sys.argv[1]
-    midi_path = sys.argv[2]
+# --------------------
+# Batch: tutta una cartella su un pool di processi
+# --------------------
+def _init_midi_worker():
+    # ogni worker decodifica file diversi: la cache dei segnali non servirebbe
+    set_cache_limit(0)
 
-    wav_to_midi(wav_path, midi_path)
\ No newline at end of file
+
+def _midi_one(wav_path, midi_path, params):
+    return wav_to_midi(wav_path, midi_path, verbose=False, **params)
+
+
+def wav_to_midi_folder(
+    wav_dir,
+    midi_dir,
+    pattern="*.wav",
+    n_jobs=None,
+    manifest_path=None,
+    force=False,
+    **params,
+):
+    """
+    wav_to_midi su tutti i file di wav_dir, in parallelo e in modo ripristinabile
+    (stessa logica di clean_crate).
+
+    - n_jobs:   numero di processi (default: tutti i core)
+    - manifest: JSON in midi_dir (o manifest_path) con hash dei parametri e stato
+    - un file viene saltato se il .mid esiste, è più recente del WAV e il
+      manifest riporta gli stessi parametri (force=True rifà tutto)
+    - params: gli argomenti di wav_to_midi (fmin, fmax, hop_length, ...)
+
+    Ritorna un dict {"done": [...], "skipped": [...], "failed": {nome: errore}}.
+    """
+    wav_dir = Path(wav_dir)
+    midi_dir = Path(midi_dir)
+    midi_dir.mkdir(parents=True, exist_ok=True)
+    if manifest_path is None:
+        manifest_path = midi_dir / "midi_manifest.json"
+
+    n_jobs = n_jobs or os.cpu_count() or 1
+    params_key = params_hash(params)
+    manifest = load_manifest(manifest_path)
+
+    todo, skipped = [], []
+    for wav_path in sorted(wav_dir.glob(pattern)):
+        midi_path = midi_dir / f"{wav_path.stem}.mid"
+        entry = manifest.get(wav_path.name)
+        if not force and is_up_to_date(wav_path, midi_path, entry, params_key):
+            skipped.append(wav_path.name)
+        else:
+            todo.append((wav_path, midi_path))
+
+    done, failed = [], {}
+    if todo:
+        with ProcessPoolExecutor(
+            max_workers=min(n_jobs, len(todo)),
+            mp_context=mp.get_context(),
+            initializer=_init_midi_worker,
+        ) as pool:
+            futures = {
+                pool.submit(_midi_one, str(wav_path), str(midi_path), params): wav_path
+                for wav_path, midi_path in todo
+            }
+            for fut in tqdm(as_completed(futures), total=len(futures)):
+                wav_path = futures[fut]
+                try:
+                    fut.result()
+                    manifest[wav_path.name] = {"status": "ok", "params": params_key}
+                    done.append(wav_path.name)
+                except Exception as e:  # un file rotto non deve fermare il batch
+                    manifest[wav_path.name] = {
+                        "status": "failed",
+                        "params": params_key,
+                        "error": f"{type(e).__name__}: {e}",
+                    }
+                    failed[wav_path.name] = manifest[wav_path.name]["error"]
+                save_manifest(manifest, manifest_path)
+
+    return {"done": done, "skipped": skipped, "failed": failed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="WAV -> MIDI monofonico (YIN). Con una cartella in input converte "
+                    "tutti i file, saltando quelli già aggiornati."
+    )
+    parser.add_argument("input", help="file WAV oppure cartella")
+    parser.add_argument("output", help="file .mid oppure cartella di output")
+    parser.add_argument("--pattern", default="*.wav")
+    parser.add_argument("--jobs", type=int, default=None, help="processi (default: tutti i core)")
+    parser.add_argument("--force", action="store_true", help="riconverte anche i file aggiornati")
+    parser.add_argument("--fmin", default="C2")
+    parser.add_argument("--fmax", default="C7")
+    parser.add_argument("--hop-length", type=int, default=512)
+    parser.add_argument("--frame-length", type=int, default=2048)
+    parser.add_argument("--min-note-length", type=float, default=0.05)
+    parser.add_argument("--velocity", type=int, default=90)
+    args = parser.parse_args(argv)
+
+    params = dict(
+        fmin=args.fmin,
+        fmax=args.fmax,
+        hop_length=args.hop_length,
+        frame_length=args.frame_length,
+        min_note_length=args.min_note_length,
+        velocity=args.velocity,
+    )
+    if os.path.isdir(args.input):
+        result = wav_to_midi_folder(args.input, args.output, pattern=args.pattern,
+                                    n_jobs=args.jobs, force=args.force, **params)
+        print(f"{len(result['done'])} convertiti, {len(result['skipped'])} già aggiornati, "
+              f"{len(result['failed'])} falliti")
+        for name, err in result["failed"].items():
+            print(f"  {name}: {err}")
+    else:
+        wav_to_midi(args.input, args.output, **params)
+
+
+if __name__ == "__main__":
+    main()